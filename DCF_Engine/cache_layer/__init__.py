@@ -0,0 +1 @@
+from .cache_layer import Cached_Handler, LRU_Backend, Disk_Backend, handler_namespace, WRDS_TTLS, WRDS_STORE_TTLS, YFINANCE_TTLS, FMPSDK_TTLS, next_close
\ No newline at end of file
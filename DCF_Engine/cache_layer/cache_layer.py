@@ -0,0 +1,450 @@
+import pandas as pd
+import copy
+import functools
+import hashlib
+import inspect
+import os
+import pickle
+import shutil
+import threading
+import warnings
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Type, Union
+
+try:
+    from zoneinfo import ZoneInfo
+    market_timezone = ZoneInfo("America/New_York")
+except Exception:
+    # Without the time zone database, the close is approximated in fixed Eastern Standard Time
+    market_timezone = timezone(timedelta(hours = -5))
+
+# Directory of the on-disk cache
+cache_dir = os.getenv("DCF_CACHE_DIR", os.path.join(os.path.dirname(__file__), "../../cache"))
+
+
+def next_close(now: datetime)-> datetime:
+    """
+    Returns the next close of the US stock market (16:00 New York time on a weekday) after now"""
+    now_market: datetime = now.astimezone(market_timezone)
+    close: datetime = datetime.combine(now_market.date(), time(16, 0), tzinfo = market_timezone)
+
+    while close <= now_market or close.weekday() >= 5:
+        close = datetime.combine(close.date() + timedelta(days = 1), time(16, 0), tzinfo = market_timezone)
+
+    return close.astimezone(timezone.utc)
+
+
+# A ttl is either a duration or a function returning the expiry of an entry created at now
+TTL = Union[timedelta, Callable[[datetime], datetime]]
+
+# Time to live of the data types. Fundamentals are kept for a week, such that restatements are picked up
+FUNDAMENTALS_TTL: TTL = timedelta(days = 7)
+PROFILES_TTL: TTL = timedelta(days = 3)
+PRICES_TTL: TTL = next_close
+DAILY_TTL: TTL = timedelta(days = 1)
+
+
+def expires_at(ttl: TTL, now: datetime)-> datetime:
+    if isinstance(ttl, timedelta):
+        return now + ttl
+    return ttl(now)
+
+
+# Cached methods of the query handlers and the time to live of their data.
+# Methods already served from a local store of the handler (price store, info cache, profile cache, funda store) are not
+# cached again, such that the data is only kept (and refreshed) in one place
+
+# WRDS handlers with a local store of the fundamentals (store = Database_Query_Handler()) or offline on the funda mirror
+WRDS_STORE_TTLS: Dict[str, TTL] = {
+    "latest_fiscal_year":  DAILY_TTL,
+    "fiscal_windows":      DAILY_TTL,
+    "company_description": PROFILES_TTL,
+    "industry":            PROFILES_TTL,
+    "industry_codes":      PROFILES_TTL,
+    "credit_rating":       DAILY_TTL,
+}
+
+# WRDS handlers querying the statements remotely
+WRDS_TTLS: Dict[str, TTL] = {
+    "income_statement":     FUNDAMENTALS_TTL,
+    "balance_sheet":        FUNDAMENTALS_TTL,
+    "cash_flow_statement":  FUNDAMENTALS_TTL,
+    "financial_statements": FUNDAMENTALS_TTL,
+    **WRDS_STORE_TTLS,
+}
+
+# The prices, infos and market snapshots are served from the price store and info cache of the handler.
+# The betas, rates and returns derived from the prices are cached until the next close, such that a repeated DCF
+# of the same day neither downloads the prices of the day again nor recomputes them
+YFINANCE_TTLS: Dict[str, TTL] = {
+    "betas":                   PRICES_TTL,
+    "beta_quity":              PRICES_TTL,
+    "risk_free_rate":          PRICES_TTL,
+    "treasury_yield":          PRICES_TTL,
+    "snp500_return":           PRICES_TTL,
+    "high_low_52_weeks":       PRICES_TTL,
+    "historic_data":           PRICES_TTL,
+    "dividends":               DAILY_TTL,
+    "major_holder":            PROFILES_TTL,
+    "analyst_recommendations": DAILY_TTL,
+    "analyst_target":          DAILY_TTL,
+}
+
+# The profiles are served from the profile cache of the handler
+FMPSDK_TTLS: Dict[str, TTL] = {
+    "competitors":      PROFILES_TTL,
+    "screen_companies": DAILY_TTL,
+}
+
+
+# Warnings recorded by the cached calls running in every thread, see record_warnings
+_recorders = threading.local()
+_show_warning: Optional[Callable] = None
+_hook_lock = threading.Lock()
+
+
+def _install_warning_hook()-> None:
+    """
+    Wraps the function showing the warnings once for the process, such that the warnings shown in a thread are
+    also passed to the recorders of the thread. Unlike warnings.catch_warnings, the filters are never swapped,
+    such that recording in one thread does not change the warnings of the other threads"""
+    global _show_warning
+    with _hook_lock:
+        if _show_warning is not None:
+            return
+        # Called by warnings.warn (also from C) for every warning passing the filters, even within catch_warnings
+        _show_warning = warnings._showwarnmsg
+
+        def show_warning(message: warnings.WarningMessage)-> None:
+            for recorded in getattr(_recorders, "stack", []):
+                recorded.append((message.category, str(message.message)))
+            _show_warning(message)
+
+        warnings._showwarnmsg = show_warning
+
+
+@contextmanager
+def record_warnings()-> Iterator[List[Tuple[Type[Warning], str]]]:
+    """
+    Records the (category, message) of the warnings shown in the calling thread within the block.
+    The warnings are still shown as usual"""
+    _install_warning_hook()
+    if not hasattr(_recorders, "stack"):
+        _recorders.stack = []
+
+    recorded: List[Tuple[Type[Warning], str]] = []
+    _recorders.stack.append(recorded)
+    try:
+        yield recorded
+    finally:
+        _recorders.stack.remove(recorded)
+
+
+def handler_namespace(handler: Any)-> str:
+    """
+    Returns the name of the handler class and a hash of the configuration of the handler, such that differently configured
+    handlers (e.g. an offline and an online WRDS_Query_Handler) do not share their entries.\n
+    The configuration are the public attributes of simple types and the type and path (db_name or path) of the others"""
+    configuration: Dict[str, Any] = {}
+    for name, value in sorted(vars(handler).items()):
+        if name.startswith("_"):
+            continue
+        if value is None or isinstance(value, (bool, int, float, str)):
+            configuration[name] = value
+        else:
+            configuration[name] = (type(value).__name__, getattr(value, "db_name", None) or getattr(value, "path", None))
+
+    configuration_hash: str = hashlib.sha256(repr(normalise_key(configuration)).encode()).hexdigest()[:12]
+
+    return f"{type(handler).__name__}-{configuration_hash}"
+
+
+def normalise_key(value: Any)-> Any:
+    """
+    Normalises an argument of a cached call, such that equal requests get the same key.\n
+    Dates and times are reduced to the day, such that repeated calls of the same day share their entry"""
+    if isinstance(value, (datetime, pd.Timestamp)):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, (list, tuple)):
+        return tuple(normalise_key(item) for item in value)
+    if isinstance(value, (set, frozenset)):
+        return tuple(sorted(normalise_key(item) for item in value))
+    if isinstance(value, dict):
+        return tuple(sorted((str(key), normalise_key(item)) for key, item in value.items()))
+    if hasattr(value, "item") and callable(value.item):
+        # Numpy scalars
+        return value.item()
+    return value
+
+
+class LRU_Backend():
+    """
+    In memory cache backend, evicting the least recently used entries.\n
+    \n
+    args:\n
+    _______________________________\n
+    max_entries: int = 1024\n
+    _______________________________\n
+    Maximum number of entries.\n
+    """
+
+    def __init__(self, max_entries: int = 1024)-> None:
+        self.max_entries: int = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[datetime, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, method: str, key: str)-> Optional[Tuple[datetime, Any]]:
+        with self._lock:
+            entry = self._entries.get((method, key))
+            if entry is not None:
+                self._entries.move_to_end((method, key))
+        if entry is None:
+            return None
+        expiry, value = entry
+        if expiry <= datetime.now(timezone.utc):
+            self.delete(method, key)
+            return None
+        return (expiry, copy.deepcopy(value))
+
+    def set(self, method: str, key: str, expiry: datetime, value: Any)-> None:
+        with self._lock:
+            self._entries[(method, key)] = (expiry, copy.deepcopy(value))
+            self._entries.move_to_end((method, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last = False)
+
+    def delete(self, method: Optional[str] = None, key: Optional[str] = None)-> None:
+        with self._lock:
+            for entry_key in list(self._entries):
+                if (method is None or entry_key[0] == method) and (key is None or entry_key[1] == key):
+                    del self._entries[entry_key]
+
+    def sweep(self)-> int:
+        """
+        Removes the expired entries. Returns the number of removed entries"""
+        now: datetime = datetime.now(timezone.utc)
+        with self._lock:
+            expired = [entry_key for entry_key, (expiry, _) in self._entries.items() if expiry <= now]
+            for entry_key in expired:
+                del self._entries[entry_key]
+        return len(expired)
+
+
+class Disk_Backend():
+    """
+    On-disk cache backend, one pickle file per entry.\n
+    The entries survive restarts of the process. Every file holds the expiry and then the value as two pickles, such that
+    expired entries are found without loading their values. Expired entries are removed when read and by sweep.\n
+    \n
+    args:\n
+    _______________________________\n
+    path: str\n
+    _______________________________\n
+    Directory of the cache.\n
+    \n
+    sweep: bool = True\n
+    _______________________________\n
+    Removes the expired entries of earlier runs when created.\n
+    """
+
+    def __init__(self, path: str, sweep: bool = True)-> None:
+        self.path: str = path
+
+        if sweep:
+            self.sweep()
+
+    def _method_path(self, method: str)-> str:
+        return os.path.join(self.path, method.replace(os.sep, "_"))
+
+    def _entry_path(self, method: str, key: str)-> str:
+        return os.path.join(self._method_path(method), f"{hashlib.sha256(key.encode()).hexdigest()}.pkl")
+
+    @staticmethod
+    def _expiry(entry_path: str)-> Optional[datetime]:
+        """
+        Returns the expiry of the entry without loading its value, None if it can not be read"""
+        try:
+            with open(entry_path, "rb") as file:
+                return pickle.load(file)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            return None
+
+    def get(self, method: str, key: str)-> Optional[Tuple[datetime, Any]]:
+        entry_path: str = self._entry_path(method, key)
+        if not os.path.exists(entry_path):
+            return None
+        try:
+            with open(entry_path, "rb") as file:
+                expiry: datetime = pickle.load(file)
+                if not isinstance(expiry, datetime) or expiry <= datetime.now(timezone.utc):
+                    raise EOFError("Expired entry")
+                return (expiry, pickle.load(file))
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            # Expired and unreadable entries are removed
+            self._remove(entry_path)
+            return None
+
+    @staticmethod
+    def _remove(entry_path: str)-> None:
+        try:
+            os.remove(entry_path)
+        except OSError:
+            pass
+
+    def set(self, method: str, key: str, expiry: datetime, value: Any)-> None:
+        entry_path: str = self._entry_path(method, key)
+        os.makedirs(os.path.dirname(entry_path), exist_ok = True)
+
+        temporary_path: str = f"{entry_path}.{threading.get_ident()}.tmp"
+        with open(temporary_path, "wb") as file:
+            pickle.dump(expiry, file)
+            pickle.dump(value, file)
+        os.replace(temporary_path, entry_path)
+
+    def delete(self, method: Optional[str] = None, key: Optional[str] = None)-> None:
+        if method is None:
+            shutil.rmtree(self.path, ignore_errors = True)
+        elif key is None:
+            shutil.rmtree(self._method_path(method), ignore_errors = True)
+        else:
+            self._remove(self._entry_path(method, key))
+
+    def sweep(self)-> int:
+        """
+        Removes the expired and unreadable entries. Returns the number of removed entries"""
+        now: datetime = datetime.now(timezone.utc)
+        removed: int = 0
+        for directory, _, files in os.walk(self.path):
+            for file in files:
+                if not file.endswith(".pkl"):
+                    continue
+                entry_path: str = os.path.join(directory, file)
+                expiry: Optional[datetime] = self._expiry(entry_path)
+                if not isinstance(expiry, datetime) or expiry <= now:
+                    self._remove(entry_path)
+                    removed += 1
+        return removed
+
+
+class Cached_Handler():
+    """
+    Read-through cache in front of a query handler.\n
+    Calls of the methods with a ttl are served from the backend while their entry is valid. Otherwise the handler
+    is called and the result is stored. Exceptions are not cached. The warnings shown by a call are stored with its result
+    and warned again on every hit, such that a hit behaves like a miss. The warnings are recorded per thread (see record_warnings),
+    such that cached calls can run in several threads. All other attributes are passed to the handler.\n
+    Counts the hits and misses of every method, see stats.\n
+    \n
+    args:\n
+    _______________________________\n
+    handler: Any\n
+    _______________________________\n
+    Query handler to wrap, e.g. WRDS_Query_Handler().\n
+    \n
+    ttls: Dict[str, TTL]\n
+    _______________________________\n
+    Time to live of the cached methods, e.g. WRDS_TTLS. A ttl is a timedelta or a function returning the expiry.\n
+    \n
+    backend: LRU_Backend | Disk_Backend = None\n
+    _______________________________\n
+    Backend of the cache. In memory if None.\n
+    \n
+    namespace: str = None\n
+    _______________________________\n
+    Prefix of the cached methods in the backend, such that several handlers share one backend.
+    Defaults to the name of the handler class and a hash of its configuration, see handler_namespace.\n
+    """
+
+    def __init__(self, handler: Any, ttls: Dict[str, TTL], backend: Union[LRU_Backend, Disk_Backend] = None, namespace: str = None)-> None:
+        self.handler: Any = handler
+        self.ttls: Dict[str, TTL] = dict(ttls)
+        self.backend: Union[LRU_Backend, Disk_Backend] = backend if backend is not None else LRU_Backend()
+        self.namespace: str = namespace or handler_namespace(handler)
+
+        self.hits: Dict[str, int] = {}
+        self.misses: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def key(self, method: str, *args, **kwargs)-> str:
+        """
+        Returns the cache key of the call, with the arguments bound to their names and normalised"""
+        function: Callable = getattr(self.handler, method)
+        try:
+            bound = inspect.signature(function).bind(*args, **kwargs)
+            bound.apply_defaults()
+            arguments = bound.arguments
+        except (TypeError, ValueError):
+            arguments = {"args": args, "kwargs": kwargs}
+
+        return repr(normalise_key(arguments))
+
+    def _count(self, counter: Dict[str, int], method: str)-> None:
+        with self._lock:
+            counter[method] = counter.get(method, 0) + 1
+
+    def call(self, method: str, *args, **kwargs)-> Any:
+        """
+        Serves the call of the method from the cache or calls the handler and caches the result"""
+        key: str = self.key(method, *args, **kwargs)
+        backend_method: str = f"{self.namespace}.{method}"
+        now: datetime = datetime.now(timezone.utc)
+
+        entry = self.backend.get(backend_method, key)
+        if entry is not None and entry[0] > now:
+            self._count(self.hits, method)
+            value, recorded = entry[1]
+            self._warn(recorded)
+            return value
+
+        self._count(self.misses, method)
+        with record_warnings() as recorded:
+            value: Any = getattr(self.handler, method)(*args, **kwargs)
+
+        self.backend.set(backend_method, key, expires_at(self.ttls[method], now), (value, recorded))
+
+        return value
+
+    @staticmethod
+    def _warn(recorded: List[Tuple[Type[Warning], str]])-> None:
+        """
+        Warns the recorded warnings of a call, subject to the filters of the caller"""
+        for category, message in recorded:
+            warnings.warn(message, category, stacklevel = 4)
+
+    def __getattr__(self, name: str)-> Any:
+        # Only called for attributes not found on the cache itself
+        if name in ("handler", "ttls") or name not in self.ttls:
+            return getattr(self.handler, name)
+
+        @functools.wraps(getattr(self.handler, name))
+        def cached_method(*args, **kwargs)-> Any:
+            return self.call(name, *args, **kwargs)
+
+        return cached_method
+
+    def invalidate(self, method: str = None, *args, **kwargs)-> None:
+        """
+        Removes cached entries.\n
+        Without a method, all entries of the handler are removed. With a method and without arguments,
+        all entries of the method are removed. With arguments, only the entry of this call is removed"""
+        if method is None:
+            for cached_method in self.ttls:
+                self.backend.delete(f"{self.namespace}.{cached_method}")
+        elif not args and not kwargs:
+            self.backend.delete(f"{self.namespace}.{method}")
+        else:
+            self.backend.delete(f"{self.namespace}.{method}", self.key(method, *args, **kwargs))
+
+    def stats(self)-> pd.DataFrame:
+        """
+        Returns the hits, misses and hit rate of every cached method"""
+        methods = sorted(set(self.hits) | set(self.misses))
+        stats = pd.DataFrame({"hits":   [self.hits.get(method, 0) for method in methods],
+                              "misses": [self.misses.get(method, 0) for method in methods]},
+                             index = methods)
+        stats["hit_rate"] = stats["hits"] / (stats["hits"] + stats["misses"])
+        return stats
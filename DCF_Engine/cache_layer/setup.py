@@ -0,0 +1,18 @@
+from setuptools import setup, find_packages
+
+setup(
+    name="cache_layer",  # Replace with your module name
+    version="0.1.0",
+    packages=find_packages(),
+    install_requires=[
+        "pandas"
+    ],
+    description="A Python module caching the results of the query handlers",
+    author="Mats Walker",
+    author_email="matswalker2@gmail.com",
+    classifiers=[
+        "Programming Language :: Python :: 3",
+        "License :: OSI Approved :: MIT License",
+        "Operating System :: OS Independent",
+    ],
+)
\ No newline at end of file
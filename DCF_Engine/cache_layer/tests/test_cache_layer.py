@@ -0,0 +1,185 @@
+import sys
+import os
+
+# Add the DCF_Engine directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from cache_layer import Cached_Handler, LRU_Backend, Disk_Backend
+from datetime import datetime, timedelta, timezone
+from typing import List
+import shutil
+import tempfile
+import threading
+import unittest
+import warnings
+
+
+class Fake_Handler():
+    """
+    Query handler counting its calls. The count is private, such that it is not part of the configuration of the handler"""
+
+    def __init__(self, offline: bool = False)-> None:
+        self.offline: bool = offline
+        self._calls: int = 0
+
+    @property
+    def calls(self)-> int:
+        return self._calls
+
+    def statement(self, tickers: List[str], years: int = 5)-> List[str]:
+        self._calls += 1
+        if "MISSING" in tickers:
+            warnings.warn("No statement found for MISSING")
+        return [ticker.lower() for ticker in tickers]
+
+    def failing(self)-> None:
+        self._calls += 1
+        raise ConnectionError("No connection")
+
+    def uncached(self)-> int:
+        self._calls += 1
+        return self._calls
+
+
+class Test_Cached_Handler(unittest.TestCase):
+
+    def setUp(self):
+        self.ttls = {"statement": timedelta(days = 1), "failing": timedelta(days = 1)}
+        self.backend = LRU_Backend()
+        self.handler = Fake_Handler()
+        self.cached = Cached_Handler(self.handler, ttls = self.ttls, backend = self.backend)
+
+    def test_hit(self):
+        self.assertEqual(self.cached.statement(["AAPL"]), ["aapl"])
+        # Defaults, keywords and tuples share the entry of the first call
+        self.assertEqual(self.cached.statement(("AAPL",), years = 5), ["aapl"])
+        self.assertEqual(self.handler.calls, 1)
+
+        self.cached.statement(["AAPL"], years = 3)
+        self.assertEqual(self.handler.calls, 2)
+
+        stats = self.cached.stats()
+        self.assertEqual(stats.loc["statement", "hits"], 1)
+        self.assertEqual(stats.loc["statement", "misses"], 2)
+
+    def test_uncached_methods(self):
+        self.cached.uncached()
+        self.cached.uncached()
+        self.assertEqual(self.handler.calls, 2)
+
+    def test_exceptions_not_cached(self):
+        for _ in range(2):
+            with self.assertRaises(ConnectionError):
+                self.cached.failing()
+        self.assertEqual(self.handler.calls, 2)
+
+    def test_expiry(self):
+        cached = Cached_Handler(self.handler, ttls = {"statement": timedelta(seconds = -1)}, backend = self.backend)
+        cached.statement(["AAPL"])
+        cached.statement(["AAPL"])
+        self.assertEqual(self.handler.calls, 2)
+        self.assertEqual(self.backend.sweep(), 1)
+
+    def test_namespace(self):
+        # Differently configured handlers do not share their entries
+        offline = Cached_Handler(Fake_Handler(offline = True), ttls = self.ttls, backend = self.backend)
+        self.assertNotEqual(offline.namespace, self.cached.namespace)
+
+        self.cached.statement(["AAPL"])
+        offline.statement(["AAPL"])
+        self.assertEqual(offline.handler.calls, 1)
+
+        same = Cached_Handler(Fake_Handler(), ttls = self.ttls, backend = self.backend)
+        self.assertEqual(same.namespace, self.cached.namespace)
+
+    def test_warnings_replayed(self):
+        for _ in range(2):
+            with warnings.catch_warnings(record = True) as caught:
+                warnings.simplefilter("always")
+                self.assertEqual(self.cached.statement(["MISSING"]), ["missing"])
+            self.assertEqual([str(warning.message) for warning in caught], ["No statement found for MISSING"])
+        self.assertEqual(self.handler.calls, 1)
+
+    def test_warnings_per_thread(self):
+        # Warnings of concurrent calls are only recorded by the call of their own thread
+        barrier = threading.Barrier(2)
+
+        class Slow_Handler(Fake_Handler):
+            def statement(self, tickers: List[str], years: int = 5)-> List[str]:
+                barrier.wait()
+                warnings.warn(f"No statement found for {tickers[0]}")
+                barrier.wait()
+                return tickers
+
+        cached = Cached_Handler(Slow_Handler(), ttls = self.ttls, backend = self.backend)
+        with warnings.catch_warnings(record = True):
+            warnings.simplefilter("always")
+            threads = [threading.Thread(target = cached.statement, args = ([ticker],)) for ticker in ["AAA", "BBB"]]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        for ticker in ["AAA", "BBB"]:
+            _, recorded = self.backend.get(f"{cached.namespace}.statement", cached.key("statement", [ticker]))[1]
+            self.assertEqual([message for _, message in recorded], [f"No statement found for {ticker}"])
+
+    def test_invalidate(self):
+        self.cached.statement(["AAPL"])
+        self.cached.statement(["MSFT"])
+        self.cached.invalidate("statement", ["AAPL"])
+        self.cached.statement(["AAPL"])
+        self.cached.statement(["MSFT"])
+        self.assertEqual(self.handler.calls, 3)
+
+        self.cached.invalidate()
+        self.cached.statement(["MSFT"])
+        self.assertEqual(self.handler.calls, 4)
+
+
+class Test_Disk_Backend(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.backend = Disk_Backend(path = self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.path, ignore_errors = True)
+
+    def files(self)-> List[str]:
+        return [file for _, _, files in os.walk(self.path) for file in files]
+
+    def test_round_trip(self):
+        expiry = datetime.now(timezone.utc) + timedelta(days = 1)
+        self.backend.set("handler.statement", "key", expiry, {"AAPL": [1, 2]})
+        self.assertEqual(Disk_Backend(path = self.path).get("handler.statement", "key"), (expiry, {"AAPL": [1, 2]}))
+
+    def test_expired_read(self):
+        self.backend.set("handler.statement", "key", datetime.now(timezone.utc) - timedelta(seconds = 1), [1])
+        self.assertIsNone(self.backend.get("handler.statement", "key"))
+        self.assertEqual(self.files(), [])
+
+    def test_sweep(self):
+        now = datetime.now(timezone.utc)
+        self.backend.set("handler.statement", "expired", now - timedelta(seconds = 1), [1])
+        self.backend.set("handler.statement", "valid", now + timedelta(days = 1), [2])
+        self.assertEqual(len(self.files()), 2)
+
+        # Expired entries of earlier runs are removed on start
+        backend = Disk_Backend(path = self.path)
+        self.assertEqual(len(self.files()), 1)
+        self.assertEqual(backend.get("handler.statement", "valid")[1], [2])
+        self.assertEqual(backend.sweep(), 0)
+
+    def test_cached_handler(self):
+        handler = Fake_Handler()
+        cached = Cached_Handler(handler, ttls = {"statement": timedelta(days = 1)}, backend = self.backend)
+        cached.statement(["AAPL"])
+
+        restarted = Cached_Handler(handler, ttls = {"statement": timedelta(days = 1)}, backend = Disk_Backend(path = self.path))
+        self.assertEqual(restarted.statement(["AAPL"]), ["aapl"])
+        self.assertEqual(handler.calls, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
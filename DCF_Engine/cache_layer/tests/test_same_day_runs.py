@@ -0,0 +1,91 @@
+import sys
+import os
+import tempfile
+
+# Add the DCF_Engine directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+# The shared caches of the handler are created on import, such that they are kept out of the cache directory
+os.environ.setdefault("DCF_CACHE_DIR", tempfile.mkdtemp())
+
+from cache_layer import Cached_Handler, Disk_Backend, YFINANCE_TTLS
+from yfinance_query.yfinance_query import Yfinance_Query_Handler
+from yfinance_query.close_store import Close_Store
+from yfinance_query.price_store import Price_Store, trading_day
+from typing import List, Tuple
+import numpy as np
+import pandas as pd
+import unittest
+
+
+class Counting_Download():
+    """
+    Download with the interface of yf.download serving synthetic prices, recording its calls"""
+
+    def __init__(self)-> None:
+        self.calls: List[Tuple[Tuple[str, ...], str, str]] = []
+
+    def __call__(self, tickers: List[str], start: str, end: str)-> pd.DataFrame:
+        self.calls.append((tuple(tickers), start, end))
+
+        dates = pd.date_range(start, end, freq = trading_day, inclusive = "left")
+        columns = pd.MultiIndex.from_product([["Close", "Open"], tickers], names = ["Price", "Ticker"])
+        # Rising prices with noise, such that the betas and returns are defined
+        days = pd.Series(dates).map(lambda day: day.toordinal()).to_numpy(dtype = float)[:, None]
+        values = 4 + 0.01 * (days - 700_000) + np.sin(days * np.arange(1, len(columns) + 1))
+        return pd.DataFrame(values, index = dates, columns = columns)
+
+
+class Test_Same_Day_Runs(unittest.TestCase):
+    """
+    A repeated DCF of the same ticker on the same day does not download any prices"""
+
+    def setUp(self)-> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.download = Counting_Download()
+
+    def tearDown(self)-> None:
+        Yfinance_Query_Handler.treasury_curve = None
+        Yfinance_Query_Handler.close_store = None
+        self.directory.cleanup()
+
+    def handler(self)-> Yfinance_Query_Handler:
+        """
+        Returns the handler of a new run (process), sharing only the files of the previous runs"""
+        Yfinance_Query_Handler.treasury_curve = None
+        Yfinance_Query_Handler.close_store = Close_Store(path = os.path.join(self.directory.name, "closes"))
+
+        handler = Yfinance_Query_Handler()
+        handler.price_store = Price_Store(path = os.path.join(self.directory.name, "prices"))
+        handler.download_prices_daily = self.download
+        return handler
+
+    def run_dcf(self, handler)-> tuple:
+        return (handler.beta_quity(ticker = "AAA", time_frame_years = 3),
+                handler.risk_free_rate(),
+                handler.snp500_return(time_frame_years = 3),
+                handler.high_low_52_weeks(ticker = "AAA"))
+
+    def test_stores(self)-> None:
+        first = self.run_dcf(self.handler())
+        downloads: int = len(self.download.calls)
+        self.assertGreater(downloads, 0)
+
+        # The prices of the current day are served from the price store within its intraday ttl
+        self.assertEqual(self.run_dcf(self.handler()), first)
+        self.assertEqual(len(self.download.calls), downloads)
+
+    def test_cached_handler(self)-> None:
+        backend_path: str = os.path.join(self.directory.name, "handler_cache")
+
+        first = self.run_dcf(Cached_Handler(self.handler(), ttls = YFINANCE_TTLS, backend = Disk_Backend(path = backend_path)))
+        downloads: int = len(self.download.calls)
+
+        cached = Cached_Handler(self.handler(), ttls = YFINANCE_TTLS, backend = Disk_Backend(path = backend_path))
+        self.assertEqual(self.run_dcf(cached), first)
+        self.assertEqual(len(self.download.calls), downloads)
+        self.assertEqual(cached.stats()["misses"].sum(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
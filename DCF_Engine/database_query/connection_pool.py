@@ -0,0 +1,184 @@
+import os
+import queue
+import sqlite3
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+# Pragmas of every connection of the pool
+PRAGMAS: Dict[str, Any] = {
+    "journal_mode": "WAL",       # Readers are not blocked by the writer
+    "synchronous":  "NORMAL",    # Safe in WAL mode, only the last commits may be lost on a power loss
+    "busy_timeout": 30_000,      # Milliseconds to wait for a lock instead of failing
+    "cache_size":   -64_000,     # 64 MB of page cache per connection
+    "temp_store":   "MEMORY",
+    "mmap_size":    268_435_456, # 256 MB of memory mapped reads
+}
+
+
+class SQLite_Connection_Pool():
+    """
+    Thread-safe access to a SQLite database.\n
+    Every thread reads on its own connection, such that reads run in parallel. All writes are passed to a single writer
+    thread with its own connection, which runs them one after the other, such that concurrent writers never fail on a
+    locked database. All connections run in WAL mode with the PRAGMAS.\n
+    A write with commit = False opens a transaction owned by the calling thread, which stays open until its next write
+    with commit = True. Until then, the reads of this thread run on the writer connection, such that they see the
+    uncommitted writes, and the writes of other threads wait. A thread must therefore end its writes with a commit.\n
+    Use SQLite_Connection_Pool.shared to share one pool (and thus one writer) between all handlers of a database.\n
+    \n
+    args:\n
+    _______________________________\n
+    db: str\n
+    _______________________________\n
+    Path of the database. Must be a file, as every connection of an in-memory database opens a new database.\n
+    \n
+    pragmas: Dict[str, Any] = None\n
+    _______________________________\n
+    Pragmas replacing the defaults of PRAGMAS.\n
+    """
+
+    # Pools shared by all handlers of the same database
+    _shared: Dict[str, "SQLite_Connection_Pool"] = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, db: str, pragmas: Dict[str, Any] = None)-> None:
+        self.db: str = db
+        self.pragmas: Dict[str, Any] = {**PRAGMAS, **(pragmas or {})}
+
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+
+        self._writes: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        self._writer_connection: Optional[sqlite3.Connection] = None
+
+        # Thread owning the open transaction of the writer, None if no transaction is open
+        self._owner: Optional[int] = None
+
+    @classmethod
+    def shared(cls, db: str, pragmas: Dict[str, Any] = None)-> "SQLite_Connection_Pool":
+        """
+        Returns the pool of the database shared by all handlers, such that all writes go through one writer"""
+        with cls._shared_lock:
+            path: str = os.path.abspath(db)
+            if path not in cls._shared:
+                cls._shared[path] = cls(db = db, pragmas = pragmas)
+            return cls._shared[path]
+
+    def _connect(self)-> sqlite3.Connection:
+        conn = sqlite3.connect(self.db, timeout = self.pragmas["busy_timeout"] / 1000, check_same_thread = False)
+        for pragma, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {pragma} = {value}")
+
+        with self._lock:
+            self._connections.append(conn)
+
+        return conn
+
+    def connection(self)-> sqlite3.Connection:
+        """
+        Returns the connection of the calling thread, opened on first use.\n
+        The writer connection while the thread owns the open transaction, such that it reads its uncommitted writes"""
+        if self._owner == threading.get_ident() and self._writer_connection is not None:
+            # The writer is idle while the owner waits for it, such that the owner can use the connection
+            return self._writer_connection
+
+        conn: Optional[sqlite3.Connection] = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+        return conn
+
+    def _run_writer(self)-> None:
+        conn: sqlite3.Connection = self.connection()
+        self._writer_connection = conn
+
+        # Writes of other threads, waiting for the open transaction to be committed
+        deferred: Deque[tuple] = deque()
+        stopping: bool = False
+
+        while True:
+            if self._owner is None and deferred:
+                write = deferred.popleft()
+            elif stopping:
+                return
+            else:
+                write = self._writes.get()
+
+            if write is None:
+                # The open transaction is never committed, such that it is rolled back before the deferred writes run
+                if self._owner is not None:
+                    conn.rollback()
+                    self._owner = None
+                stopping = True
+                continue
+
+            function, future, commit, thread = write
+            if self._owner is not None and thread != self._owner:
+                deferred.append(write)
+                continue
+
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            try:
+                result: Any = function(conn)
+                if commit:
+                    conn.commit()
+                    self._owner = None
+                else:
+                    self._owner = thread
+            except BaseException as exception:
+                conn.rollback()
+                self._owner = None
+                future.set_exception(exception)
+            else:
+                future.set_result(result)
+
+    def _start_writer(self)-> None:
+        with self._lock:
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(target = self._run_writer, name = f"sqlite-writer-{os.path.basename(self.db)}", daemon = True)
+                self._writer.start()
+
+    def write(self, function: Callable[[sqlite3.Connection], Any], commit: bool = True)-> Any:
+        """
+        Runs function(connection) on the writer and returns its result. Blocks until the write ran.\n
+        With commit, the transaction (with the earlier uncommitted writes of the thread) is committed if function returns.
+        Without commit, the transaction stays open for the next writes of the thread.
+        The transaction is rolled back if function raises"""
+        # Writes issued by a write run directly in its transaction
+        if threading.current_thread() is self._writer:
+            return function(self.connection())
+
+        self._start_writer()
+
+        future: Future = Future()
+        self._writes.put((function, future, commit, threading.get_ident()))
+
+        return future.result()
+
+    def close(self)-> None:
+        """
+        Stops the writer after the queued writes and closes all connections"""
+        with self._lock:
+            writer: Optional[threading.Thread] = self._writer
+            self._writer = None
+
+        if writer is not None and writer.is_alive():
+            self._writes.put(None)
+            writer.join()
+
+        with self._lock:
+            connections: List[sqlite3.Connection] = self._connections
+            self._connections = []
+
+        for conn in connections:
+            conn.close()
+
+        self._local = threading.local()
+        self._writer_connection = None
+        self._owner = None
@@ -1,44 +1,461 @@
 import sqlite3
+import numpy as np
 import pandas as pd
+import os
+from datetime import datetime, timedelta
+from itertools import product
+from typing import Any, Dict, Iterable, Iterator, List, Literal, Sequence, Set, Tuple, Union
+
+from .connection_pool import SQLite_Connection_Pool
+
+# Directory of the local database of the handler
+cache_dir = os.getenv("DCF_CACHE_DIR", os.path.join(os.path.dirname(__file__), "../../cache"))
+
+# Key columns of the unformated statements, like the rows returned by WRDS
+KEY_NAMES: List[str] = ["year", "date", "ticker"]
+
+# Components of the peer multiples from the financial statements, for FY0 and FY-1
+FUNDAMENTAL_NAMES: List[str] = ["fiscal_year", "revenues_0", "revenues_1", "ebitda_0", "ebitda_1", "debt_0", "debt_1", "cash_0", "cash_1"]
+
+# Components of the peer multiples from the market
+MARKET_NAMES: List[str] = ["long_name", "share_price", "shares_outstanding"]
+
+# Names of the peer multiples as used in the DCF
+RATIO_NAMES: Dict[str, str] = {
+    "long_name":        "Long name",
+    "equity_value":     "Equity Value",
+    "enterprise_0":     "Enterprise FY0",
+    "ev_revenues_1":    "EV/Revenues FY-1",
+    "ev_revenues_0":    "EV/Revenues FY0",
+    "ev_ebitda_1":      "EV/EBITDA FY-1",
+    "ev_ebitda_0":      "EV/EBITDA FY0",
+}
 
 class Generalised_Database_Query_Handler():
+    """
+    Handler of a SQLite database, safe to use from several threads.\n
+    Reads run on the connection of the calling thread, such that they run in parallel. Writes are passed to the
+    single writer of the connection pool of the database, which is shared by all handlers of the database.\n
+    Writes with save = False run right away in a transaction of the calling thread, which is committed with its next
+    write with save = True. The reads of the thread see the uncommitted writes, the writes of other threads wait for the commit.\n
+    \n
+    args:\n
+    _______________________________\n
+    db: str\n
+    _______________________________\n
+    Path of the database.\n
+    """
 
     def __init__(self, db:str)->None:
         self.db_name = db
-        self.conn = sqlite3.connect(db)
-        self.cursor = self.conn.cursor()
-
-    def query(self, query:str)->pd.DataFrame:
-        """Handles a query in SQL on the databse"""
+        self.pool: SQLite_Connection_Pool = SQLite_Connection_Pool.shared(db)
 
-        self.cursor.execute(_sql = query)
+    @property
+    def conn(self)-> sqlite3.Connection:
+        """Connection of the calling thread"""
+        return self.pool.connection()
 
-        data = self.cursor.fetchall()
+    def _write(self, method: Literal["execute", "executemany"], query: str, params: Any, save: bool)-> int:
+        """
+        Runs the statement on the writer and, if save, commits it with the earlier unsaved statements of the thread.\n
+        Returns the number of rows modified by the statement"""
+        return self.pool.write(lambda conn: getattr(conn, method)(query, params).rowcount, commit = save)
 
+    @staticmethod
+    def _output(data: pd.DataFrame, output: Literal["pandas", "numpy"])-> Union[pd.DataFrame, np.recarray]:
+        if output == "numpy":
+            return data.to_records(index = False)
         return data
-    
-    def update_db(self, query: str, save:bool = True)->None:
-        """Function to update the structure of the database"""
 
-        self.cursor.execute(_sql = query)
+    def query(self, query: str, params: Union[Sequence[Any], Dict[str, Any]] = None, output: Literal["pandas", "numpy"] = "pandas",
+              chunksize: int = None, dtype: Dict[str, Any] = None)->Union[pd.DataFrame, np.recarray, Iterator[Union[pd.DataFrame, np.recarray]]]:
+        """
+        Handles a query in SQL on the databse.\n
+        Every query runs on its own cursor, such that several results can be read at the same time.\n
+        \n
+        args:\n
+        _______________________________\n
+        query: str\n
+        _______________________________\n
+        SQL query with ? (or :name) placeholders for the params.\n
+        \n
+        params: Sequence | Dict = None\n
+        _______________________________\n
+        Parameters of the placeholders.\n
+        \n
+        output: "pandas" | "numpy" = "pandas"\n
+        _______________________________\n
+        Returns a DataFrame or a NumPy record array with the columns of the query as field names.\n
+        \n
+        chunksize: int = None\n
+        _______________________________\n
+        If given, returns an iterator over chunks of chunksize rows instead of the full result.\n
+        \n
+        dtype: Dict[str, Any] = None\n
+        _______________________________\n
+        Types of the columns, e.g. {"value": "float64"}. Otherwise inferred from the values.\n
+        """
+        if output not in ("pandas", "numpy"):
+            raise ValueError(f"Unknown output {output} of the query. Use 'pandas' or 'numpy'")
+
+        data = pd.read_sql_query(query, self.conn, params = params, chunksize = chunksize, dtype = dtype)
 
-        if save:
-            self.conn.commit()
-        
-    def __del__(self)->None:
-        self.conn.close()
+        if chunksize is not None:
+            return (self._output(chunk, output) for chunk in data)
+
+        return self._output(data, output)
+
+    def execute_many(self, query: str, rows: Union[Iterable[Sequence[Any]], pd.DataFrame], save: bool = True)->int:
+        """
+        Executes the query once for every row of parameters, e.g. for bulk inserts.\n
+        rows can be a DataFrame, whose columns are passed in order.\n
+        Returns the number of modified rows"""
+        if isinstance(rows, pd.DataFrame):
+            rows = list(rows.itertuples(index = False, name = None))
+
+        return self._write("executemany", query, rows, save = save)
+
+    def update_db(self, query: str, save:bool = True, params: Union[Sequence[Any], Dict[str, Any]] = ())->None:
+        """Function to update the structure of the database"""
+
+        self._write("execute", query, params, save = save)
 
 
 class Database_Query_Handler(Generalised_Database_Query_Handler):
+    """
+    Local store of the fundamentals.\n
+    The financial statements are stored normalised, one row per (ticker, fiscal_year, statement, field).
+    The fiscal years table records the date of every stored (ticker, fiscal_year) and the missing statements table the
+    (ticker, fiscal_year) that were not found remotely, such that they are not requested again on every run.\n
+    The database runs in WAL mode, such that readers are not blocked by the writer.\n
+    \n
+    args:\n
+    _______________________________\n
+    db: str = None\n
+    _______________________________\n
+    Path of the database. Defaults to fundamentals.db in the cache directory.\n
+    \n
+    missing_max_age: timedelta = 7 days\n
+    _______________________________\n
+    Time after which a missing statement is requested remotely again, e.g. for a fiscal year that was not yet reported.\n
+    \n
+    market_max_age: timedelta = 1 day\n
+    _______________________________\n
+    Age after which the market parts (share price, shares outstanding) of the peer multiples are stale.\n
+    \n
+    fundamentals_max_age: timedelta = 7 days\n
+    _______________________________\n
+    Age after which the fundamental parts of the peer multiples are checked for a new fiscal year.\n
+    """
 
-    def __init__(self)->None:
-        db = "examp.db"    
+    def __init__(self, db: str = None, missing_max_age: timedelta = timedelta(days = 7),
+                 market_max_age: timedelta = timedelta(days = 1), fundamentals_max_age: timedelta = timedelta(days = 7))->None:
+        if db is None:
+            os.makedirs(cache_dir, exist_ok = True)
+            db = os.path.join(cache_dir, "fundamentals.db")
         super().__init__(db = db)
 
-    def get_balance_sheet(*args, **kwargs)->pd.DataFrame:
-        return None
-    
-    def get_ratios(*args, **kwargs)->pd.DataFrame:
-        return None
-    
-    
+        self.missing_max_age: timedelta = missing_max_age
+        self.market_max_age: timedelta = market_max_age
+        self.fundamentals_max_age: timedelta = fundamentals_max_age
+
+        self.create_schema()
+
+    def create_schema(self)-> None:
+        self.update_db("""
+        CREATE TABLE IF NOT EXISTS statements (
+            ticker      TEXT    NOT NULL,
+            fiscal_year INTEGER NOT NULL,
+            statement   TEXT    NOT NULL,
+            field       TEXT    NOT NULL,
+            value       REAL,
+            PRIMARY KEY (ticker, fiscal_year, statement, field)
+        ) WITHOUT ROWID
+        """, save = False)
+
+        self.update_db("""
+        CREATE TABLE IF NOT EXISTS fiscal_years (
+            ticker      TEXT    NOT NULL,
+            fiscal_year INTEGER NOT NULL,
+            datadate    TEXT,
+            PRIMARY KEY (ticker, fiscal_year)
+        ) WITHOUT ROWID
+        """, save = False)
+
+        self.update_db("""
+        CREATE TABLE IF NOT EXISTS missing_statements (
+            ticker      TEXT    NOT NULL,
+            fiscal_year INTEGER NOT NULL,
+            checked_at  TEXT    NOT NULL,
+            PRIMARY KEY (ticker, fiscal_year)
+        ) WITHOUT ROWID
+        """, save = False)
+
+        # Lookups of all tickers of a statement and field, e.g. for screening
+        self.update_db("""
+        CREATE INDEX IF NOT EXISTS statements_by_field ON statements (statement, field, fiscal_year)
+        """, save = False)
+
+        # Materialised multiples of the peers. The market and fundamental parts are refreshed separately
+        # and the multiples are recomputed from the stored parts on every refresh
+        self.update_db("""
+        CREATE TABLE IF NOT EXISTS peer_multiples (
+            ticker                  TEXT    NOT NULL PRIMARY KEY,
+            long_name               TEXT,
+            share_price             REAL,
+            shares_outstanding      REAL,
+            market_updated_at       TEXT,
+            fiscal_year             INTEGER,
+            revenues_0              REAL,
+            revenues_1              REAL,
+            ebitda_0                REAL,
+            ebitda_1                REAL,
+            debt_0                  REAL,
+            debt_1                  REAL,
+            cash_0                  REAL,
+            cash_1                  REAL,
+            fundamentals_updated_at TEXT,
+            equity_value            REAL,
+            enterprise_0            REAL,
+            enterprise_1            REAL,
+            ev_revenues_0           REAL,
+            ev_revenues_1           REAL,
+            ev_ebitda_0             REAL,
+            ev_ebitda_1             REAL
+        ) WITHOUT ROWID
+        """)
+
+    def write_statement(self, statement: str, data: pd.DataFrame)-> None:
+        """
+        Writes the unformated statement (rows with the columns year, date, ticker and the fields) to the store.\n
+        Stored values of the same keys are replaced"""
+        if data.empty:
+            return
+
+        fields: List[str] = [column for column in data.columns if column not in KEY_NAMES]
+
+        rows = data.melt(id_vars = ["ticker", "year"], value_vars = fields, var_name = "field", value_name = "value")
+        rows["value"] = pd.to_numeric(rows["value"], errors = "coerce")
+
+        statement_rows = [(str(ticker), int(year), statement, str(field), None if pd.isna(value) else float(value))
+                          for ticker, year, field, value in rows[["ticker", "year", "field", "value"]].itertuples(index = False)]
+
+        dates = data["date"] if "date" in data.columns else pd.Series(None, index = data.index)
+        fiscal_year_rows = [(str(ticker), int(year), None if pd.isna(datadate) else str(pd.Timestamp(datadate).date()))
+                            for ticker, year, datadate in zip(data["ticker"], data["year"], dates)]
+
+        self.execute_many("INSERT OR REPLACE INTO statements VALUES (?, ?, ?, ?, ?)", statement_rows, save = False)
+        self.execute_many("INSERT OR REPLACE INTO fiscal_years VALUES (?, ?, ?)", fiscal_year_rows, save = False)
+        self.execute_many("DELETE FROM missing_statements WHERE ticker = ? AND fiscal_year = ?", [row[:2] for row in fiscal_year_rows])
+
+    def read_statement(self, statement: str, tickers: List[str], years: List[int], fields: List[str])-> pd.DataFrame:
+        """
+        Reads the fields of the statement of the tickers and years from the store.\n
+        Returns the unformated statement (rows with the columns year, date, ticker and the fields).
+        Only the (ticker, year) with all fields stored are returned"""
+        tickers, years, fields = list(tickers), [int(year) for year in years], list(fields)
+        columns: List[str] = KEY_NAMES + fields
+
+        if not tickers or not years or not fields:
+            return pd.DataFrame(columns = columns)
+
+        query = f"""
+        SELECT
+            statements.ticker,
+            statements.fiscal_year,
+            fiscal_years.datadate,
+            statements.field,
+            statements.value
+        FROM statements
+        JOIN fiscal_years ON fiscal_years.ticker = statements.ticker AND fiscal_years.fiscal_year = statements.fiscal_year
+        WHERE statements.statement = ?
+        AND statements.ticker IN ({", ".join("?" * len(tickers))})
+        AND statements.fiscal_year IN ({", ".join("?" * len(years))})
+        AND statements.field IN ({", ".join("?" * len(fields))})
+        """
+
+        rows: pd.DataFrame = self.query(query, params = [statement] + tickers + years + fields, dtype = {"value": "float64"})
+
+        if rows.empty:
+            return pd.DataFrame(columns = columns)
+
+        # Only the (ticker, year) with all fields stored are served from the store
+        counts: pd.Series = rows.groupby(["ticker", "fiscal_year"])["field"].nunique()
+        complete: pd.MultiIndex = counts[counts == len(fields)].index
+        rows = rows[pd.MultiIndex.from_frame(rows[["ticker", "fiscal_year"]]).isin(complete)].copy()
+
+        if rows.empty:
+            return pd.DataFrame(columns = columns)
+
+        rows["datadate"] = rows["datadate"].fillna("")
+        data: pd.DataFrame = rows.pivot(index = ["ticker", "fiscal_year", "datadate"], columns = "field", values = "value").reset_index()
+        data = data.rename(columns = {"fiscal_year": "year", "datadate": "date"})
+        data["date"] = pd.to_datetime(data["date"].replace("", None)).dt.date
+
+        return data[columns].reset_index(drop = True)
+
+    def mark_missing(self, pairs: Iterable[Tuple[str, int]])-> None:
+        """
+        Records the (ticker, year) that were not found remotely"""
+        checked_at: str = datetime.now().isoformat(timespec = "seconds")
+        self.execute_many("INSERT OR REPLACE INTO missing_statements VALUES (?, ?, ?)",
+                          [(str(ticker), int(year), checked_at) for ticker, year in pairs])
+
+    def known_missing(self, tickers: List[str], years: List[int])-> Set[Tuple[str, int]]:
+        """
+        Returns the (ticker, year) that were recently not found remotely"""
+        tickers, years = list(tickers), [int(year) for year in years]
+        if not tickers or not years:
+            return set()
+
+        checked_after: str = (datetime.now() - self.missing_max_age).isoformat(timespec = "seconds")
+
+        query = f"""
+        SELECT ticker, fiscal_year
+        FROM missing_statements
+        WHERE ticker IN ({", ".join("?" * len(tickers))})
+        AND fiscal_year IN ({", ".join("?" * len(years))})
+        AND checked_at >= ?
+        """
+
+        missing: pd.DataFrame = self.query(query, params = tickers + years + [checked_after])
+
+        return {(ticker, int(year)) for ticker, year in zip(missing["ticker"], missing["fiscal_year"])}
+
+    def get_balance_sheet(self, tickers: List[str], years: List[int], fields: List[str] = None)->pd.DataFrame:
+        """
+        Returns the stored balance sheets of the tickers and years, formated like WRDS_Query_Handler.balance_sheet.\n
+        fields are the lower case names of the fields, all stored fields if None.\n
+        Returns None if not all (ticker, year) are stored"""
+        if isinstance(tickers, str): tickers = [tickers]
+        if isinstance(years, int): years = [years]
+
+        if fields is None:
+            fields = self.query("SELECT DISTINCT field FROM statements WHERE statement = 'balance_sheet'")["field"].tolist()
+
+        data: pd.DataFrame = self.read_statement("balance_sheet", tickers = tickers, years = years, fields = fields)
+
+        found = set(zip(data["ticker"], data["year"].astype(int)))
+        if not fields or any((ticker, int(year)) not in found for ticker, year in product(tickers, years)):
+            return None
+
+        return data.set_index(["ticker", "year"]).T
+
+    def _upsert_peer_multiples(self, data: pd.DataFrame, columns: List[str], updated_at_column: str)-> None:
+        """
+        Writes the columns of data (indexed by ticker) to the peer multiples and recomputes the multiples of the tickers"""
+        updated_at: str = datetime.now().isoformat(timespec = "seconds")
+        data = data.reindex(columns = columns)
+
+        rows = [(str(ticker), *[None if pd.isna(value) else (value if isinstance(value, str) else float(value)) for value in values], updated_at)
+                for ticker, values in zip(data.index, data.itertuples(index = False))]
+
+        names: List[str] = columns + [updated_at_column]
+        query = f"""
+        INSERT INTO peer_multiples (ticker, {", ".join(names)})
+        VALUES ({", ".join("?" * (len(names) + 1))})
+        ON CONFLICT (ticker) DO UPDATE SET {", ".join(f"{name} = excluded.{name}" for name in names)}
+        """
+        self.execute_many(query, rows, save = False)
+
+        # All expressions of an UPDATE read the values before the update, so the equity value is written out
+        equity_value = "share_price * shares_outstanding / 1000000.0"
+        self.execute_many(f"""
+        UPDATE peer_multiples SET
+            equity_value  = {equity_value},
+            enterprise_0  = {equity_value} + debt_0 - cash_0,
+            enterprise_1  = {equity_value} + debt_1 - cash_1,
+            ev_revenues_0 = ({equity_value} + debt_0 - cash_0) / revenues_0,
+            ev_revenues_1 = ({equity_value} + debt_1 - cash_1) / revenues_1,
+            ev_ebitda_0   = ({equity_value} + debt_0 - cash_0) / ebitda_0,
+            ev_ebitda_1   = ({equity_value} + debt_1 - cash_1) / ebitda_1
+        WHERE ticker = ?
+        """, [row[:1] for row in rows])
+
+    def refresh_market(self, market: pd.DataFrame)-> None:
+        """
+        Refreshes the market parts of the peer multiples.\n
+        market is indexed by ticker with the columns "Long name", "Share Price" and "Shares outstanding",
+        like Yfinance_Query_Handler.market_snapshot"""
+        market = market.rename(columns = {"Long name": "long_name", "Share Price": "share_price", "Shares outstanding": "shares_outstanding"})
+        self._upsert_peer_multiples(market, columns = MARKET_NAMES, updated_at_column = "market_updated_at")
+
+    def refresh_fundamentals(self, fundamentals: pd.DataFrame)-> None:
+        """
+        Refreshes the fundamental parts of the peer multiples.\n
+        fundamentals is indexed by ticker with the columns fiscal_year (FY0) and revenues, ebitda, debt and cash of
+        FY0 and FY-1 (e.g. revenues_0, revenues_1), in million USD.\n
+        Tickers without a fiscal year have no financial statements and are stored without fundamentals. Tickers with
+        a fiscal year but without any fundamental part are a failed fetch and are not stored, such that they stay stale
+        and are fetched again instead of being served as fresh missing multiples"""
+        fundamentals = fundamentals.reindex(columns = FUNDAMENTAL_NAMES)
+        failed: pd.Series = fundamentals["fiscal_year"].notna() & fundamentals[FUNDAMENTAL_NAMES[1:]].isna().all(axis = 1)
+
+        self._upsert_peer_multiples(fundamentals[~failed], columns = FUNDAMENTAL_NAMES, updated_at_column = "fundamentals_updated_at")
+
+    def _peer_multiples(self, tickers: List[str])-> pd.DataFrame:
+        query = f"""
+        SELECT *
+        FROM peer_multiples
+        WHERE ticker IN ({", ".join("?" * len(tickers))})
+        """
+        return self.query(query, params = tickers).set_index("ticker")
+
+    def stale_market(self, tickers: List[str])-> List[str]:
+        """
+        Returns the tickers without market parts updated within the market_max_age"""
+        tickers = list(dict.fromkeys(tickers))
+        if not tickers:
+            return []
+
+        updated_after: str = (datetime.now() - self.market_max_age).isoformat(timespec = "seconds")
+        multiples: pd.DataFrame = self._peer_multiples(tickers)
+
+        return [ticker for ticker in tickers if ticker not in multiples.index
+                or pd.isna(multiples.at[ticker, "market_updated_at"]) or multiples.at[ticker, "market_updated_at"] < updated_after]
+
+    def stale_fundamentals(self, fiscal_years: Dict[str, int])-> List[str]:
+        """
+        Returns the tickers of {ticker: fiscal year of FY0} whose stored fundamental parts are of another fiscal year
+        or older than the fundamentals_max_age, e.g. to pick up restated statements"""
+        tickers: List[str] = list(fiscal_years)
+        if not tickers:
+            return []
+
+        updated_after: str = (datetime.now() - self.fundamentals_max_age).isoformat(timespec = "seconds")
+        multiples: pd.DataFrame = self._peer_multiples(tickers)
+
+        return [ticker for ticker in tickers if ticker not in multiples.index
+                or pd.isna(multiples.at[ticker, "fiscal_year"]) or int(multiples.at[ticker, "fiscal_year"]) != int(fiscal_years[ticker])
+                or pd.isna(multiples.at[ticker, "fundamentals_updated_at"]) or multiples.at[ticker, "fundamentals_updated_at"] < updated_after]
+
+    def get_ratios(self, tickers: List[str], max_year: int = None)->pd.DataFrame:
+        """
+        Returns the multiples of the tickers from the materialised peer multiples, indexed by ticker with the columns
+        Long name, Equity Value, Enterprise FY0, EV/Revenues FY-1, EV/Revenues FY0, EV/EBITDA FY-1 and EV/EBITDA FY0.\n
+        max_year is the latest fiscal year the multiples may be based on, e.g. the latest year of the valued company.\n
+        Returns None if a ticker is not stored, its market parts are older than the market_max_age or its fundamental
+        parts are older than the fundamentals_max_age or of a year after max_year.
+        Tickers without financial statements are returned with missing multiples"""
+        if isinstance(tickers, str): tickers = [tickers]
+        tickers = list(dict.fromkeys(tickers))
+        if not tickers:
+            return None
+
+        market_after: str = (datetime.now() - self.market_max_age).isoformat(timespec = "seconds")
+        fundamentals_after: str = (datetime.now() - self.fundamentals_max_age).isoformat(timespec = "seconds")
+
+        query = f"""
+        SELECT ticker, {", ".join(RATIO_NAMES)}
+        FROM peer_multiples
+        WHERE ticker IN ({", ".join("?" * len(tickers))})
+        AND market_updated_at >= ?
+        AND fundamentals_updated_at >= ?
+        AND (fiscal_year IS NULL OR fiscal_year <= ?)
+        """
+        ratios: pd.DataFrame = self.query(query, params = tickers + [market_after, fundamentals_after, max_year if max_year is not None else 9999])
+
+        if len(ratios) < len(tickers):
+            return None
+
+        return ratios.set_index("ticker").reindex(tickers).rename(columns = RATIO_NAMES).rename_axis(None)
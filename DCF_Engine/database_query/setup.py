@@ -6,7 +6,8 @@ setup(
     packages=find_packages(),
     install_requires=[
         "sqlite3",
-        "pandas"
+        "pandas",
+        "numpy"
     ],
     description="A Python module for querying financial data from a database",
     author="Mats Walker",
@@ -0,0 +1,89 @@
+import sys
+import os
+
+# Add the DCF_Engine directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from database_query.database_query import Generalised_Database_Query_Handler
+from database_query.connection_pool import SQLite_Connection_Pool
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+
+class Test_SQLite_Connection_Pool(unittest.TestCase):
+    def setUp(self)-> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.query_ = Generalised_Database_Query_Handler(db = os.path.join(self.directory.name, "test.db"))
+        self.query_.update_db("CREATE TABLE prices (ticker TEXT, price REAL)")
+
+    def tearDown(self)-> None:
+        self.query_.pool.close()
+        self.directory.cleanup()
+
+    def count(self)-> int:
+        return int(self.query_.query("SELECT COUNT(*) AS n FROM prices")["n"][0])
+
+    def test_shared(self)-> None:
+        self.assertIs(SQLite_Connection_Pool.shared(self.query_.db_name), self.query_.pool)
+        self.assertEqual(self.query_.query("PRAGMA journal_mode")["journal_mode"][0], "wal")
+
+    def test_connection_per_thread(self)-> None:
+        connections: List[sqlite3.Connection] = []
+        thread = threading.Thread(target = lambda: connections.append(self.query_.conn))
+        thread.start()
+        thread.join()
+
+        self.assertIsNot(connections[0], self.query_.conn)
+        self.assertIs(self.query_.conn, self.query_.conn)
+
+    def test_concurrent_writes(self)-> None:
+        def insert(index: int)-> None:
+            self.query_.execute_many("INSERT INTO prices VALUES (?, ?)", [(f"T{index}", float(day)) for day in range(50)])
+            self.query_.query("SELECT COUNT(*) FROM prices")
+
+        with ThreadPoolExecutor(max_workers = 8) as executor:
+            list(executor.map(insert, range(16)))
+
+        self.assertEqual(self.count(), 16 * 50)
+
+    def test_unsaved_writes(self)-> None:
+        self.assertEqual(self.query_.execute_many("INSERT INTO prices VALUES (?, ?)", [("AAA", 1.0), ("BBB", 2.0)], save = False), 2)
+
+        # The writes of the thread are visible to its reads before they are saved
+        self.assertEqual(self.count(), 2)
+
+        # and not to the reads of other threads
+        counts: List[int] = []
+        thread = threading.Thread(target = lambda: counts.append(self.count()))
+        thread.start()
+        thread.join()
+        self.assertEqual(counts, [0])
+
+        # Writes of other threads wait for the commit
+        writer = threading.Thread(target = lambda: self.query_.update_db("INSERT INTO prices VALUES ('CCC', 3.0)"))
+        writer.start()
+        writer.join(timeout = 0.2)
+        self.assertTrue(writer.is_alive())
+
+        self.query_.update_db("INSERT INTO prices VALUES ('DDD', 4.0)")
+        writer.join(timeout = 5)
+        self.assertFalse(writer.is_alive())
+        self.assertEqual(self.count(), 4)
+
+    def test_rollback(self)-> None:
+        self.query_.update_db("INSERT INTO prices VALUES ('AAA', 1.0)", save = False)
+        with self.assertRaises(sqlite3.OperationalError):
+            self.query_.update_db("INSERT INTO missing_table VALUES (1)")
+
+        # The failed write rolls back the open transaction of the thread
+        self.assertEqual(self.count(), 0)
+        self.query_.update_db("INSERT INTO prices VALUES ('BBB', 2.0)")
+        self.assertEqual(self.count(), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
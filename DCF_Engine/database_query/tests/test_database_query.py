@@ -0,0 +1,116 @@
+import sys
+import os
+
+# Add the DCF_Engine directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from database_query import Database_Query_Handler
+from datetime import datetime, timedelta
+import pandas as pd
+import tempfile
+import unittest
+
+
+class Test_Peer_Multiples(unittest.TestCase):
+    def setUp(self)-> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.query_ = Database_Query_Handler(db = os.path.join(self.directory.name, "fundamentals.db"))
+
+        self.query_.refresh_fundamentals(pd.DataFrame({"fiscal_year": [2024], "revenues_0": [200.0], "revenues_1": [100.0],
+                                                       "ebitda_0": [50.0], "ebitda_1": [40.0], "debt_0": [30.0], "debt_1": [20.0],
+                                                       "cash_0": [10.0], "cash_1": [5.0]}, index = ["AAA"]))
+        self.query_.refresh_market(pd.DataFrame({"Long name": ["AAA Inc."], "Share Price": [10.0], "Shares outstanding": [20_000_000]}, index = ["AAA"]))
+
+    def tearDown(self)-> None:
+        self.query_.pool.close()
+        self.directory.cleanup()
+
+    def age(self, column: str, days: int)-> None:
+        updated_at: str = (datetime.now() - timedelta(days = days)).isoformat(timespec = "seconds")
+        self.query_.update_db(f"UPDATE peer_multiples SET {column} = ?", params = [updated_at])
+
+    def test_ratios(self)-> None:
+        ratios: pd.DataFrame = self.query_.get_ratios(tickers = ["AAA"], max_year = 2024)
+
+        self.assertEqual(ratios.at["AAA", "Long name"], "AAA Inc.")
+        self.assertAlmostEqual(ratios.at["AAA", "Equity Value"], 200.0)
+        self.assertAlmostEqual(ratios.at["AAA", "Enterprise FY0"], 220.0)
+        self.assertAlmostEqual(ratios.at["AAA", "EV/Revenues FY0"], 1.1)
+        self.assertAlmostEqual(ratios.at["AAA", "EV/EBITDA FY-1"], 215.0 / 40.0)
+
+        self.assertIsNone(self.query_.get_ratios(tickers = ["AAA", "BBB"]))
+        self.assertIsNone(self.query_.get_ratios(tickers = ["AAA"], max_year = 2023))
+
+    def test_stale_market(self)-> None:
+        self.assertEqual(self.query_.stale_market(tickers = ["AAA", "BBB"]), ["BBB"])
+
+        self.age("market_updated_at", days = 2)
+
+        self.assertEqual(self.query_.stale_market(tickers = ["AAA"]), ["AAA"])
+        self.assertIsNone(self.query_.get_ratios(tickers = ["AAA"]))
+
+    def test_stale_fundamentals(self)-> None:
+        self.assertEqual(self.query_.stale_fundamentals(fiscal_years = {"AAA": 2024}), [])
+        self.assertEqual(self.query_.stale_fundamentals(fiscal_years = {"AAA": 2025}), ["AAA"])
+
+        # Fundamentals of the same fiscal year are refreshed once they are older than the fundamentals_max_age
+        self.age("fundamentals_updated_at", days = 8)
+
+        self.assertIsNone(self.query_.get_ratios(tickers = ["AAA"]))
+        self.assertEqual(self.query_.stale_fundamentals(fiscal_years = {"AAA": 2024}), ["AAA"])
+
+    def test_failed_fetch(self)-> None:
+        # Statements of a known fiscal year that did not come back are not stored as fresh fundamentals
+        self.query_.refresh_fundamentals(pd.DataFrame({"fiscal_year": [2024, None]}, index = ["BBB", "CCC"]))
+
+        self.assertEqual(self.query_.stale_fundamentals(fiscal_years = {"BBB": 2024}), ["BBB"])
+
+        # Tickers without financial statements are stored without fundamentals
+        self.assertEqual(self.query_.query("SELECT ticker FROM peer_multiples WHERE fiscal_year IS NULL")["ticker"].tolist(), ["CCC"])
+
+        # A failed fetch does not overwrite the stored fundamentals
+        self.query_.refresh_fundamentals(pd.DataFrame({"fiscal_year": [2024]}, index = ["AAA"]))
+        self.assertAlmostEqual(self.query_.get_ratios(tickers = ["AAA"], max_year = 2024).at["AAA", "EV/Revenues FY0"], 1.1)
+
+
+
+class Test_Statements(unittest.TestCase):
+    def setUp(self)-> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.query_ = Database_Query_Handler(db = os.path.join(self.directory.name, "fundamentals.db"))
+
+    def tearDown(self)-> None:
+        self.query_.pool.close()
+        self.directory.cleanup()
+
+    def test_round_trip(self)-> None:
+        data = pd.DataFrame({"year": [2023, 2022], "date": ["2023-12-31", "2022-12-31"], "ticker": ["AAA", "AAA"],
+                             "revenues": [200.0, 100.0], "cogs": [80.0, None]})
+        self.query_.write_statement("income_statement", data)
+
+        stored: pd.DataFrame = self.query_.read_statement("income_statement", tickers = ["AAA"], years = [2022, 2023], fields = ["revenues", "cogs"])
+        stored = stored.sort_values("year", ascending = False).reset_index(drop = True)
+
+        self.assertEqual(list(stored.columns), ["year", "date", "ticker", "revenues", "cogs"])
+        self.assertEqual(stored["year"].tolist(), [2023, 2022])
+        self.assertEqual(stored["revenues"].tolist(), [200.0, 100.0])
+        self.assertTrue(pd.isna(stored.at[1, "cogs"]))
+        self.assertEqual(str(stored.at[0, "date"]), "2023-12-31")
+
+    def test_incomplete(self)-> None:
+        data = pd.DataFrame({"year": [2023], "date": ["2023-12-31"], "ticker": ["AAA"], "revenues": [200.0]})
+        self.query_.write_statement("income_statement", data)
+
+        # Only the (ticker, year) with all requested fields are served from the store
+        self.assertTrue(self.query_.read_statement("income_statement", tickers = ["AAA"], years = [2023], fields = ["revenues", "cogs"]).empty)
+
+    def test_missing(self)-> None:
+        self.query_.mark_missing([("AAA", 2023)])
+        self.assertEqual(self.query_.known_missing(tickers = ["AAA"], years = [2022, 2023]), {("AAA", 2023)})
+
+        self.query_.write_statement("income_statement", pd.DataFrame({"year": [2023], "date": ["2023-12-31"], "ticker": ["AAA"], "revenues": [1.0]}))
+        self.assertEqual(self.query_.known_missing(tickers = ["AAA"], years = [2022, 2023]), set())
+
+
+if __name__ == "__main__":
+    unittest.main()
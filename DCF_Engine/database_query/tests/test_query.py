@@ -0,0 +1,68 @@
+import sys
+import os
+
+# Add the DCF_Engine directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from database_query.database_query import Generalised_Database_Query_Handler
+from typing import List
+import numpy as np
+import pandas as pd
+import tempfile
+import unittest
+
+
+class Test_Query(unittest.TestCase):
+    def setUp(self)-> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.query_ = Generalised_Database_Query_Handler(db = os.path.join(self.directory.name, "test.db"))
+        self.query_.update_db("CREATE TABLE prices (ticker TEXT, day INTEGER, price REAL)")
+
+        self.rows = pd.DataFrame({"ticker": ["AAA"] * 5 + ["BBB"] * 5, "day": list(range(5)) * 2, "price": [float(value) for value in range(10)]})
+        self.modified: int = self.query_.execute_many("INSERT INTO prices VALUES (?, ?, ?)", self.rows)
+
+    def tearDown(self)-> None:
+        self.query_.pool.close()
+        self.directory.cleanup()
+
+    def test_execute_many(self)-> None:
+        self.assertEqual(self.modified, 10)
+        self.assertEqual(self.query_.execute_many("UPDATE prices SET price = ? WHERE ticker = ?", [(1.0, "AAA")]), 5)
+
+    def test_pandas(self)-> None:
+        prices: pd.DataFrame = self.query_.query("SELECT * FROM prices WHERE ticker = ? ORDER BY day", params = ["BBB"])
+
+        self.assertEqual(list(prices.columns), ["ticker", "day", "price"])
+        self.assertEqual(prices["price"].tolist(), [5.0, 6.0, 7.0, 8.0, 9.0])
+
+        named: pd.DataFrame = self.query_.query("SELECT COUNT(*) AS n FROM prices WHERE ticker = :ticker", params = {"ticker": "AAA"})
+        self.assertEqual(named["n"][0], 5)
+
+    def test_numpy(self)-> None:
+        prices: np.recarray = self.query_.query("SELECT day, price FROM prices ORDER BY ticker, day", output = "numpy")
+
+        self.assertIsInstance(prices, np.recarray)
+        self.assertEqual(prices.dtype.names, ("day", "price"))
+        self.assertEqual(prices.price.sum(), 45.0)
+
+        with self.assertRaises(ValueError):
+            self.query_.query("SELECT * FROM prices", output = "list")
+
+    def test_chunks(self)-> None:
+        chunks: List[pd.DataFrame] = list(self.query_.query("SELECT * FROM prices ORDER BY ticker, day", chunksize = 4))
+
+        self.assertEqual([len(chunk) for chunk in chunks], [4, 4, 2])
+        pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index = True), self.rows)
+
+        records: List[np.recarray] = list(self.query_.query("SELECT price FROM prices", output = "numpy", chunksize = 6))
+        self.assertEqual([len(chunk) for chunk in records], [6, 4])
+
+    def test_dtype(self)-> None:
+        prices: pd.DataFrame = self.query_.query("SELECT day, price FROM prices", dtype = {"day": "float64", "price": "float32"})
+
+        self.assertEqual(prices["day"].dtype, np.float64)
+        self.assertEqual(prices["price"].dtype, np.float32)
+
+
+if __name__ == "__main__":
+    unittest.main()
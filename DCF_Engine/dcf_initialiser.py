@@ -2,13 +2,14 @@ from fmpsdk_query import FMPSDK_Query_Handler
 from yfinance_query import Yfinance_Query_Handler
 from wrds_query import WRDS_Query_Handler
 from database_query import Database_Query_Handler
+from cache_layer import Cached_Handler, Disk_Backend, WRDS_STORE_TTLS, YFINANCE_TTLS, FMPSDK_TTLS
 from Excel_Engine import open_excel, Excel_write
 #from gpt_query import LLM_Query_Handler
 
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
 
-from typing import List, Tuple, Optional, Any, Union
+from typing import List, Tuple, Optional, Any, Union, Dict
 import pandas as pd
 import warnings
 import os
@@ -17,6 +18,9 @@ import os
 class FinancialStatementsNotFoundError(Exception):
     pass
 
+# Results of the query handlers are cached on disk, such that repeated runs do not query the APIs again
+handler_cache = Disk_Backend(path = os.path.join(os.getenv("DCF_CACHE_DIR", os.path.join(os.path.dirname(__file__), "../cache")), "handler_cache"))
+
 # Global definition of the historic years that is visible to all functions
 historic_years: List[int] = []
 
@@ -47,10 +51,11 @@ def get_competitor_info(ticker: str)-> Optional[pd.DataFrame]:
 
     assert(isinstance(ticker, str)), f"The ticker given to the function get_competitor_info was not of type str, but of type {type(ticker)}.\n"
 
-    fmpsdk_query_handler   = FMPSDK_Query_Handler()
-    yfinance_query_handler = Yfinance_Query_Handler()
-    wrds_query_handler     = WRDS_Query_Handler()
+    fmpsdk_query_handler   = Cached_Handler(FMPSDK_Query_Handler(), ttls = FMPSDK_TTLS, backend = handler_cache)
+    yfinance_query_handler = Cached_Handler(Yfinance_Query_Handler(), ttls = YFINANCE_TTLS, backend = handler_cache)
     database_query_handler = Database_Query_Handler()
+    # Statements of earlier runs are read from the local store, new ones are written through to it
+    wrds_query_handler     = Cached_Handler(WRDS_Query_Handler(store = database_query_handler), ttls = WRDS_STORE_TTLS, backend = handler_cache)
 
     # Often problems with fmpsdk. Manually input tickers.
     if len(competitors) == 0:
@@ -65,74 +70,87 @@ def get_competitor_info(ticker: str)-> Optional[pd.DataFrame]:
         else:
             competitors = competitors_found
 
-    if database_query_handler.get_ratios(tickers = competitors) is None:
-
-        # Get the latest year found of the main ticker
-        latest_year: int = historic_years[0]
-
-        years: List[int] = [latest_year, latest_year-1, latest_year-2]
-
-        balance_sheets: pd.DataFrame = wrds_query_handler.balance_sheet(tickers = competitors, years = years)
-        income_statements: pd.DataFrame = wrds_query_handler.income_statement(tickers = competitors, years = years)
-
-        today = datetime.now()
-
-        latest_share_prices: pd.DataFrame = yfinance_query_handler.ticker_prices_daily(tickers = competitors, 
-                                                                         end = today,
-                                                                         start = today - relativedelta(days = 3))["Close"].iloc[0]
-        
-        shares_outstanding: pd.DataFrame  = yfinance_query_handler.number_shares_outstanding(tickers = competitors)
-
-
-        # Create a new dataframe to hold the information
-        df = pd.DataFrame(index = competitors)
-
-        # Add the data for the latest share prices
-        df["Share Price"]        = latest_share_prices
-        df["Shares outstanding"] = shares_outstanding
-
-        # Market value of equities
-        df["Equity Value"] = df["Share Price"] * df["Shares outstanding"] / 1_000_000 # In million USD
-
-        # Get the necessary information from wrds
-        latest_revenue, second_latest_revenues      = get_latest_second_latest(income_statements, "revenues")
-        latest_cash, second_latest_cash             = get_latest_second_latest(balance_sheets, "cashandequivalents")
-        latest_total_debt, second_latest_total_debt = [current_debt + non_current_debt for current_debt, non_current_debt in
-                                                        zip(get_latest_second_latest(balance_sheets, "currentdebt"),  
-                                                              get_latest_second_latest(balance_sheets, "longtermdebt"))]
+    # Get the latest year found of the main ticker
+    latest_year: int = historic_years[0]
 
-        latest_ebitda, second_latest_ebitda         = [ebit + dna for ebit, dna in
-                                                        zip(get_latest_second_latest(income_statements, "ebit"),
-                                                            get_latest_second_latest(income_statements, "depreciationandamortisation"))]
+    # Peer multiples of earlier runs are read from the local store while they are fresh
+    ratios: Optional[pd.DataFrame] = database_query_handler.get_ratios(tickers = competitors, max_year = latest_year)
+    if ratios is not None:
+        return ratios
 
-        # Assign the revenues
-        df["Revenues FY0"]  = latest_revenue
-        df["Revenues FY-1"] = second_latest_revenues
-    
-        # Assign the EBITDA
-        df["EBITDA FY0"]  = latest_ebitda
-        df["EBITDA FY-1"] = second_latest_ebitda
+    # Every competitor uses its own latest three fiscal years, capped at the latest year of the main ticker
+    windows: Dict[str, List[int]] = wrds_query_handler.fiscal_windows(tickers = competitors, number_years = 3, max_year = latest_year)
 
-        # Calculate and assign the enterprise value
-        df ["Enterprise FY0"]  = df["Equity Value"] + latest_total_debt - latest_cash
-        df ["Enterprise FY-1"] = df["Equity Value"] + second_latest_total_debt - second_latest_cash
+    # The fundamental parts are only refreshed for competitors with a new fiscal year (or none stored yet)
+    stale_fundamentals: List[str] = database_query_handler.stale_fundamentals(fiscal_years = {competitor: window[0] for competitor, window in windows.items()})
+    stale_fundamentals += [competitor for competitor in competitors if competitor not in windows]
 
-        # Calculate and assign the EV/revenues
-        df["EV/Revenues FY0"]  = df["Enterprise FY0"] / df["Revenues FY0"]
-        df["EV/Revenues FY-1"] = df["Enterprise FY-1"] / df["Revenues FY-1"]
+    # Competitors whose statements could not be fetched (e.g. a failed WRDS query) are left out of this valuation
+    # and are not stored, such that they are fetched again on the next run
+    failed: List[str] = []
 
-        # Calculate and assign the EV/EBITDA
-        df["EV/EBITDA FY0"]  = df["Enterprise FY0"] / df["EBITDA FY0"]
-        df["EV/EBITDA FY-1"] = df["Enterprise FY-1"] / df["EBITDA FY-1"]
+    if stale_fundamentals:
+        # Competitors without financial statements are stored without fundamentals
+        fundamentals = pd.DataFrame(index = stale_fundamentals)
+        fundamentals["fiscal_year"] = pd.Series({competitor: windows[competitor][0] for competitor in stale_fundamentals if competitor in windows}, dtype = float)
 
-        df["Long name"] = [yfinance_query_handler.company_name(ticker = ticker) for ticker in df.index]
+        stale_windows: Dict[str, List[int]] = {competitor: windows[competitor] for competitor in stale_fundamentals if competitor in windows}
 
-        # Format the dataframe such that it matches the needed format
-        df_formated = df[["Long name", "Equity Value", "Enterprise FY0", 
-                        "EV/Revenues FY-1", "EV/Revenues FY0",
-                        "EV/EBITDA FY-1", "EV/EBITDA FY0"]]
+        # Only query the fields needed for the multiples
+        fields = {
+            "balance_sheet":    ["CashAndEquivalents", "CurrentDebt", "LongTermDebt"],
+            "income_statement": ["Revenues", "EBIT", "DepreciationAndAmortisation"],
+        }
 
-        return df_formated
+        if stale_windows:
+            balance_sheets, income_statements, _ = wrds_query_handler.financial_statements(windows = stale_windows, fields = fields)
+        else:
+            balance_sheets, income_statements = pd.DataFrame(), pd.DataFrame()
+
+        fetched: set = set()
+        if not balance_sheets.empty and not income_statements.empty:
+            fetched = set(balance_sheets.columns.get_level_values("ticker")) & set(income_statements.columns.get_level_values("ticker"))
+
+        failed = [competitor for competitor in stale_windows if competitor not in fetched]
+        if failed:
+            warnings.warn(f"The financial statements of the competitors {failed} could not be fetched. They are left out of the multiples.", UserWarning)
+            fundamentals = fundamentals.drop(index = failed)
+
+        if fetched:
+            # Get the necessary information from wrds
+            latest_revenue, second_latest_revenues      = get_latest_second_latest(income_statements, "revenues")
+            latest_cash, second_latest_cash             = get_latest_second_latest(balance_sheets, "cashandequivalents")
+            latest_total_debt, second_latest_total_debt = [current_debt + non_current_debt for current_debt, non_current_debt in
+                                                            zip(get_latest_second_latest(balance_sheets, "currentdebt"),
+                                                                  get_latest_second_latest(balance_sheets, "longtermdebt"))]
+
+            latest_ebitda, second_latest_ebitda         = [ebit + dna for ebit, dna in
+                                                            zip(get_latest_second_latest(income_statements, "ebit"),
+                                                                get_latest_second_latest(income_statements, "depreciationandamortisation"))]
+
+            fundamentals["revenues_0"] = latest_revenue
+            fundamentals["revenues_1"] = second_latest_revenues
+            fundamentals["ebitda_0"]   = latest_ebitda
+            fundamentals["ebitda_1"]   = second_latest_ebitda
+            fundamentals["debt_0"]     = latest_total_debt
+            fundamentals["debt_1"]     = second_latest_total_debt
+            fundamentals["cash_0"]     = latest_cash
+            fundamentals["cash_1"]     = second_latest_cash
+
+        if not fundamentals.empty:
+            database_query_handler.refresh_fundamentals(fundamentals = fundamentals)
+
+    available: List[str] = [competitor for competitor in competitors if competitor not in failed]
+    if not available:
+        return None
+
+    # The market parts (share price, shares outstanding, name) are only refreshed once they are stale
+    stale_market: List[str] = database_query_handler.stale_market(tickers = available)
+    if stale_market:
+        database_query_handler.refresh_market(market = yfinance_query_handler.market_snapshot(tickers = stale_market))
+
+    # Equity value, enterprise value, EV/Revenues and EV/EBITDA are materialised in the store
+    return database_query_handler.get_ratios(tickers = available, max_year = latest_year)
 
 def get_list_years(number_years: int)-> List[int]:
     """
@@ -166,51 +184,51 @@ def get_latest_financial_statements(historic_years_number: int, ticker: str)->Tu
     assert(isinstance(historic_years_number, int)), f"The historic_years_number provided to get_latest_financial_statements is not of type int, but of type {type(historic_years_number)}.\n"
     assert(isinstance(ticker, str)),                f"The ticker provided to get_latest_financial_statements is not of type str, but of type {type(ticker)}.\n"
 
-    def get_financial_statements(ticker:str, years: List[int])->Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
-        """
-        Returns: (balance_sheet, income_statement, cashflow_statement)
-        """
+    wrds = Cached_Handler(WRDS_Query_Handler(store = Database_Query_Handler()), ttls = WRDS_STORE_TTLS, backend = handler_cache)
 
-        wrds = WRDS_Query_Handler()
+    # Discover the latest available fiscal year first, such that the statements are only fetched once
+    latest_years: Dict[str, int] = wrds.latest_fiscal_year(ticker = ticker)
 
-        # Catch warnings as errors
-        with warnings.catch_warnings() as w:
-            
-            warnings.simplefilter("always")  # Catch Warnings
+    if ticker not in latest_years:
+        print(f"No financial Data could be found for company {ticker}")
+        return (None, None, None, -1)
 
-            balance_sheet: pd.DataFrame = wrds.balance_sheet(ticker = ticker, years = years)
-            income_statement: pd.DataFrame = wrds.income_statement(ticker = ticker, years = years)
-            cashflow_statement: pd.DataFrame = wrds.cash_flow_statement(ticker = ticker, years = years)
+    latest_year: int = latest_years[ticker]
+
+    def missing_years(statements: Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame], years: List[int])-> List[int]:
+        """
+        Returns the years not found in every statement"""
+        found: List[set] = [set() if statement.empty else {int(year) for (statement_ticker, year) in statement.columns if statement_ticker == ticker}
+                            for statement in statements]
+        return [year for year in years if not all(year in statement_years for statement_years in found)]
 
-            if w:
-                for warning_ in w:
-                    print(warning_.message)
-                raise FinancialStatementsNotFoundError
-            else:
-                return (balance_sheet, income_statement, cashflow_statement)
-    
     global historic_years
-    historic_years = get_list_years(historic_years_number)
-    latest_year: int = historic_years[0]
+    historic_years = [latest_year - i for i in range(historic_years_number)]
 
-    try:
-        balance_sheet, income_statement, cash_flow_statement = get_financial_statements(ticker = ticker, years = historic_years)
-    
+    # All three statements are fetched in a single query
+    statements: Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame] = wrds.financial_statements(ticker = ticker, years = historic_years)
+
+    if statements[0].empty:
+        print(f"No financial Data could be found for company {ticker}")
+        return (None, None, None, -1)
+
+    if missing_years(statements, historic_years):
+        # The statements of the latest year might only be partly released. Fall back to last year
+        latest_year -= 1
+        historic_years = [latest_year - i for i in range(historic_years_number)]
+        statements = wrds.financial_statements(ticker = ticker, years = historic_years)
+
+        missing: List[int] = missing_years(statements, historic_years)
+        if missing:
+            # If the statements are still incomplete, there is a problem with the data of the ticker
+            raise FinancialStatementsNotFoundError(f"The financial statements of {ticker} are incomplete for the years {missing}.\n")
 
-    except Exception as _:
-        # Exception raised if not yet released financial statements
-        # Fall back to last year
-        # If the error is persistent, then there is a problem with the query. In this case None is returned
-        historic_years = get_list_years(historic_years_number + 1)[1::]
-        latest_year -= 1 # Decrement the latest year
-        try:
-            balance_sheet, income_statement, cash_flow_statement = get_financial_statements(ticker = ticker, years = historic_years)
-            warnings.warn(f"\nThe financial statements for {ticker} in year {datetime.now().year} are not available. Fall back on year {historic_years[0]}.\nThe financial statements might not yet be released.\n\n", 
+    if latest_year < datetime.now().year:
+        # The financial statements of the current year might not yet be released
+        warnings.warn(f"\nThe financial statements for {ticker} in year {datetime.now().year} are not available. Fall back on year {latest_year}.\nThe financial statements might not yet be released.\n\n", 
                       UserWarning)
-        except Exception as _:
-            print(f"No financial Data could be found for company {ticker}")
-            return (None, None, None, -1)
 
+    balance_sheet, income_statement, cash_flow_statement = statements
 
     return (balance_sheet, income_statement, cash_flow_statement, latest_year)
 
@@ -269,7 +287,7 @@ def prepare_and_save_excel(ticker: str, historic_years_number: int,forecast_year
     name_file_final: str    = f"DCFs_folder/DCF_{ticker}_{start_year}.xls"
 
 
-    yf_query_handler = Yfinance_Query_Handler()
+    yf_query_handler = Cached_Handler(Yfinance_Query_Handler(), ttls = YFINANCE_TTLS, backend = handler_cache)
 
     beta_equity: float      = yf_query_handler.beta_quity(ticker=ticker, time_frame_years=historic_years_number)
     risk_free_return: float = yf_query_handler.risk_free_rate()
@@ -279,7 +297,7 @@ def prepare_and_save_excel(ticker: str, historic_years_number: int,forecast_year
     name: str               = yf_query_handler.company_name(ticker = ticker)
 
 
-    fmpsdk_query_handler = FMPSDK_Query_Handler()
+    fmpsdk_query_handler = Cached_Handler(FMPSDK_Query_Handler(), ttls = FMPSDK_TTLS, backend = handler_cache)
 
     shares_outstanding: int = fmpsdk_query_handler.number_shares(ticker = ticker)
 
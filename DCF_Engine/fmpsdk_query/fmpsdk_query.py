@@ -1,5 +1,7 @@
 import fmpsdk
-from typing import Any, List, Union, Callable
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Union, Callable
 from functools import wraps
 
 # Load the necessary functions to load the API keys from .env file
@@ -10,40 +12,136 @@ from dotenv import load_dotenv
 dotenv_path = os.path.join(os.path.dirname(__file__), "../../keys.env")
 load_dotenv(dotenv_path=dotenv_path)
 
+# Support running the module as a script
+try:
+    from .profile_cache import Profile_Cache
+    from .key_pool import API_Key_Pool, is_error_response, is_key_error_response
+    from .peer_index import Peer_Index, normalise_industry
+except ImportError:
+    from profile_cache import Profile_Cache
+    from key_pool import API_Key_Pool, is_error_response, is_key_error_response
+    from peer_index import Peer_Index, normalise_industry
+
+# Directory of the local caches of the handler
+cache_dir = os.getenv("DCF_CACHE_DIR", os.path.join(os.path.dirname(__file__), "../../cache"))
+
 class FMPSDK_Query_Handler():
     """
     Query handler for queries on FMPSDK.\n
     The resulting instance is a handler with necessary methods to query the API.\n
     As a result, the handler should be a monoid (even though not enforced).\n
     Note that there is only a limited number of calls due to limited API keys.\n
+    The requests are spread over all API keys by a shared key pool, which keeps track of the quota of every key.\n
+    All accessors of the company profile are served from one cached request per ticker.\n
     """
 
+    # Cache of the company profiles shared by all handlers
+    profile_cache = Profile_Cache(path = os.path.join(cache_dir, "fmp_profiles.json"))
+
+    # Local industry and market cap index shared by all handlers, loaded on first use
+    peer_index: Peer_Index = None
+
+    # Maximum number of symbols of one request of company_profiles
+    PROFILE_BATCH_SIZE: int = 50
+
+    # Fields of the company profiles which are always columns of company_profiles, also if no profile was found
+    PROFILE_COLUMNS: List[str] = ["symbol", "companyName", "industry", "mktCap", "price", "lastDiv", "volAvg", "currency"]
+
     def __init__(self)-> None:
         # get the API_KEYS from the .env file
-        self.API_Keys = os.getenv("FMPSDK_API_KEYS").split(",") 
-        if not self.API_Keys or self.API_Keys == [""]:
+        self.API_Keys = [key.strip() for key in os.getenv("FMPSDK_API_KEYS", "").split(",") if key.strip()]
+        if not self.API_Keys:
             raise ValueError("No API keys found in environment variables")
-        
-        key_ptr = 0
-        self.API_KEY:str = self.API_Keys[key_ptr]
+
+        # Quota and rate limit of the free FMP plan, can be set for other plans
+        self.key_pool: API_Key_Pool = API_Key_Pool.shared(keys = self.API_Keys,
+                                                          daily_quota = int(os.getenv("FMPSDK_DAILY_QUOTA", 250)),
+                                                          requests_per_minute = int(os.getenv("FMPSDK_REQUESTS_PER_MINUTE", 300)),
+                                                          path = os.path.join(cache_dir, "fmp_key_usage.json"))
+
+    def _request(self, function: Callable[..., Any], **kwargs)-> Any:
+        """
+        Calls the fmpsdk function with a key of the key pool.\n
+        If the limit of the key is reached, the key is excluded for the day and the request is repeated with another key.
+        Raises a ValueError if all keys are used"""
+        while True:
+            key: str = self.key_pool.acquire()
+            data: Any = function(apikey = key, **kwargs)
+
+            if not is_key_error_response(data):
+                return data
+
+            self.key_pool.mark_exhausted(key)
+
+    def _fetch_profile(self, ticker: str)-> Optional[dict]:
+        """
+        Requests the company profile of the ticker from FMP.\n
+        Returns an empty profile for unknown tickers and None if the request failed"""
+        profiles = self._request(fmpsdk.company_profile, symbol=ticker)
+
+        # Failed requests return a dictionary with the error message instead of a list
+        if not isinstance(profiles, list):
+            return None
+
+        return profiles[0] if profiles else {}
+
+    def _profile(self, ticker: str)-> dict:
+        """
+        Returns the company profile of the ticker from the shared profile cache"""
+        return self.profile_cache.get(ticker, fetch = self._fetch_profile)
+
+    def load_peer_index(self)-> Peer_Index:
+        """
+        Returns the peer index shared by all handlers, loaded from the cache on first use"""
+        if FMPSDK_Query_Handler.peer_index is None:
+            FMPSDK_Query_Handler.peer_index = Peer_Index(path = os.path.join(cache_dir, "peer_index.csv"))
+        return FMPSDK_Query_Handler.peer_index
+
+    def screen_companies(self, limit: int = 100_000)-> pd.DataFrame:
+        """
+        Returns the ticker, industry and market_cap of all companies of the FMP stock screener in one request"""
+        screened = self._request(fmpsdk.stock_screener, limit = limit)
+
+        if is_error_response(screened) or not screened:
+            raise ValueError(f"The FMP stock screener returned no companies: {screened}")
+
+        companies = pd.DataFrame(screened)
+        if "isEtf" in companies.columns:
+            companies = companies[~companies["isEtf"].fillna(False).astype(bool)]
+
+        return companies.rename(columns = {"symbol": "ticker", "marketCap": "market_cap"})[["ticker", "industry", "market_cap"]]
+
+    def refresh_peer_index(self, tickers: List[str] = None, companies: pd.DataFrame = None, industry_codes: pd.DataFrame = None)-> int:
+        """
+        Refreshes the local peer index in bulk.\n
+        The companies are taken from the stock screener, or from the batched company profiles if tickers are given
+        (an empty list indexes no companies).
+        industry_codes optionally adds the SIC and NAICS codes with the columns ticker, sic and naics (see WRDS_Query_Handler.industry_codes).\n
+        Returns the number of indexed companies"""
+        if companies is None:
+            if tickers is not None:
+                profiles: pd.DataFrame = self.company_profiles(tickers = tickers)
+                companies = profiles.rename_axis("ticker").reset_index().rename(columns = {"mktCap": "market_cap"})[["ticker", "industry", "market_cap"]]
+            else:
+                companies = self.screen_companies()
+
+        if industry_codes is not None and not industry_codes.empty:
+            companies = companies.merge(industry_codes[["ticker", "sic", "naics"]].drop_duplicates(subset = "ticker"), on = "ticker", how = "left")
+
+        peer_index: Peer_Index = self.load_peer_index()
+        peer_index.refresh(companies)
+
+        return len(peer_index.index)
 
     @staticmethod
     def api_error_wrapper(func: Callable[..., Any]) -> Callable[..., Any]:
         @wraps(func)
         def wrapped_function(self, *args, **kwargs) -> Any:
+            # The keys are already rotated by the key pool, remaining errors are raised
             data: Any = func(self, *args, **kwargs)
-            try:
-                if "error" in data:
-                    if self.key_ptr < len(self.API_Keys) - 1:
-                        self.key_ptr += 1
-                        self.API_KEY = self.API_Keys[self.key_ptr]
-                        return func(self, *args, **kwargs)
-                    else:
-                        raise ValueError("Used all API Keys")
-                else:
-                    return data
-            except TypeError:
-                return data
+            if is_error_response(data):
+                raise ValueError(f"FMP returned an error: {data}")
+            return data
 
         return wrapped_function
 
@@ -79,11 +177,20 @@ class FMPSDK_Query_Handler():
         _______________________________\n
         List of competitors'tickers of the given ticker.\n
         """
+        # Screen the fresh local peer index without any request
+        peer_index: Peer_Index = self.load_peer_index()
+        if peer_index.is_fresh:
+            entry = peer_index.entry(ticker)
+            if not entry or not entry.get("industry"):
+                return peer_index.competitors(ticker = ticker, lower_multiple = lower_multiple, upper_multiple = upper_multiple,
+                                              group = self.industry(ticker = ticker), market_cap = self.market_cap(ticker = ticker))
+            return peer_index.competitors(ticker = ticker, lower_multiple = lower_multiple, upper_multiple = upper_multiple)
+
         industry = self.industry(ticker = ticker)
 
         market_cap = self.market_cap(ticker = ticker)
 
-        competitors_ =  fmpsdk.stock_screener(apikey = self.API_KEY,
+        competitors_ =  self._request(fmpsdk.stock_screener,
                                           market_cap_lower_than = upper_multiple * market_cap,
                                           market_cap_more_than = lower_multiple * market_cap,
                                           industry=industry)
@@ -114,7 +221,7 @@ class FMPSDK_Query_Handler():
         _______________________________\n
         Price of the given ticker.\n
         """
-        return float(fmpsdk.company_profile(apikey=self.API_KEY, symbol=ticker)[0]["price"])
+        return float(self._profile(ticker)["price"])
 
     @api_error_wrapper
     def last_divident(self, ticker:str) -> float:
@@ -133,7 +240,7 @@ class FMPSDK_Query_Handler():
         _______________________________\n
         Last divident of the given ticker.\n
         """
-        return float(fmpsdk.company_profile(apikey=self.API_KEY, symbol=ticker)[0]["lastDiv"])
+        return float(self._profile(ticker)["lastDiv"])
 
     @api_error_wrapper
     def average_volume(self, ticker:str) -> int:
@@ -151,7 +258,7 @@ class FMPSDK_Query_Handler():
         int\n
         _______________________________\n
         Average volume of the given ticker.\n"""
-        return int(fmpsdk.company_profile(apikey=self.API_KEY, symbol=ticker)[0]["volAvg"])
+        return int(self._profile(ticker)["volAvg"])
 
     @api_error_wrapper
     def market_cap(self, ticker:str) -> int:
@@ -170,7 +277,7 @@ class FMPSDK_Query_Handler():
         _______________________________\n
         Market cap of the given ticker.\n
         """
-        return int(fmpsdk.company_profile(apikey=self.API_KEY, symbol= ticker)[0]["mktCap"])
+        return int(self._profile(ticker)["mktCap"])
 
     @api_error_wrapper
     def number_shares(self, ticker:str) -> int:
@@ -189,9 +296,8 @@ class FMPSDK_Query_Handler():
         _______________________________\n
         Number of shares outstanding of the given ticker.\n
         """
-        market_cap = self.market_cap(ticker = ticker)
-        price = self.price(ticker = ticker)
-        return int(market_cap/price)
+        profile = self._profile(ticker)
+        return int(int(profile["mktCap"])/float(profile["price"]))
 
     @api_error_wrapper
     def company_profile(self, ticker:str) -> dict:
@@ -211,7 +317,52 @@ class FMPSDK_Query_Handler():
         Company profile of the given ticker from FMPSDK.\n
         This dictionary includes various information about the company.\n
         """
-        return fmpsdk.company_profile(apikey=self.API_KEY, symbol=ticker)[0]
+        return self._profile(ticker)
+
+    def company_profiles(self, tickers: List[str])-> pd.DataFrame:
+        """
+        Function to return the company profiles of many tickers at once.\n
+        The profile endpoint accepts comma-separated symbols, such that the tickers missing in the profile cache
+        are requested in batches of PROFILE_BATCH_SIZE symbols. The fetched profiles fill the profile cache.\n
+        \n
+        Args:\n
+        tickers: List[str] \n
+        _______________________________\n
+        Tickers of the companies of which the company profiles are searched for.\n
+        \n
+        Returns:\n
+        pd.DataFrame\n
+        _______________________________\n
+        Company profiles with the tickers as index and the fields of the profiles (at least PROFILE_COLUMNS) as columns.\n
+        Tickers without a profile are left out.\n
+        """
+        tickers = list(dict.fromkeys(tickers))
+        missing: List[str] = self.profile_cache.missing(tickers)
+
+        batches: List[List[str]] = [missing[index:index + self.PROFILE_BATCH_SIZE] for index in range(0, len(missing), self.PROFILE_BATCH_SIZE)]
+
+        # The batches are requested concurrently, spread over the keys of the key pool
+        with ThreadPoolExecutor(max_workers = max(min(self.key_pool.size, len(batches)), 1)) as executor:
+            responses = list(executor.map(lambda batch: self._request(fmpsdk.company_profile, symbol=",".join(batch)), batches))
+
+        for batch, profiles in zip(batches, responses):
+            # Failed requests return a dictionary with the error message instead of a list and are not cached
+            if not isinstance(profiles, list):
+                continue
+
+            fetched: Dict[str, dict] = {profile["symbol"]: profile for profile in profiles if "symbol" in profile}
+
+            # Unknown tickers are cached with an empty profile, such that they are not requested again
+            self.profile_cache.put({ticker: fetched.get(ticker, {}) for ticker in batch})
+
+        profiles: Dict[str, dict] = {ticker: self.profile_cache.fresh(ticker) for ticker in tickers}
+
+        data = pd.DataFrame.from_dict({ticker: profile for ticker, profile in profiles.items() if profile}, orient = "index")
+        for column in self.PROFILE_COLUMNS:
+            if column not in data.columns:
+                data[column] = None
+
+        return data
 
     @api_error_wrapper
     def industry(self, ticker:str) -> Union[str, None]:
@@ -231,13 +382,8 @@ class FMPSDK_Query_Handler():
         Industry of the given ticker.\n
         """
         try:
-            raw_industry = fmpsdk.company_profile(apikey=self.API_KEY, symbol=ticker)[0]["industry"]
-            industry = str(raw_industry).replace(" -", "")
-            match industry:
-                case "Airlines, Airports & Air Services":
-                    return "Airports & Air Services"
-                case _:
-                    return industry
+            raw_industry = self._profile(ticker)["industry"]
+            return normalise_industry(raw_industry)
         except (KeyError, IndexError):
             return None
 
@@ -258,7 +404,7 @@ class FMPSDK_Query_Handler():
         Returns None if the currency is not found.\n
         """
         try:
-            return str(fmpsdk.company_profile(apikey=self.API_KEY, symbol= ticker)[0]["currency"])
+            return str(self._profile(ticker)["currency"])
         except (KeyError,IndexError):
             return None
 
@@ -329,7 +475,7 @@ class FMPSDK_Query_Handler():
         _______________________________\n
         Website of the company of the given ticker as a string.\n
         """
-        return self.competitors(ticker = ticker)['website']
+        return self.company_profile(ticker = ticker)['website']
     
 
 def main()-> None:
@@ -0,0 +1,208 @@
+import atexit
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
+
+
+def is_error_response(data: Any)-> bool:
+    """
+    FMP returns a dictionary with an error message instead of the data if a request failed"""
+    return isinstance(data, dict) and ("Error Message" in data or "error" in data)
+
+
+def is_key_error_response(data: Any)-> bool:
+    """
+    Returns True if the request failed because of the key (limit reached or invalid key)"""
+    if not is_error_response(data):
+        return False
+    message: str = str(data.get("Error Message", data.get("error", ""))).lower()
+    return "limit" in message or "api key" in message or "apikey" in message
+
+
+class API_Key_Pool():
+    """
+    Scheduler of the FMP API keys.\n
+    Every key has a token bucket for its rate limit and a daily quota. Requests are spread over all keys with
+    tokens left, preferring the key with the most remaining quota, such that concurrent requests use the combined
+    throughput of all keys. Keys that reach their limit are excluded for the rest of the day.\n
+    The usage of the day is persisted, such that the quota is also respected across runs. The keys themselves are
+    not written to the file, only a hash of them. The usage is written outside of the lock at most every save_interval,
+    when a key is exhausted and at exit.\n
+    \n
+    args:\n
+    _______________________________\n
+    keys: List[str]\n
+    _______________________________\n
+    API keys of the pool.\n
+    \n
+    daily_quota: int = 250\n
+    _______________________________\n
+    Number of requests per key and day.\n
+    \n
+    requests_per_minute: int = 300\n
+    _______________________________\n
+    Rate limit of every key.\n
+    \n
+    path: str = None\n
+    _______________________________\n
+    JSON file of the usage. Only kept in memory if None.\n
+    \n
+    save_interval: float = 10\n
+    _______________________________\n
+    Minimum number of seconds between two writes of the usage.\n
+    """
+
+    # Pools shared by all handlers using the same keys
+    _shared: Dict[Tuple[str, ...], "API_Key_Pool"] = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, keys: List[str], daily_quota: int = 250, requests_per_minute: int = 300, path: Optional[str] = None,
+                 save_interval: float = 10)-> None:
+        if not keys:
+            raise ValueError("No API keys given to the key pool")
+
+        self.keys: List[str] = list(dict.fromkeys(keys))
+        self.daily_quota: int = daily_quota
+        self.rate: float = requests_per_minute / 60
+        self.path: Optional[str] = path
+        self.save_interval: float = save_interval
+
+        self._tokens: Dict[str, float] = {key: 1.0 for key in self.keys}
+        self._refilled_at: Dict[str, float] = {key: time.monotonic() for key in self.keys}
+
+        self._day: date = date.today()
+        self._used: Dict[str, int] = {key: 0 for key in self.keys}
+        self._exhausted: Dict[str, bool] = {key: False for key in self.keys}
+
+        self._lock = threading.Lock()
+        # Serialises the writes of the usage, such that concurrent saves do not share the temporary file
+        self._save_lock = threading.Lock()
+        self._dirty: bool = False
+        self._saved_at: float = time.monotonic()
+
+        self._load()
+        if self.path:
+            atexit.register(self._save)
+
+    @classmethod
+    def shared(cls, keys: List[str], daily_quota: int = 250, requests_per_minute: int = 300, path: Optional[str] = None)-> "API_Key_Pool":
+        """
+        Returns the pool of the keys shared by all handlers, such that the usage is only counted once"""
+        with cls._shared_lock:
+            pool_keys: Tuple[str, ...] = tuple(dict.fromkeys(keys))
+            if pool_keys not in cls._shared:
+                cls._shared[pool_keys] = cls(keys = list(pool_keys), daily_quota = daily_quota, requests_per_minute = requests_per_minute, path = path)
+            return cls._shared[pool_keys]
+
+    @staticmethod
+    def key_id(key: str)-> str:
+        return hashlib.sha256(key.encode()).hexdigest()[:12]
+
+    def _load(self)-> None:
+        if not self.path or not os.path.exists(self.path):
+            return
+
+        try:
+            with open(self.path, "r") as file:
+                usage: dict = json.load(file)
+        except (OSError, json.JSONDecodeError):
+            return
+
+        # The usage of previous days is not relevant anymore
+        if usage.get("date") != self._day.isoformat():
+            return
+
+        for key in self.keys:
+            self._used[key] = usage.get("used", {}).get(self.key_id(key), 0)
+            self._exhausted[key] = self.key_id(key) in usage.get("exhausted", [])
+
+    def _save(self)-> None:
+        """
+        Writes the usage if it changed since the last write. Called without holding the lock of the pool"""
+        if not self.path:
+            return
+
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                usage: dict = {
+                    "date": self._day.isoformat(),
+                    "used": {self.key_id(key): used for key, used in self._used.items()},
+                    "exhausted": [self.key_id(key) for key, exhausted in self._exhausted.items() if exhausted],
+                }
+                self._dirty = False
+                self._saved_at = time.monotonic()
+
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok = True)
+            temporary_path: str = f"{self.path}.tmp"
+            with open(temporary_path, "w") as file:
+                json.dump(usage, file, indent = 4)
+            os.replace(temporary_path, self.path)
+
+    def _new_day(self)-> None:
+        if self._day != date.today():
+            self._day = date.today()
+            self._used = {key: 0 for key in self.keys}
+            self._exhausted = {key: False for key in self.keys}
+
+    def _refill(self, key: str)-> None:
+        now: float = time.monotonic()
+        self._tokens[key] = min(1.0, self._tokens[key] + (now - self._refilled_at[key]) * self.rate)
+        self._refilled_at[key] = now
+
+    def remaining(self, key: str)-> int:
+        """
+        Returns the number of requests left today for the key"""
+        if self._exhausted[key]:
+            return 0
+        return max(self.daily_quota - self._used[key], 0)
+
+    def acquire(self)-> str:
+        """
+        Returns a key to use for one request, waiting until a key has a token left.\n
+        Raises a ValueError if the quota of all keys is used"""
+        while True:
+            with self._lock:
+                self._new_day()
+
+                available: List[str] = [key for key in self.keys if self.remaining(key) > 0]
+                if not available:
+                    raise ValueError("Used all API Keys")
+
+                for key in available:
+                    self._refill(key)
+
+                ready: List[str] = [key for key in available if self._tokens[key] >= 1]
+                if ready:
+                    key: str = max(ready, key = self.remaining)
+                    self._tokens[key] -= 1
+                    self._used[key] += 1
+                    self._dirty = True
+                    save: bool = time.monotonic() - self._saved_at >= self.save_interval
+                else:
+                    wait: float = min((1 - self._tokens[key]) / self.rate for key in available)
+
+            if ready:
+                if save:
+                    self._save()
+                return key
+
+            time.sleep(wait)
+
+    def mark_exhausted(self, key: str)-> None:
+        """
+        Excludes the key for the rest of the day, e.g. after its limit was reached"""
+        with self._lock:
+            self._new_day()
+            self._exhausted[key] = True
+            self._dirty = True
+        self._save()
+
+    @property
+    def size(self)-> int:
+        return len(self.keys)
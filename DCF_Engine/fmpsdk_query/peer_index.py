@@ -0,0 +1,192 @@
+import numpy as np
+import pandas as pd
+import os
+import threading
+import warnings
+from datetime import datetime, timedelta
+from typing import Dict, List, Literal, Optional, Tuple
+
+
+def normalise_industry(raw_industry: str)-> str:
+    """
+    Normalises the industry names of FMP, such that the same industry is always written the same"""
+    industry = str(raw_industry).replace(" -", "")
+    match industry:
+        case "Airlines, Airports & Air Services":
+            return "Airports & Air Services"
+        case _:
+            return industry
+
+
+class Peer_Index():
+    """
+    Local index of the industry and market cap of all companies, used to screen for competitors without requests.\n
+    The index is refreshed in bulk (see FMPSDK_Query_Handler.refresh_peer_index) and persisted to disk.
+    For every industry (and SIC and NAICS code), the market caps are kept sorted, such that the companies of an industry
+    within a range of market caps are found by a binary search in memory.\n
+    \n
+    args:\n
+    _______________________________\n
+    path: str\n
+    _______________________________\n
+    CSV file the index is persisted to.\n
+    \n
+    max_age: timedelta = 7 days\n
+    _______________________________\n
+    Age after which the index is no longer fresh and should be refreshed.\n
+    """
+
+    COLUMNS: List[str] = ["ticker", "industry", "sic", "naics", "market_cap"]
+
+    def __init__(self, path: str, max_age: timedelta = timedelta(days = 7))-> None:
+        self.path: str = path
+        self.max_age: timedelta = max_age
+
+        self.index: pd.DataFrame = pd.DataFrame(columns = self.COLUMNS)
+        self.refreshed_at: Optional[datetime] = None
+
+        # (classification, group) -> (sorted market caps, tickers in the same order)
+        self._groups: Dict[Tuple[str, str], Tuple[np.ndarray, np.ndarray]] = {}
+        self._entries: Dict[str, dict] = {}
+
+        self._lock = threading.RLock()
+
+        self.load()
+
+    def load(self)-> bool:
+        """
+        Loads the index from disk.\n
+        Returns False if there is no persisted index"""
+        if not os.path.exists(self.path):
+            return False
+
+        with self._lock:
+            index: pd.DataFrame = pd.read_csv(self.path, dtype = {"ticker": str, "industry": str, "sic": str, "naics": str}, keep_default_na = False)
+            index["market_cap"] = pd.to_numeric(index["market_cap"], errors = "coerce")
+            self.index = index
+            self.refreshed_at = datetime.fromtimestamp(os.path.getmtime(self.path))
+            self._build()
+
+        return True
+
+    def save(self)-> None:
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok = True)
+        with self._lock:
+            temporary_path: str = f"{self.path}.tmp"
+            self.index.to_csv(temporary_path, index = False)
+            os.replace(temporary_path, self.path)
+
+    @property
+    def is_fresh(self)-> bool:
+        return self.refreshed_at is not None and datetime.now() - self.refreshed_at <= self.max_age
+
+    def _build(self)-> None:
+        """
+        Builds the sorted market caps of every industry, SIC and NAICS code"""
+        index: pd.DataFrame = self.index[self.index["market_cap"].notna() & (self.index["market_cap"] > 0)]
+
+        groups: Dict[Tuple[str, str], Tuple[np.ndarray, np.ndarray]] = {}
+        for classification in ["industry", "sic", "naics"]:
+            classified: pd.DataFrame = index[index[classification] != ""].sort_values("market_cap", kind = "stable")
+            for group, companies in classified.groupby(classification, sort = False):
+                groups[(classification, group)] = (companies["market_cap"].to_numpy(dtype = np.float64), companies["ticker"].to_numpy())
+
+        self._groups = groups
+        self._entries = self.index.set_index("ticker").to_dict(orient = "index")
+
+    def refresh(self, companies: pd.DataFrame)-> None:
+        """
+        Replaces the index by the companies with the columns ticker, industry, market_cap and optionally sic and naics"""
+        companies = companies.copy()
+        for column in self.COLUMNS:
+            if column not in companies.columns:
+                companies[column] = ""
+
+        companies = companies[self.COLUMNS].drop_duplicates(subset = "ticker", keep = "last")
+        companies["market_cap"] = pd.to_numeric(companies["market_cap"], errors = "coerce")
+        for column in ["ticker", "industry"]:
+            companies[column] = companies[column].fillna("").astype(str)
+
+        # Codes read as numbers are written without decimals
+        for column in ["sic", "naics"]:
+            companies[column] = [str(int(code)) if isinstance(code, (int, float, np.number)) and not pd.isna(code)
+                                 else ("" if pd.isna(code) else str(code)) for code in companies[column]]
+        companies["industry"] = companies["industry"].map(lambda industry: normalise_industry(industry) if industry else industry)
+
+        with self._lock:
+            self.index = companies.reset_index(drop = True)
+            self.refreshed_at = datetime.now()
+            self._build()
+            self.save()
+
+    def entry(self, ticker: str)-> Optional[dict]:
+        """
+        Returns the industry, sic, naics and market_cap of the ticker or None if it is not indexed"""
+        return self._entries.get(ticker)
+
+    def peers(self, group: str, lower_market_cap: float, upper_market_cap: float,
+              classification: Literal["industry", "sic", "naics"] = "industry")-> List[str]:
+        """
+        Returns the tickers of the group with a market cap within [lower_market_cap, upper_market_cap],
+        ordered by descending market cap"""
+        with self._lock:
+            if (classification, group) not in self._groups:
+                return []
+            market_caps, tickers = self._groups[(classification, group)]
+
+        start: int = int(np.searchsorted(market_caps, lower_market_cap, side = "left"))
+        end: int = int(np.searchsorted(market_caps, upper_market_cap, side = "right"))
+
+        return tickers[start:end][::-1].tolist()
+
+    def competitors(self, ticker: str, lower_multiple: float = 0.6, upper_multiple: float = 1.4,
+                    classification: Literal["industry", "sic", "naics"] = "industry",
+                    group: str = None, market_cap: float = None)-> List[str]:
+        """
+        Returns the companies of the same group as the ticker with a market cap within
+        [lower_multiple, upper_multiple] times the market cap of the ticker.\n
+        The group and market cap are taken from the index unless given"""
+        entry: dict = self.entry(ticker) or {}
+
+        group = group or entry.get(classification)
+        market_cap = market_cap or entry.get("market_cap")
+
+        if not group or market_cap is None or np.isnan(market_cap):
+            warnings.warn(f"The {classification} or market cap of {ticker} is not part of the peer index", UserWarning)
+            return []
+
+        peers: List[str] = self.peers(group = group,
+                                      lower_market_cap = lower_multiple * market_cap,
+                                      upper_market_cap = upper_multiple * market_cap,
+                                      classification = classification)
+
+        return [peer for peer in peers if peer != ticker]
+
+
+def main()-> None:
+    """
+    Command to refresh the local peer index\n
+    With --wrds, the SIC and NAICS codes of the companies are added from WRDS"""
+    import sys
+    from fmpsdk_query import FMPSDK_Query_Handler
+
+    query = FMPSDK_Query_Handler()
+
+    screened: Optional[pd.DataFrame] = None
+    industry_codes: Optional[pd.DataFrame] = None
+    if "--wrds" in sys.argv:
+        from wrds_query import WRDS_Query_Handler
+
+        screened = query.screen_companies()
+        with warnings.catch_warnings():
+            # Many screened tickers are not part of Compustat
+            warnings.simplefilter("ignore")
+            industry_codes = WRDS_Query_Handler().industry_codes(tickers = screened["ticker"].tolist())
+        industry_codes = industry_codes.rename(columns = {"Ticker": "ticker"})
+
+    companies: int = query.refresh_peer_index(companies = screened, industry_codes = industry_codes)
+    print(f"Indexed {companies} companies into {query.peer_index.path}")
+
+
+if __name__ == "__main__":
+    main()
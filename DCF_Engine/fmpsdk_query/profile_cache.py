@@ -0,0 +1,134 @@
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+class Profile_Cache():
+    """
+    Cache of the FMP company profiles keyed by ticker.\n
+    Entries expire after the ttl. If a path is given, the cache is backed by a JSON file and survives restarts,
+    such that the limited daily requests of the API keys are not spent on profiles that were already fetched.\n
+    Concurrent requests of the same ticker are coalesced into one request.\n
+    \n
+    args:\n
+    _______________________________\n
+    ttl: timedelta = 12 hours\n
+    _______________________________\n
+    Time after which a profile is fetched again.\n
+    \n
+    path: str = None\n
+    _______________________________\n
+    JSON file backing the cache. Only kept in memory if None.\n
+    """
+
+    def __init__(self, ttl: timedelta = timedelta(hours = 12), path: Optional[str] = None)-> None:
+        self.ttl: timedelta = ttl
+        self.path: Optional[str] = path
+
+        # ticker -> (fetched_at, profile)
+        self._entries: Dict[str, Tuple[datetime, dict]] = {}
+        self._loaded: bool = False
+
+        self._lock = threading.Lock()
+        # Serialises the writes of the JSON file, such that concurrent saves do not share the temporary file
+        self._save_lock = threading.Lock()
+        self._ticker_locks: Dict[str, threading.Lock] = {}
+
+    def _load(self)-> None:
+        """
+        Loads the entries of the JSON file on first use"""
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+
+            if not self.path or not os.path.exists(self.path):
+                return
+
+            try:
+                with open(self.path, "r") as file:
+                    entries: dict = json.load(file)
+            except (OSError, json.JSONDecodeError):
+                return
+
+            for ticker, entry in entries.items():
+                self._entries[ticker] = (datetime.fromisoformat(entry["fetched_at"]), entry["profile"])
+
+    def _save(self)-> None:
+        if not self.path:
+            return
+
+        # The entries are read under the save lock, such that the last write holds the latest entries
+        with self._save_lock:
+            with self._lock:
+                entries: dict = {ticker: {"fetched_at": fetched_at.isoformat(), "profile": profile} for ticker, (fetched_at, profile) in self._entries.items()}
+
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok = True)
+            temporary_path: str = f"{self.path}.tmp"
+            with open(temporary_path, "w") as file:
+                json.dump(entries, file, default = str)
+            os.replace(temporary_path, self.path)
+
+    def fresh(self, ticker: str)-> Optional[dict]:
+        """
+        Returns the cached profile of the ticker, or None if not cached or expired"""
+        self._load()
+        entry = self._entries.get(ticker)
+        if entry is None:
+            return None
+        fetched_at, profile = entry
+        if datetime.now() - fetched_at > self.ttl:
+            return None
+        return profile
+
+    def _ticker_lock(self, ticker: str)-> threading.Lock:
+        with self._lock:
+            return self._ticker_locks.setdefault(ticker, threading.Lock())
+
+    def get(self, ticker: str, fetch: Callable[[str], Optional[dict]])-> dict:
+        """
+        Returns the profile of the ticker. fetch(ticker) is only called if the profile is not cached or expired.\n
+        fetch returns None if the request failed, such that the failure is not cached"""
+        profile = self.fresh(ticker)
+        if profile is not None:
+            return profile
+
+        # Only one thread fetches the ticker, the others wait and are served from the cache
+        with self._ticker_lock(ticker):
+            profile = self.fresh(ticker)
+            if profile is not None:
+                return profile
+
+            profile = fetch(ticker)
+            if profile is None:
+                return {}
+
+            self.put({ticker: profile})
+            return profile
+
+    def put(self, profiles: Dict[str, dict])-> None:
+        """
+        Adds the fetched profiles of {ticker: profile} to the cache"""
+        self._load()
+        with self._lock:
+            for ticker, profile in profiles.items():
+                self._entries[ticker] = (datetime.now(), profile)
+        self._save()
+
+    def invalidate(self, ticker: Optional[str] = None)-> None:
+        """
+        Removes the ticker from the cache, or all tickers if None"""
+        self._load()
+        with self._lock:
+            if ticker is None:
+                self._entries = {}
+            else:
+                self._entries.pop(ticker, None)
+        self._save()
+
+    def missing(self, tickers: List[str])-> List[str]:
+        """
+        Returns the tickers without a fresh profile"""
+        return [ticker for ticker in dict.fromkeys(tickers) if self.fresh(ticker) is None]
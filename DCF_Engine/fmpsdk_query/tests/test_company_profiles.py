@@ -0,0 +1,104 @@
+import sys
+import os
+
+# Add the DCF_Engine directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from fmpsdk_query.fmpsdk_query import FMPSDK_Query_Handler
+from fmpsdk_query.key_pool import API_Key_Pool
+from fmpsdk_query.peer_index import Peer_Index
+from fmpsdk_query.profile_cache import Profile_Cache
+from typing import Any, List
+from unittest import mock
+import pandas as pd
+import tempfile
+import threading
+import unittest
+
+
+class Fake_Company_Profile():
+    """
+    Stands in for fmpsdk.company_profile, recording the requested batches.
+    Tickers in unknown are not returned, batches containing a ticker of failing return an error message"""
+
+    def __init__(self, unknown: List[str] = None, failing: List[str] = None)-> None:
+        self.batches: List[List[str]] = []
+        self.unknown: List[str] = unknown or []
+        self.failing: List[str] = failing or []
+        self._lock = threading.Lock()
+
+    def __call__(self, apikey: str, symbol: str)-> Any:
+        batch: List[str] = symbol.split(",")
+        with self._lock:
+            self.batches.append(batch)
+
+        if any(ticker in self.failing for ticker in batch):
+            return {"Error Message": "Internal server error"}
+
+        return [{"symbol": ticker, "industry": "Software - Application", "mktCap": 100}
+                for ticker in batch if ticker not in self.unknown]
+
+
+class Test_Company_Profiles(unittest.TestCase):
+    def setUp(self)-> None:
+        self.directory = tempfile.TemporaryDirectory()
+
+        with mock.patch.dict(os.environ, {"FMPSDK_API_KEYS": "key_a,key_b"}):
+            self.query = FMPSDK_Query_Handler()
+
+        # Local pool, cache and index, such that nothing is written to the shared cache directory
+        self.query.key_pool = API_Key_Pool(keys = ["key_a", "key_b"], requests_per_minute = 60_000)
+        self.query.profile_cache = Profile_Cache()
+        self.query.PROFILE_BATCH_SIZE = 3
+
+        self.peer_index = mock.patch.object(FMPSDK_Query_Handler, "peer_index", Peer_Index(path = os.path.join(self.directory.name, "peer_index.csv")))
+        self.peer_index.start()
+
+    def tearDown(self)-> None:
+        self.peer_index.stop()
+        self.directory.cleanup()
+
+    def company_profiles(self, tickers: List[str], company_profile: Fake_Company_Profile)-> pd.DataFrame:
+        with mock.patch("fmpsdk_query.fmpsdk_query.fmpsdk.company_profile", company_profile, create = True):
+            return self.query.company_profiles(tickers = tickers)
+
+    def test_batches(self)-> None:
+        company_profile = Fake_Company_Profile(unknown = ["EEE"])
+        profiles: pd.DataFrame = self.company_profiles(["AAA", "BBB", "CCC", "DDD", "EEE", "AAA"], company_profile)
+
+        self.assertEqual(sorted(len(batch) for batch in company_profile.batches), [2, 3])
+        self.assertEqual(sorted(profiles.index), ["AAA", "BBB", "CCC", "DDD"])
+
+        # Unknown tickers are cached with an empty profile, cached tickers are not requested again
+        self.assertEqual(self.query.profile_cache.fresh("EEE"), {})
+        self.company_profiles(["AAA", "EEE", "FFF"], company_profile)
+        self.assertEqual(company_profile.batches[-1], ["FFF"])
+        self.assertEqual(len(company_profile.batches), 3)
+
+    def test_failed_batch(self)-> None:
+        company_profile = Fake_Company_Profile(failing = ["DDD"])
+        profiles: pd.DataFrame = self.company_profiles(["AAA", "BBB", "CCC", "DDD"], company_profile)
+
+        # The failed batch is skipped and not cached, such that it is requested again
+        self.assertEqual(sorted(profiles.index), ["AAA", "BBB", "CCC"])
+        self.assertEqual(self.query.profile_cache.missing(["AAA", "DDD"]), ["DDD"])
+
+        company_profile.failing = []
+        self.company_profiles(["AAA", "DDD"], company_profile)
+        self.assertEqual(company_profile.batches[-1], ["DDD"])
+
+    def test_no_profiles(self)-> None:
+        company_profile = Fake_Company_Profile(unknown = ["AAA"])
+
+        for tickers in [[], ["AAA"]]:
+            profiles: pd.DataFrame = self.company_profiles(tickers, company_profile)
+            self.assertTrue(profiles.empty)
+            self.assertTrue(set(FMPSDK_Query_Handler.PROFILE_COLUMNS) <= set(profiles.columns))
+
+            # No companies are indexed instead of a KeyError
+            with mock.patch("fmpsdk_query.fmpsdk_query.fmpsdk.company_profile", company_profile, create = True):
+                self.assertEqual(self.query.refresh_peer_index(tickers = tickers), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
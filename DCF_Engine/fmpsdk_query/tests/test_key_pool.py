@@ -0,0 +1,100 @@
+import sys
+import os
+
+# Add the DCF_Engine directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from fmpsdk_query.key_pool import API_Key_Pool, is_error_response, is_key_error_response
+from datetime import date, timedelta
+from typing import List
+import json
+import tempfile
+import time
+import unittest
+
+
+class Test_API_Key_Pool(unittest.TestCase):
+    def setUp(self)-> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.path: str = os.path.join(self.directory.name, "key_usage.json")
+
+    def tearDown(self)-> None:
+        self.directory.cleanup()
+
+    def test_spread_over_keys(self)-> None:
+        pool = API_Key_Pool(keys = ["key_a", "key_b"], daily_quota = 10)
+        keys: List[str] = [pool.acquire() for _ in range(4)]
+
+        # Every key has one token, such that the requests alternate between the keys with the most quota left
+        self.assertEqual(sorted(keys), ["key_a", "key_a", "key_b", "key_b"])
+        self.assertEqual(pool.remaining("key_a"), 8)
+
+    def test_token_bucket(self)-> None:
+        pool = API_Key_Pool(keys = ["key_a"], requests_per_minute = 600)
+        pool.acquire()
+
+        # The next token of the key is refilled after 1 / (600 / 60) seconds
+        started: float = time.monotonic()
+        pool.acquire()
+        self.assertGreaterEqual(time.monotonic() - started, 0.08)
+
+    def test_quota(self)-> None:
+        pool = API_Key_Pool(keys = ["key_a"], daily_quota = 2, requests_per_minute = 60_000)
+        pool.acquire()
+        pool.acquire()
+
+        with self.assertRaises(ValueError):
+            pool.acquire()
+
+    def test_exhausted(self)-> None:
+        pool = API_Key_Pool(keys = ["key_a", "key_b"], requests_per_minute = 60_000)
+        pool.mark_exhausted("key_a")
+
+        self.assertEqual({pool.acquire() for _ in range(5)}, {"key_b"})
+        self.assertEqual(pool.remaining("key_a"), 0)
+
+        # The keys are available again on the next day
+        pool._day = date.today() - timedelta(days = 1)
+        self.assertEqual(pool.remaining("key_a"), 0)
+        pool.acquire()
+        self.assertEqual(pool.remaining("key_a") + pool.remaining("key_b"), 2 * pool.daily_quota - 1)
+
+    def test_persisted_usage(self)-> None:
+        pool = API_Key_Pool(keys = ["secret_key"], daily_quota = 5, path = self.path)
+        pool.acquire()
+        pool.mark_exhausted("secret_key")
+
+        with open(self.path, "r") as file:
+            usage: str = file.read()
+        self.assertNotIn("secret_key", usage)
+        self.assertEqual(json.loads(usage)["used"], {API_Key_Pool.key_id("secret_key"): 1})
+
+        restarted = API_Key_Pool(keys = ["secret_key"], daily_quota = 5, path = self.path)
+        self.assertEqual(restarted.remaining("secret_key"), 0)
+        with self.assertRaises(ValueError):
+            restarted.acquire()
+
+    def test_save_interval(self)-> None:
+        pool = API_Key_Pool(keys = ["key_a"], requests_per_minute = 60_000, path = self.path, save_interval = 3600)
+        for _ in range(3):
+            pool.acquire()
+
+        # The usage is not written on every request, but at the latest at exit
+        self.assertFalse(os.path.exists(self.path))
+        pool._save()
+        self.assertEqual(API_Key_Pool(keys = ["key_a"], daily_quota = 5, path = self.path).remaining("key_a"), 2)
+
+        pool.save_interval = 0
+        pool.acquire()
+        self.assertEqual(API_Key_Pool(keys = ["key_a"], daily_quota = 5, path = self.path).remaining("key_a"), 1)
+
+    def test_error_responses(self)-> None:
+        self.assertTrue(is_key_error_response({"Error Message": "Limit Reach . Please upgrade your plan"}))
+        self.assertTrue(is_key_error_response({"Error Message": "Invalid API KEY."}))
+        self.assertTrue(is_error_response({"error": "Not found"}))
+        self.assertFalse(is_key_error_response({"error": "Not found"}))
+        self.assertFalse(is_error_response([{"symbol": "AAA"}]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import sys
+import os
+
+# Add the DCF_Engine directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from fmpsdk_query.peer_index import Peer_Index
+from datetime import datetime, timedelta
+import pandas as pd
+import tempfile
+import unittest
+import warnings
+
+
+class Test_Peer_Index(unittest.TestCase):
+    def setUp(self)-> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.path: str = os.path.join(self.directory.name, "peer_index.csv")
+        self.index = Peer_Index(path = self.path)
+
+        self.companies = pd.DataFrame({
+            "ticker":     ["AAA", "BBB", "CCC", "DDD", "EEE", "FFF"],
+            "industry":   ["Software - Application"] * 4 + ["Banks", "Software - Application"],
+            "sic":        [7372, 7372, 7372, 7373, 6021, None],
+            "market_cap": [100.0, 70.0, 139.0, 150.0, 100.0, None],
+        })
+
+    def tearDown(self)-> None:
+        self.directory.cleanup()
+
+    def test_fresh(self)-> None:
+        self.assertFalse(self.index.is_fresh)
+
+        self.index.refresh(self.companies)
+        self.assertTrue(self.index.is_fresh)
+
+        self.index.refreshed_at = datetime.now() - timedelta(days = 8)
+        self.assertFalse(self.index.is_fresh)
+
+        # The age of a persisted index is the age of its file
+        os.utime(self.path, ((datetime.now() - timedelta(days = 8)).timestamp(),) * 2)
+        self.assertFalse(Peer_Index(path = self.path).is_fresh)
+
+    def test_peers(self)-> None:
+        self.index.refresh(self.companies)
+
+        # Ordered by descending market cap, bounds included
+        self.assertEqual(self.index.peers("Software Application", 70.0, 139.0), ["CCC", "AAA", "BBB"])
+        self.assertEqual(self.index.peers("7372", 80.0, 200.0, classification = "sic"), ["CCC", "AAA"])
+        self.assertEqual(self.index.peers("Unknown", 0.0, 1000.0), [])
+
+    def test_competitors(self)-> None:
+        self.index.refresh(self.companies)
+
+        self.assertEqual(self.index.competitors("AAA"), ["CCC", "BBB"])
+        self.assertEqual(self.index.competitors("AAA", classification = "sic"), ["CCC", "BBB"])
+
+        with warnings.catch_warnings(record = True) as caught:
+            warnings.simplefilter("always")
+            self.assertEqual(self.index.competitors("FFF"), [])
+        self.assertEqual(len(caught), 1)
+
+    def test_persisted(self)-> None:
+        self.index.refresh(self.companies)
+
+        index = Peer_Index(path = self.path)
+        self.assertEqual(index.entry("AAA")["sic"], "7372")
+        self.assertEqual(index.entry("AAA")["industry"], "Software Application")
+        self.assertEqual(index.competitors("AAA"), ["CCC", "BBB"])
+
+
+if __name__ == "__main__":
+    unittest.main()
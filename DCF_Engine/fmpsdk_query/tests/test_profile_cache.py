@@ -0,0 +1,84 @@
+import sys
+import os
+
+# Add the DCF_Engine directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from fmpsdk_query.profile_cache import Profile_Cache
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import List, Optional
+import tempfile
+import threading
+import time
+import unittest
+
+
+class Test_Profile_Cache(unittest.TestCase):
+    def setUp(self)-> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.path: str = os.path.join(self.directory.name, "profiles.json")
+        self.cache = Profile_Cache(path = self.path)
+
+        self.fetched: List[str] = []
+        self._lock = threading.Lock()
+
+    def tearDown(self)-> None:
+        self.directory.cleanup()
+
+    def fetch(self, ticker: str)-> Optional[dict]:
+        """
+        Stands in for the profile request, counting the requests"""
+        with self._lock:
+            self.fetched.append(ticker)
+        time.sleep(0.05)
+        return {"symbol": ticker, "mktCap": 100}
+
+    def test_cached(self)-> None:
+        self.assertEqual(self.cache.get("AAA", self.fetch), {"symbol": "AAA", "mktCap": 100})
+        self.cache.get("AAA", self.fetch)
+        self.assertEqual(self.fetched, ["AAA"])
+
+        # The profiles survive a restart
+        self.assertEqual(Profile_Cache(path = self.path).get("AAA", self.fetch)["symbol"], "AAA")
+        self.assertEqual(self.fetched, ["AAA"])
+
+    def test_ttl(self)-> None:
+        self.cache.get("AAA", self.fetch)
+        self.cache._entries["AAA"] = (datetime.now() - timedelta(hours = 13), self.cache._entries["AAA"][1])
+
+        self.assertIsNone(self.cache.fresh("AAA"))
+        self.assertEqual(self.cache.missing(["AAA", "AAA"]), ["AAA"])
+
+        self.cache.get("AAA", self.fetch)
+        self.assertEqual(self.fetched, ["AAA", "AAA"])
+
+    def test_failure_not_cached(self)-> None:
+        self.assertEqual(self.cache.get("AAA", lambda ticker: None), {})
+        self.assertEqual(self.cache.missing(["AAA"]), ["AAA"])
+
+    def test_single_flight(self)-> None:
+        with ThreadPoolExecutor(max_workers = 8) as executor:
+            profiles = list(executor.map(lambda _: self.cache.get("AAA", self.fetch), range(8)))
+
+        # Concurrent requests of the same ticker are coalesced into one request
+        self.assertEqual(self.fetched, ["AAA"])
+        self.assertTrue(all(profile["symbol"] == "AAA" for profile in profiles))
+
+    def test_concurrent_saves(self)-> None:
+        tickers: List[str] = [f"T{number}" for number in range(32)]
+        with ThreadPoolExecutor(max_workers = 8) as executor:
+            list(executor.map(lambda ticker: self.cache.put({ticker: {"symbol": ticker}}), tickers))
+
+        # Every save is complete and the last one holds all profiles
+        self.assertFalse(os.path.exists(f"{self.path}.tmp"))
+        self.assertEqual(Profile_Cache(path = self.path).missing(tickers), [])
+
+    def test_invalidate(self)-> None:
+        self.cache.put({"AAA": {"symbol": "AAA"}, "BBB": {"symbol": "BBB"}})
+        self.cache.invalidate("AAA")
+        self.assertEqual(self.cache.missing(["AAA", "BBB"]), ["AAA"])
+
+
+if __name__ == "__main__":
+    unittest.main()
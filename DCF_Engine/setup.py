@@ -14,6 +14,7 @@ setup(
         "openai", # Only necessary if API_KEY
         "numpy",
         "yfinance",
+        "pyarrow",
         "git+https://github.com/matswalekr/Excel_Engine" # Own github repository for working with Excel
 
     ],
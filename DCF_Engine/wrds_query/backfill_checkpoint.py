@@ -0,0 +1,79 @@
+import hashlib
+import json
+import os
+from datetime import datetime
+from typing import List, Set, Tuple
+
+
+class Backfill_Checkpoint():
+    """
+    Checkpoint of a streamed backfill (see WRDS_Query_Handler.iter_statements).\n
+    Records the tickers whose statements were completely consumed, such that an interrupted backfill resumes
+    with the remaining tickers.\n
+    The checkpoint belongs to one request (statement, fields, years and a hash of the tickers). A checkpoint of a
+    different request, e.g. of other tickers, is reset.\n
+    \n
+    args:\n
+    _______________________________\n
+    path: str\n
+    _______________________________\n
+    JSON file of the checkpoint.\n
+    """
+
+    def __init__(self, path: str)-> None:
+        self.path: str = path
+        self.request: dict = {}
+        self.done: Set[str] = set()
+        self.total: int = 0
+
+        if os.path.exists(path):
+            with open(path, "r") as file:
+                state: dict = json.load(file)
+            self.request = state.get("request", {})
+            self.done = set(state.get("done", []))
+            self.total = state.get("total", 0)
+
+    @staticmethod
+    def tickers_hash(tickers: List[str])-> str:
+        """
+        Returns a hash of the tickers, independent of their order"""
+        return hashlib.sha256(",".join(sorted(set(tickers))).encode()).hexdigest()[:16]
+
+    def start(self, request: dict, tickers: List[str])-> List[str]:
+        """
+        Starts or resumes the request of the tickers.\n
+        Returns the tickers that still need to be fetched"""
+        request = {**request, "tickers": self.tickers_hash(tickers)}
+        if request != self.request:
+            self.request = request
+            self.done = set()
+
+        self.total = len(tickers)
+        self.save()
+
+        return [ticker for ticker in tickers if ticker not in self.done]
+
+    def mark_done(self, tickers: List[str])-> None:
+        self.done.update(tickers)
+        self.save()
+
+    @property
+    def progress(self)-> Tuple[int, int]:
+        """
+        Returns (number of tickers done, number of tickers)"""
+        return (len(self.done), self.total)
+
+    def save(self)-> None:
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok = True)
+        state: dict = {
+            "request": self.request,
+            "done": sorted(self.done),
+            "total": self.total,
+            "updated_at": datetime.now().isoformat(timespec = "seconds"),
+        }
+
+        # Write to a temporary file first, such that an interruption never leaves a broken checkpoint
+        temporary_path: str = f"{self.path}.tmp"
+        with open(temporary_path, "w") as file:
+            json.dump(state, file)
+        os.replace(temporary_path, self.path)
@@ -0,0 +1,199 @@
+import wrds
+import pandas as pd
+import asyncio
+import atexit
+import functools
+import queue
+import threading
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import sqlalchemy as sa
+from sqlalchemy.exc import InterfaceError, OperationalError
+from typing import Dict, Iterator, List
+
+
+class WRDS_Connection_Pool():
+    """
+    Bounded pool of WRDS connections.\n
+    The blocking raw_sql calls are run on a thread pool and every running query checks out its own connection.\n
+    Up to size queries are therefore executed at the same time, the remaining ones wait for a free connection.\n
+    Connections are only opened when they are needed for the first time.\n
+    Connections that were idle for longer than health_check_interval seconds are checked before they are used
+    and queries failing due to a lost connection are retried once on a new connection.\n
+    \n
+    Use WRDS_Connection_Pool.shared to get the pool shared by the whole process.
+    """
+
+    # Pools shared by the process, one per username
+    _shared_pools: Dict[str, "WRDS_Connection_Pool"] = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, username: str, size: int = 1, health_check_interval: float = 60)-> None:
+        if size < 1:
+            raise ValueError(f"The size of the connection pool must be positive, not {size}")
+
+        self.username: str = username
+        self.size: int = size
+        self.health_check_interval: float = health_check_interval
+
+        # Idle connections together with the time they were last used
+        self._idle: queue.LifoQueue = queue.LifoQueue()
+        self._connections: List[wrds.Connection] = []
+        self._opened: int = 0
+        self._lock = threading.Lock()
+
+        self.executor = ThreadPoolExecutor(max_workers = size, thread_name_prefix = "wrds_query")
+
+    @classmethod
+    def shared(cls, username: str, size: int = 1)-> "WRDS_Connection_Pool":
+        """
+        Returns the pool of the username shared by the process.\n
+        The pool grows if a larger size is requested, but never shrinks"""
+        with cls._shared_lock:
+            pool = cls._shared_pools.get(username)
+            if pool is None:
+                pool = cls(username = username, size = size)
+                cls._shared_pools[username] = pool
+            elif size > pool.size:
+                pool.resize(size)
+            return pool
+
+    @classmethod
+    def close_shared(cls)-> None:
+        with cls._shared_lock:
+            for pool in cls._shared_pools.values():
+                pool.close()
+            cls._shared_pools = {}
+
+    def resize(self, size: int)-> None:
+        """
+        Increases the number of connections and worker threads of the pool"""
+        with self._lock:
+            if size <= self.size:
+                return
+            self.size = size
+            old_executor = self.executor
+            self.executor = ThreadPoolExecutor(max_workers = size, thread_name_prefix = "wrds_query")
+        old_executor.shutdown(wait = False)
+
+    def _connect(self)-> wrds.Connection:
+        return wrds.Connection(wrds_username = self.username, autoconnect = True)
+
+    def _reconnect(self, connection: wrds.Connection)-> wrds.Connection:
+        """
+        Replaces a broken connection of the pool by a new one"""
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+        new_connection = self._connect()
+        with self._lock:
+            self._connections = [new_connection if pooled is connection else pooled for pooled in self._connections]
+        return new_connection
+
+    def _is_healthy(self, connection: wrds.Connection)-> bool:
+        try:
+            connection.raw_sql("SELECT 1")
+            return True
+        except Exception:
+            return False
+
+    def _checkout(self)-> wrds.Connection:
+        """
+        Returns an idle connection or opens a new one if the pool is not yet full.\n
+        Blocks until a connection is returned to the pool otherwise"""
+        try:
+            connection, last_used = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_open: bool = self._opened < self.size
+                if can_open:
+                    self._opened += 1
+
+            # The authentication is done outside of the lock, such that connections open in parallel
+            if can_open:
+                try:
+                    connection = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._opened -= 1
+                    raise
+                with self._lock:
+                    self._connections.append(connection)
+                return connection
+
+            connection, last_used = self._idle.get()
+
+        if time.monotonic() - last_used > self.health_check_interval and not self._is_healthy(connection):
+            connection = self._reconnect(connection)
+
+        return connection
+
+    @contextmanager
+    def connection(self)-> Iterator[wrds.Connection]:
+        """
+        Context manager to check out a connection of the pool"""
+        connection = self._checkout()
+        try:
+            yield connection
+        finally:
+            self._idle.put((connection, time.monotonic()))
+
+    def raw_sql(self, query: str, **kwargs)-> pd.DataFrame:
+        """
+        Blocking query on one of the connections of the pool\n
+        Retries the query once on a new connection if the connection was lost"""
+        connection = self._checkout()
+        try:
+            try:
+                return connection.raw_sql(query, **kwargs)
+            except (OperationalError, InterfaceError) as e:
+                warnings.warn(f"\nThe WRDS connection was lost and is reopened: \n{e}")
+                connection = self._reconnect(connection)
+                return connection.raw_sql(query, **kwargs)
+        finally:
+            self._idle.put((connection, time.monotonic()))
+
+    def stream_sql(self, query: str, chunksize: int)-> Iterator[pd.DataFrame]:
+        """
+        Streams the result of the query in chunks of at most chunksize rows.\n
+        Uses a server side cursor, such that only one chunk is held in memory at a time.\n
+        The stream runs on a dedicated connection outside of the pool, as the cursor holds its connection until the last
+        chunk is read. A pooled connection would be held for the whole lifetime of the generator, such that queries of the
+        caller between two chunks wait forever on a pool of size 1. The dedicated connection does not count against size.\n
+        The connection is opened with the first chunk and closed once the generator is exhausted or closed.
+        Call close() on a generator that is not consumed to the end, instead of waiting for the garbage collector"""
+        connection: wrds.Connection = self._connect()
+        try:
+            statement = sa.text(query).execution_options(stream_results = True, yield_per = chunksize)
+            result = connection.connection.execute(statement)
+            try:
+                columns: List[str] = list(result.keys())
+                for rows in result.partitions(chunksize):
+                    yield pd.DataFrame.from_records(rows, columns = columns, coerce_float = True)
+            finally:
+                result.close()
+        finally:
+            connection.close()
+
+    async def async_raw_sql(self, query: str, **kwargs)-> pd.DataFrame:
+        """
+        Runs the query on the thread pool such that independent queries overlap"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(self.raw_sql, query, **kwargs))
+
+    def close(self)-> None:
+        self.executor.shutdown(wait = True)
+        with self._lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections = []
+            self._opened = 0
+        self._idle = queue.LifoQueue()
+
+
+# Close the connections of the shared pools when the process exits
+atexit.register(WRDS_Connection_Pool.close_shared)
@@ -0,0 +1,121 @@
+from typing import Dict, List, Tuple
+
+# Declarative catalogue of the fields of the financial statements.
+# Maps the output name of every field to its Compustat expression on comp.funda.
+# All values are in Million USD.
+
+# Fields identifying a row of comp.funda, part of every statement
+KEY_FIELDS: Dict[str, str] = {
+    "Year":   "fyear",
+    "Date":   "datadate",
+    "Ticker": "tic",
+}
+
+INCOME_STATEMENT_FIELDS: Dict[str, str] = {
+    "Revenues":                               "sale",
+    "COGS":                                   "cogs",
+    "GrossMargin":                            "(sale-cogs)",
+    "SellingGeneralAndAdministrativeExpense": "xsga",
+    "DepreciationAndAmortisation":            "(oibdp - oiadp)",
+    "OperatingIncome":                        "oiadp",
+    "NonOperationalResult":                   "nopi",
+    "SpecialItems":                           "spi",
+    "EBIT":                                   "(pi+xint)",
+    "NetInterest":                            "(-xint)",
+    "EBT":                                    "pi",
+    "Tax":                                    "txt",
+    "IncomeBeforeExtraordinary":              "ib",
+}
+
+BALANCE_SHEET_FIELDS: Dict[str, str] = {
+    "CashAndEquivalents":                   "che",
+    "Receivables":                          "rect",
+    "Inventories":                          "invt",
+    "OtherCurrentAssets":                   "aco",
+    "TotalCurrentAssets":                   "act",
+    "PropertyPlantEquipment":               "ppent",
+    "CumulatedDepreciationAndAmortization": "dpact",
+    "InvestmentInEquity":                   "ivaeq",
+    "InvestmentOther":                      "ivao",
+    "IntangibleAssets":                     "intan",
+    "OtherAssets":                          "ao",
+    "TotalAssets":                          "at",
+    "CurrentDebt":                          "dlc",
+    "TradePayables":                        "ap",
+    "TaxPayables":                          "txp",
+    "OtherCurrentLiabilities":              "lco",
+    "TotalCurrentLiabilities":              "lct",
+    "LongTermDebt":                         "dltt",
+    "DeferredTaxesNonCurrent":              "txditc",
+    "OtherLiabilities":                     "lo",
+    "TotalLiabilities":                     "lt",
+    "NonControllingInterest":               "mib",
+    "PreferredStock":                       "pstk",
+    "CommonStock":                          "ceq",
+    "StockholdersEquity":                   "seq",
+}
+
+CASH_FLOW_STATEMENT_FIELDS: Dict[str, str] = {
+    "IncomeBeforeExtraordinary":         "ibc",
+    "ExtraordinaryItemsAndDiscontinued": "xidoc",
+    "DepreciationAndAmortization":       "dpc",
+    "DeferredTaxes":                     "txdc",
+    "EquityEarningsUnconsolidated":      "esub",
+    "NetResultSalePPE":                  "sppiv",
+    "OtherFundsOperations":              "fopo",
+    "IncreaseAccountReceivable":         "(-recch)",
+    "IncreaseInventory":                 "(-invch)",
+    "IncreaseAccountsPayable":           "apalch",
+    "IncreaseAccruedTaxes":              "txach",
+    "NetChangeOtherAssetsLiabilities":   "aoloch",
+    "OperatingCashFlow":                 "oancf",
+    "IncreaseInvestments":               "ivch",
+    "SaleInvestments":                   "siv",
+    "ChangeShortTermInvestment":         "ivstch",
+    "CapEX":                             "capx",
+    "SaleOfProperty":                    "sppe",
+    "Aquisitions":                       "aqc",
+    "OtherInvestingActivities":          "ivaco",
+    "InvestingCashFlow":                 "ivncf",
+    "EquityIncrease":                    "sstk",
+    "TaxBenefitStockOptions":            "txbcof",
+    "EquityDecrease":                    "prstkc",
+    "Dividend":                          "dv",
+    "LongTermDebIssunace":               "dltis",
+    "LongTermDebtReduction":             "dltr",
+    "CurrentDebtChange":                 "dlcch",
+    "OtherFinanciangActivities":         "fiao",
+    "FinancingCashFlow":                 "fincf",
+    "NetChangeCash":                     "(fincf + ivncf + oancf)",
+}
+
+FIELD_CATALOGUE: Dict[str, Dict[str, str]] = {
+    "balance_sheet":       BALANCE_SHEET_FIELDS,
+    "income_statement":    INCOME_STATEMENT_FIELDS,
+    "cash_flow_statement": CASH_FLOW_STATEMENT_FIELDS,
+}
+
+# Columns identifying a row as (Compustat expression, name)
+KEY_COLUMNS: List[Tuple[str, str]] = [(expression, name) for name, expression in KEY_FIELDS.items()]
+
+
+def statement_columns(statement: str, fields: List[str] = None)-> List[Tuple[str, str]]:
+    """
+    Returns the (Compustat expression, name) of the fields of the statement.\n
+    The names of the fields are case insensitive. If no fields are given, all fields of the statement are returned.\n
+    The columns keep the order of the catalogue"""
+
+    if statement not in FIELD_CATALOGUE:
+        raise KeyError(f"Unknown statement {statement}. Available statements are {list(FIELD_CATALOGUE)}")
+
+    catalogue: Dict[str, str] = FIELD_CATALOGUE[statement]
+
+    if fields is None:
+        return [(expression, name) for name, expression in catalogue.items()]
+
+    requested: List[str] = [field.lower() for field in fields]
+    unknown: List[str] = [field for field in fields if field.lower() not in {name.lower() for name in catalogue}]
+    if unknown:
+        raise KeyError(f"The fields {unknown} are not part of the {statement}. Available fields are {list(catalogue)}")
+
+    return [(expression, name) for name, expression in catalogue.items() if name.lower() in requested]
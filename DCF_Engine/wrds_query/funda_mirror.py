@@ -0,0 +1,208 @@
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.fs as fs
+import pyarrow.parquet as pq
+import json
+import os
+import re
+from datetime import datetime
+from dateutil.relativedelta import relativedelta
+from typing import Callable, List, Optional, Set, Tuple
+
+# Support running the module as a script
+try:
+    from .field_catalogue import KEY_COLUMNS
+except ImportError:
+    from field_catalogue import KEY_COLUMNS
+
+
+def funda_fields(columns: List[Tuple[str, str]])-> List[str]:
+    """
+    Returns the comp.funda fields used in the expressions of the columns"""
+    fields: List[str] = []
+    for expression, _ in columns:
+        for field in re.findall(r"[a-z_][a-z0-9_]*", expression):
+            if field not in fields:
+                fields.append(field)
+    return fields
+
+
+class Funda_Mirror():
+    """
+    Local columnar mirror of the subset of comp.funda used by the WRDS_Query_Handler.\n
+    The rows (indfmt = 'INDL', datafmt = 'STD', consol = 'C') are stored as Parquet files partitioned by fiscal year.\n
+    A sync only pulls the rows with a datadate newer than the one of the last sync minus an overlap window, such that
+    late filings and statements restated in place are pulled again. Reads keep the row of the latest sync.\n
+    Reads memory map the files and push the ticker and year filters down to the Parquet scan.\n
+    \n
+    args:\n
+    _______________________________\n
+    path: str\n
+    _______________________________\n
+    Directory of the mirror.\n
+    """
+
+    STATE_FILE: str = "sync_state.json"
+
+    # Rows with a datadate within this window before the last datadate are pulled again on every sync
+    SYNC_OVERLAP_MONTHS: int = 18
+
+    def __init__(self, path: str)-> None:
+        self.path: str = path
+        self.data_path: str = os.path.join(path, "funda")
+        self.state_path: str = os.path.join(path, self.STATE_FILE)
+
+    def state(self)-> dict:
+        if not os.path.exists(self.state_path):
+            return {}
+        with open(self.state_path, "r") as file:
+            return json.load(file)
+
+    @property
+    def last_datadate(self)-> Optional[str]:
+        return self.state().get("last_datadate")
+
+    @property
+    def is_synced(self)-> bool:
+        return os.path.isdir(self.data_path) and self.last_datadate is not None
+
+    def dataset(self)-> ds.Dataset:
+        """
+        Returns the memory mapped dataset of the mirror"""
+        if not self.is_synced:
+            raise FileNotFoundError(f"No synced comp.funda mirror found in {self.path}. Run the sync first")
+
+        return ds.dataset(self.data_path,
+                          format = "parquet",
+                          partitioning = "hive",
+                          filesystem = fs.LocalFileSystem(use_mmap = True))
+
+    def sync(self, raw_sql: Callable[[str], pd.DataFrame], fields: List[str])-> int:
+        """
+        Pulls the rows of comp.funda newer than the last sync (minus the overlap window) and appends them to the year partitions.\n
+        Returns the number of rows pulled"""
+
+        last_datadate: Optional[str] = self.last_datadate
+        if last_datadate:
+            overlap_start: str = (datetime.strptime(last_datadate, "%Y-%m-%d") - relativedelta(months = self.SYNC_OVERLAP_MONTHS)).strftime("%Y-%m-%d")
+            condition: str = f"datadate > '{overlap_start}'"
+        else:
+            condition = "TRUE"
+
+        query_funda = f"""
+        SELECT
+            fyear,
+            datadate,
+            tic,
+            {", ".join(fields)}
+        FROM comp.funda
+        WHERE indfmt = 'INDL'
+        AND datafmt = 'STD'
+        AND consol = 'C'
+        AND fyear IS NOT NULL
+        AND {condition}
+        """
+
+        funda: pd.DataFrame = raw_sql(query_funda)
+
+        if funda.empty:
+            return 0
+
+        funda["fyear"] = funda["fyear"].astype(int)
+        funda["datadate"] = pd.to_datetime(funda["datadate"])
+
+        # Every sync adds new files to the partitions, such that existing files are never rewritten.
+        # The id orders the syncs, see sync_order
+        sync_id: str = datetime.now().strftime("%Y%m%d%H%M%S%f")
+        pq.write_to_dataset(pa.Table.from_pandas(funda, preserve_index = False),
+                            root_path = self.data_path,
+                            partition_cols = ["fyear"],
+                            basename_template = f"sync-{sync_id}-{{i}}.parquet")
+
+        state: dict = {
+            "last_datadate": max(funda["datadate"].max().strftime("%Y-%m-%d"), last_datadate or ""),
+            "synced_at": datetime.now().isoformat(timespec = "seconds"),
+            "fields": sorted(set(fields) | set(self.state().get("fields", []))),
+        }
+        with open(self.state_path, "w") as file:
+            json.dump(state, file, indent = 4)
+
+        return len(funda)
+
+    def read(self, tickers: List[str], years: List[int], fields: List[str])-> pd.DataFrame:
+        """
+        Reads the fields of the tickers and years from the memory mapped mirror\n
+        The filters are pushed down to the scan, such that only the matching partitions and row groups are read"""
+
+        missing_fields: Set[str] = set(fields) - set(self.state().get("fields", []))
+        if missing_fields:
+            raise KeyError(f"The fields {sorted(missing_fields)} are not part of the comp.funda mirror. Sync the mirror again")
+
+        dataset: ds.Dataset = self.dataset()
+
+        row_filter = ds.field("tic").isin(list(tickers)) & ds.field("fyear").isin([int(year) for year in years])
+        columns: List[str] = ["fyear", "datadate", "tic"] + list(fields)
+
+        # Every file is read on its own, such that the rows keep the order of the sync that wrote them
+        frames: List[pd.DataFrame] = []
+        for fragment in dataset.get_fragments(filter = row_filter):
+            frame: pd.DataFrame = fragment.to_table(schema = dataset.schema, columns = columns, filter = row_filter).to_pandas()
+            if not frame.empty:
+                frame["sync_order"] = self.sync_order(fragment.path)
+                frames.append(frame)
+
+        if not frames:
+            return pd.DataFrame(columns = columns)
+
+        funda: pd.DataFrame = pd.concat(frames, ignore_index = True)
+
+        # Rows pulled by several syncs are deduplicated, keeping the latest report and of the same report the latest sync
+        funda = funda.sort_values(["datadate", "sync_order"], kind = "stable").drop_duplicates(subset = ["tic", "fyear"], keep = "last")
+
+        return funda[columns].reset_index(drop = True)
+
+    @staticmethod
+    def sync_order(path: str)-> int:
+        """
+        Returns the order of the sync that wrote the file, later syncs are larger"""
+        match = re.search(r"sync-(\d+)-", os.path.basename(path))
+        # Ids of older syncs are without microseconds
+        return int(match.group(1).ljust(20, "0")) if match else 0
+
+    def latest_fiscal_years(self, tickers: List[str])-> pd.DataFrame:
+        """
+        Returns the latest fiscal year of every ticker found in the mirror with the columns ticker and year"""
+
+        dataset: ds.Dataset = self.dataset()
+
+        funda: pd.DataFrame = dataset.to_table(columns = ["tic", "fyear"], filter = ds.field("tic").isin(list(tickers))).to_pandas()
+
+        return funda.groupby("tic", as_index = False)["fyear"].max().rename(columns = {"tic": "ticker", "fyear": "year"})
+
+    def statement(self, columns: List[Tuple[str, str]], tickers: List[str], years: List[int])-> pd.DataFrame:
+        """
+        Evaluates the (Compustat expression, name) columns on the mirror.\n
+        Returns the same frame as the query on comp.funda, with lower case column names"""
+
+        funda: pd.DataFrame = self.read(tickers = tickers, years = years, fields = funda_fields(columns))
+
+        statement = pd.DataFrame(index = funda.index)
+        for expression, name in KEY_COLUMNS + columns:
+            statement[name.lower()] = funda.eval(expression)
+
+        return statement
+
+
+def main()-> None:
+    """
+    Command to sync the local comp.funda mirror"""
+    from wrds_query import WRDS_Query_Handler
+
+    query = WRDS_Query_Handler()
+    rows: int = query.sync_funda_mirror()
+    print(f"Synced {rows} rows of comp.funda into {query.funda_mirror.path}")
+
+
+if __name__ == "__main__":
+    main()
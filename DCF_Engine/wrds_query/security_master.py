@@ -0,0 +1,152 @@
+import pandas as pd
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Set
+
+
+class Security_Master():
+    """
+    Local index of the securities in comp.security.\n
+    Maps tickers to gvkeys together with the validity of the security (secstat and inactivation date dldtei).\n
+    The index is loaded in bulk once, persisted to disk and refreshed incrementally afterwards.\n
+    Lookups are served from memory. Tickers that are not yet indexed are fetched in one query and appended.\n
+    \n
+    args:\n
+    _______________________________\n
+    path: str\n
+    _______________________________\n
+    CSV file the index is persisted to.\n
+    \n
+    max_age: timedelta = 30 days\n
+    _______________________________\n
+    Age after which the index is refreshed incrementally on the next lookup.\n
+    """
+
+    COLUMNS: List[str] = ["ticker", "gvkey", "iid", "secstat", "valid_to"]
+
+    def __init__(self, path: str, max_age: timedelta = timedelta(days = 30))-> None:
+        self.path: str = path
+        self.max_age: timedelta = max_age
+
+        self.index: pd.DataFrame = pd.DataFrame(columns = self.COLUMNS)
+        self.refreshed_at: Optional[datetime] = None
+
+        # Lookup of ticker -> gvkey, built from the index
+        self._gvkeys: Dict[str, str] = {}
+
+        # Tickers not found in comp.security since the last refresh. Avoids repeating their lookup
+        self._unknown: Set[str] = set()
+
+        self._lock = threading.RLock()
+
+        self.load()
+
+    @staticmethod
+    def query(condition: str)-> str:
+        return f"""
+        SELECT
+            tic AS Ticker,
+            gvkey AS Gvkey,
+            iid AS Iid,
+            secstat AS Secstat,
+            dldtei AS Valid_To
+        FROM comp.security
+        WHERE tic IS NOT NULL
+        AND {condition}
+        """
+
+    def load(self)-> bool:
+        """
+        Loads the index from disk.\n
+        Returns False if there is no persisted index"""
+        if not os.path.exists(self.path):
+            return False
+
+        with self._lock:
+            self.index = pd.read_csv(self.path, dtype = str, keep_default_na = False)
+            self.refreshed_at = datetime.fromtimestamp(os.path.getmtime(self.path))
+            self._build_lookup()
+
+        return True
+
+    def save(self)-> None:
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok = True)
+        with self._lock:
+            self.index.to_csv(self.path, index = False)
+
+    def _build_lookup(self)-> None:
+        """
+        Builds the in memory lookup. Active securities take precedence over inactive ones,
+        otherwise the security inactivated last is used"""
+        ordered = self.index.assign(active = self.index["secstat"] == "A").sort_values(["active", "valid_to"], ascending = [True, True])
+
+        # Later rows overwrite earlier ones, such that the preferred security is kept
+        self._gvkeys = dict(zip(ordered["ticker"], ordered["gvkey"]))
+
+    def _merge(self, securities: pd.DataFrame)-> None:
+        """
+        Upserts the securities into the index on (gvkey, iid)"""
+        securities = securities.rename(columns = str.lower)[self.COLUMNS].fillna("").astype(str)
+
+        with self._lock:
+            index = pd.concat([self.index, securities], ignore_index = True)
+            self.index = index.drop_duplicates(subset = ["gvkey", "iid"], keep = "last").reset_index(drop = True)
+            self._build_lookup()
+
+    def bulk_load(self, raw_sql: Callable[[str], pd.DataFrame])-> None:
+        """
+        Loads the full comp.security table into the index and persists it"""
+        securities: pd.DataFrame = raw_sql(self.query(condition = "TRUE"))
+
+        with self._lock:
+            self.index = pd.DataFrame(columns = self.COLUMNS)
+            self._merge(securities)
+            self._unknown = set()
+            self.refreshed_at = datetime.now()
+            self.save()
+
+    def refresh(self, raw_sql: Callable[[str], pd.DataFrame])-> None:
+        """
+        Incremental refresh of the index.\n
+        Only fetches securities of gvkeys newer than the indexed ones and securities inactivated since the last refresh"""
+        if self.index.empty or self.refreshed_at is None:
+            self.bulk_load(raw_sql)
+            return
+
+        max_gvkey: str = str(self.index["gvkey"].max())
+        last_refresh: str = self.refreshed_at.strftime("%Y-%m-%d")
+
+        securities: pd.DataFrame = raw_sql(self.query(condition = f"(gvkey > '{max_gvkey}' OR dldtei >= '{last_refresh}')"))
+
+        with self._lock:
+            self._merge(securities)
+            self._unknown = set()
+            self.refreshed_at = datetime.now()
+            self.save()
+
+    def is_stale(self)-> bool:
+        return self.refreshed_at is None or datetime.now() - self.refreshed_at > self.max_age
+
+    def resolve(self, tickers: List[str], raw_sql: Callable[[str], pd.DataFrame])-> Dict[str, str]:
+        """
+        Returns a dictionary of {ticker: gvkey} for all tickers that could be resolved.\n
+        Tickers missing in the index are fetched with a single query and added to the index"""
+        if self.is_stale():
+            self.refresh(raw_sql)
+
+        with self._lock:
+            missing: List[str] = [ticker for ticker in tickers if ticker not in self._gvkeys and ticker not in self._unknown]
+
+        if missing:
+            tickers_sql: str = ", ".join("'" + ticker.replace("'", "''") + "'" for ticker in missing)
+            securities: pd.DataFrame = raw_sql(self.query(condition = f"tic IN ({tickers_sql})"))
+            if not securities.empty:
+                self._merge(securities)
+                self.save()
+
+            with self._lock:
+                self._unknown.update(ticker for ticker in missing if ticker not in self._gvkeys)
+
+        with self._lock:
+            return {ticker: self._gvkeys[ticker] for ticker in tickers if ticker in self._gvkeys}
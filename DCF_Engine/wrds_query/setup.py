@@ -6,7 +6,8 @@ setup(
     packages=find_packages(),
     install_requires=[
         "wrds",
-        "pandas"
+        "pandas",
+        "pyarrow"
     ],
     description="A Python module for querying financial data using wrds",
     author="Mats Walker",
@@ -0,0 +1,43 @@
+import sys
+import os
+
+# Add the DCF_Engine directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from wrds_query.backfill_checkpoint import Backfill_Checkpoint
+import tempfile
+import unittest
+
+
+class Test_Backfill_Checkpoint(unittest.TestCase):
+    def setUp(self)-> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.path: str = os.path.join(self.directory.name, "backfill.json")
+        self.request: dict = {"statement": "income_statement", "fields": ["Revenues"], "years": [2022, 2023]}
+
+    def tearDown(self)-> None:
+        self.directory.cleanup()
+
+    def test_resume(self)-> None:
+        checkpoint = Backfill_Checkpoint(path = self.path)
+        self.assertEqual(checkpoint.start(request = self.request, tickers = ["AAA", "BBB", "CCC"]), ["AAA", "BBB", "CCC"])
+        checkpoint.mark_done(["AAA"])
+
+        # An interrupted backfill of the same tickers, in any order, resumes with the remaining tickers
+        resumed = Backfill_Checkpoint(path = self.path)
+        self.assertEqual(resumed.start(request = self.request, tickers = ["CCC", "BBB", "AAA"]), ["CCC", "BBB"])
+        self.assertEqual(resumed.progress, (1, 3))
+
+    def test_other_tickers(self)-> None:
+        checkpoint = Backfill_Checkpoint(path = self.path)
+        checkpoint.start(request = self.request, tickers = ["AAA", "BBB"])
+        checkpoint.mark_done(["AAA", "BBB"])
+
+        # The same statement, fields and years of other tickers is a different request
+        restarted = Backfill_Checkpoint(path = self.path)
+        self.assertEqual(restarted.start(request = self.request, tickers = ["AAA", "DDD"]), ["AAA", "DDD"])
+        self.assertEqual(restarted.progress, (0, 2))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+import sys
+import os
+
+# Add the DCF_Engine directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from wrds_query.connection_pool import WRDS_Connection_Pool
+from typing import List
+import pandas as pd
+import threading
+import unittest
+
+
+class Fake_Result():
+    def __init__(self, rows: List[tuple])-> None:
+        self.rows: List[tuple] = rows
+        self.closed: bool = False
+
+    def keys(self)-> List[str]:
+        return ["tic", "fyear"]
+
+    def partitions(self, size: int):
+        for start in range(0, len(self.rows), size):
+            yield self.rows[start:start + size]
+
+    def close(self)-> None:
+        self.closed = True
+
+
+class Fake_Connection():
+    """
+    Connection with the interface of wrds.Connection used by the pool"""
+
+    def __init__(self, rows: List[tuple])-> None:
+        self.rows: List[tuple] = rows
+        self.closed: bool = False
+        # The SQLAlchemy connection of wrds.Connection
+        self.connection = self
+
+    def execute(self, statement)-> Fake_Result:
+        return Fake_Result(self.rows)
+
+    def raw_sql(self, query: str, **kwargs)-> pd.DataFrame:
+        return pd.DataFrame({"value": [1]})
+
+    def close(self)-> None:
+        self.closed = True
+
+
+class Fake_Pool(WRDS_Connection_Pool):
+    def __init__(self, *args, **kwargs)-> None:
+        super().__init__(*args, **kwargs)
+        self.opened: List[Fake_Connection] = []
+
+    def _connect(self)-> Fake_Connection:
+        connection = Fake_Connection(rows = [("AAPL", year) for year in range(2010, 2020)])
+        self.opened.append(connection)
+        return connection
+
+
+class Test_Stream_SQL(unittest.TestCase):
+    def setUp(self)-> None:
+        self.pool = Fake_Pool(username = "test", size = 1)
+
+    def tearDown(self)-> None:
+        self.pool.close()
+
+    def test_stream(self)-> None:
+        chunks: List[pd.DataFrame] = list(self.pool.stream_sql("SELECT", chunksize = 4))
+        self.assertEqual([len(chunk) for chunk in chunks], [4, 4, 2])
+        self.assertEqual(list(chunks[0].columns), ["tic", "fyear"])
+        self.assertTrue(self.pool.opened[0].closed)
+
+    def test_queries_during_stream(self)-> None:
+        stream = self.pool.stream_sql("SELECT", chunksize = 4)
+        next(stream)
+
+        # The stream does not hold the only connection of the pool, such that queries between chunks do not block
+        result: List[pd.DataFrame] = []
+        query = threading.Thread(target = lambda: result.append(self.pool.raw_sql("SELECT 1")))
+        query.start()
+        query.join(timeout = 5)
+        self.assertFalse(query.is_alive())
+        self.assertEqual(len(result), 1)
+
+        stream.close()
+
+    def test_abandoned_stream(self)-> None:
+        stream = self.pool.stream_sql("SELECT", chunksize = 4)
+        next(stream)
+        stream.close()
+
+        self.assertTrue(self.pool.opened[0].closed)
+        self.assertEqual(self.pool._opened, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import sys
+import os
+
+# Add the DCF_Engine directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from wrds_query.funda_mirror import Funda_Mirror
+from typing import List
+import pandas as pd
+import tempfile
+import unittest
+
+
+class Test_Funda_Mirror(unittest.TestCase):
+    def setUp(self)-> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.mirror = Funda_Mirror(path = self.directory.name)
+
+        self.queries: List[str] = []
+        self.rows: pd.DataFrame = pd.DataFrame()
+
+    def tearDown(self)-> None:
+        self.directory.cleanup()
+
+    def raw_sql(self, query: str)-> pd.DataFrame:
+        """
+        Stands in for comp.funda, returning the rows set by the test"""
+        self.queries.append(query)
+        return self.rows.copy()
+
+    def test_sync_overlap(self)-> None:
+        self.rows = pd.DataFrame({"fyear": [2022, 2023], "datadate": ["2022-12-31", "2023-12-31"], "tic": ["AAA", "AAA"], "revt": [1.0, 2.0]})
+        self.assertEqual(self.mirror.sync(self.raw_sql, fields = ["revt"]), 2)
+        self.assertIn("AND TRUE", self.queries[-1])
+
+        # The next sync pulls the last 18 months again, such that late filings and restatements are found
+        self.rows = pd.DataFrame({"fyear": [2023, 2023], "datadate": ["2023-12-31", "2023-06-30"], "tic": ["AAA", "BBB"], "revt": [3.0, 4.0]})
+        self.mirror.sync(self.raw_sql, fields = ["revt"])
+        self.assertIn("datadate > '2022-06-30'", self.queries[-1])
+        self.assertEqual(self.mirror.last_datadate, "2023-12-31")
+
+        funda: pd.DataFrame = self.mirror.read(tickers = ["AAA", "BBB"], years = [2022, 2023], fields = ["revt"])
+        values = funda.set_index(["tic", "fyear"])["revt"]
+
+        self.assertEqual(len(funda), 3)
+        self.assertEqual(values[("AAA", 2022)], 1.0)
+        # The statement restated in place (same datadate) is served from the latest sync
+        self.assertEqual(values[("AAA", 2023)], 3.0)
+        # The late filing with an older datadate is part of the mirror
+        self.assertEqual(values[("BBB", 2023)], 4.0)
+
+    def test_sync_order(self)-> None:
+        self.assertLess(Funda_Mirror.sync_order("fyear=2023/sync-20240101120000-0.parquet"),
+                        Funda_Mirror.sync_order("fyear=2023/sync-20240101120000000001-0.parquet"))
+
+
+if __name__ == "__main__":
+    unittest.main()
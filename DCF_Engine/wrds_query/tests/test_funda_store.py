@@ -0,0 +1,81 @@
+import sys
+import os
+
+# Add the DCF_Engine directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+os.environ.setdefault("wrds_username", "test")
+
+from wrds_query import WRDS_Query_Handler
+from wrds_query.field_catalogue import statement_columns
+from wrds_query.funda_mirror import Funda_Mirror
+from database_query import Database_Query_Handler
+from typing import List
+import asyncio
+import pandas as pd
+import tempfile
+import unittest
+
+
+class Test_Funda_Store(unittest.TestCase):
+    """
+    The statements read from the store and from the mirror have the schema of the statements queried on WRDS"""
+
+    def setUp(self)-> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = Database_Query_Handler(db = os.path.join(self.directory.name, "fundamentals.db"))
+
+        self.columns = statement_columns("income_statement", fields = ["Revenues", "COGS"])
+        self.queries: List[str] = []
+
+        # comp.funda as returned by WRDS
+        self.remote = pd.DataFrame({"year": [2023, 2022], "date": ["2023-12-31", "2022-12-31"], "ticker": ["AAA", "AAA"],
+                                    "revenues": [200.0, 100.0], "cogs": [80.0, 50.0]})
+
+    def tearDown(self)-> None:
+        self.store.pool.close()
+        self.directory.cleanup()
+
+    async def raw_sql(self, query: str)-> pd.DataFrame:
+        self.queries.append(query)
+        return self.remote.copy()
+
+    def query_funda(self, query_: WRDS_Query_Handler)-> pd.DataFrame:
+        funda: pd.DataFrame = asyncio.run(query_.query_funda(columns = self.columns, tickers = ["AAA"], years = [2022, 2023], statement = "income_statement"))
+        return funda.sort_values("year").reset_index(drop = True)
+
+    def test_round_trip(self)-> None:
+        query_ = WRDS_Query_Handler(store = self.store)
+        query_.raw_sql = self.raw_sql
+
+        remote: pd.DataFrame = self.query_funda(query_)
+        stored: pd.DataFrame = self.query_funda(query_)
+
+        # The second query is served from the store
+        self.assertEqual(len(self.queries), 1)
+        pd.testing.assert_frame_equal(stored, remote)
+        self.assertEqual(list(stored.columns), ["year", "date", "ticker", "revenues", "cogs"])
+        self.assertIsNone(stored.columns.name)
+        self.assertEqual(stored.at[0, "date"], "2022-12-31")
+
+        formated: pd.DataFrame = WRDS_Query_Handler.format(stored)
+        self.assertIsNone(formated.index.name)
+        self.assertEqual(formated.at["date", ("AAA", 2023)], "2023-12-31")
+
+    def test_mirror(self)-> None:
+        mirror = Funda_Mirror(path = self.directory.name)
+        rows = pd.DataFrame({"fyear": [2022, 2023], "datadate": ["2022-12-31", "2023-12-31"], "tic": ["AAA", "AAA"],
+                             "sale": [100.0, 200.0], "cogs": [50.0, 80.0]})
+        mirror.sync(lambda query: rows.copy(), fields = ["sale", "cogs"])
+
+        query_ = WRDS_Query_Handler(offline = True)
+        query_.funda_mirror = mirror
+        offline: pd.DataFrame = self.query_funda(query_)
+
+        query_ = WRDS_Query_Handler()
+        query_.raw_sql = self.raw_sql
+        pd.testing.assert_frame_equal(offline, self.query_funda(query_))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -27,7 +27,38 @@ class Test_WRDS_QUERY_HANDLER(unittest.TestCase):
                 self.assertFalse(data.empty)
 
         self.accounting(data = data, ticker = ticker, year = year)
-    
+
+    def test_set_based_statements(self)-> None:
+        tickers = ["MSFT", "TSLA", "GOOGL"]
+        years = [2021, 2022, 2023]
+
+        data: pd.DataFrame = self.query_.income_statement(tickers = tickers, years = years)
+
+        for ticker in tickers:
+            for year in years:
+                self.assertIn((ticker, year), data.columns)
+
+        with self.assertWarns(UserWarning):
+            self.query_.balance_sheet(tickers = ["MSFT", "NOT_A_TICKER"], years = years)
+
+    def test_financial_statements(self)-> None:
+        tickers = ["MSFT", "TSLA"]
+        years = [2022, 2023]
+
+        balance_sheet, income_statement, cash_flow_statement = self.query_.financial_statements(tickers = tickers, years = years)
+
+        pd.testing.assert_frame_equal(balance_sheet, self.query_.balance_sheet(tickers = tickers, years = years), check_like = True)
+        pd.testing.assert_frame_equal(income_statement, self.query_.income_statement(tickers = tickers, years = years), check_like = True)
+        pd.testing.assert_frame_equal(cash_flow_statement, self.query_.cash_flow_statement(tickers = tickers, years = years), check_like = True)
+
+
+    def test_latest_fiscal_year(self)-> None:
+        latest_years = self.query_.latest_fiscal_year(tickers = ["MSFT", "TSLA", "NOT_A_TICKER"])
+
+        self.assertNotIn("NOT_A_TICKER", latest_years)
+        for ticker in ["MSFT", "TSLA"]:
+            data: pd.DataFrame = self.query_.income_statement(ticker = ticker, year = latest_years[ticker])
+            self.assertFalse(data.empty)
 
     def accounting(self, data: pd.DataFrame, ticker: str, year: int) -> None:
         
@@ -1,12 +1,25 @@
-import wrds
 import pandas as pd
 import asyncio
-from typing import List, Callable, Union
+from typing import List, Callable, Union, Iterable, Iterator, Tuple, Dict, Set
 import time
 from itertools import product
 import warnings
 import functools
 
+# Support running the module as a script
+try:
+    from .connection_pool import WRDS_Connection_Pool
+    from .security_master import Security_Master
+    from .funda_mirror import Funda_Mirror, funda_fields
+    from .field_catalogue import FIELD_CATALOGUE, KEY_COLUMNS, statement_columns
+    from .backfill_checkpoint import Backfill_Checkpoint
+except ImportError:
+    from connection_pool import WRDS_Connection_Pool
+    from security_master import Security_Master
+    from funda_mirror import Funda_Mirror, funda_fields
+    from field_catalogue import FIELD_CATALOGUE, KEY_COLUMNS, statement_columns
+    from backfill_checkpoint import Backfill_Checkpoint
+
 # Load the necessary functions to load the API keys from .env file
 import os
 from dotenv import load_dotenv
@@ -15,6 +28,12 @@ from dotenv import load_dotenv
 dotenv_path = os.path.join(os.path.dirname(__file__), "../../keys.env")
 load_dotenv(dotenv_path=dotenv_path)
 
+# Directory of the local files (e.g. security master) of the handler
+cache_dir = os.getenv("DCF_CACHE_DIR", os.path.join(os.path.dirname(__file__), "../../cache"))
+
+# Separator between the statement and the column name in the fused query
+STATEMENT_PREFIX_SEPARATOR: str = "__"
+
 def timeit(func):
     def wrapper(*args, **kwargs):
         start_time = time.time()  # Record start time
@@ -47,20 +66,193 @@ async def task_wrapper(function: Callable, *args):
         return await function(*args)
     except Exception as e:
         return (e, args)
+
+def sql_list(values: Iterable[Union[str, int]])-> str:
+    """
+    Formats the values as a comma separated list to be used in a SQL IN (...) clause\n
+    Strings are quoted and escaped, numbers are inserted as they are"""
+    formated_values: List[str] = []
+    for value in values:
+        if isinstance(value, str):
+            escaped_value = value.replace("'", "''")
+            formated_values.append(f"'{escaped_value}'")
+        else:
+            formated_values.append(str(int(value)))
+    return ", ".join(formated_values)
+
+def chunks(values: List, size: int)-> Iterator[List]:
+    """
+    Splits the list into consecutive chunks of at most size elements"""
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+def statement_query(columns: List[Tuple[str, str]], tickers: List[str], years: List[int])-> str:
+    """
+    Builds the query of the columns on comp.funda for all tickers and years"""
+
+    select = ",\n            ".join(f"{expression} as {name}" for expression, name in KEY_COLUMNS + columns)
+
+    return f"""
+        SELECT
+            {select}
+        FROM comp.funda
+        WHERE tic IN ({sql_list(tickers)})
+        AND fyear IN ({sql_list(years)})
+        AND indfmt = 'INDL'
+        AND datafmt = 'STD'
+        AND consol = 'C'
+        """
     
 
 class WRDS_Query_Handler():
 
-    def __init__(self)->None:
+    # Maximum number of tickers sent in a single IN (...) clause
+    MAX_TICKERS_PER_QUERY: int = 500
+
+    # Ticker -> gvkey index shared by all handlers of the process
+    security_master: Security_Master = None
+
+    def __init__(self, max_connections: int = 1, offline: bool = False, store = None)->None:
+        """
+        max_connections: int = 1\n
+        _______________________________\n
+        Number of WRDS connections used by the handler.\n
+        Independent queries of the async methods run concurrently on up to max_connections connections.\n
+        The connections are opened lazily and shared by all handlers of the process.\n
+        \n
+        offline: bool = False\n
+        _______________________________\n
+        Serves the financial statements from the local comp.funda mirror instead of WRDS.\n
+        The mirror is filled with sync_funda_mirror.\n
+        \n
+        store: Database_Query_Handler = None\n
+        _______________________________\n
+        Local store of the fundamentals (see database_query). The financial statements found in the store are read locally,
+        only the missing (ticker, year) are queried and every queried statement is written through to the store.\n
+        """
+        self.offline: bool = offline
+        self.store = store
         self.username: str = str(os.getenv("wrds_username", ""))
-        if not self.username:
+        if not self.username and not offline:
             raise ValueError("No username found in environment variables")
-        self.db = wrds.Connection(wrds_username = self.username,autoconnect=True)
+        # All handlers of the process share the connections, such that the authentication is only done once
+        self.pool = WRDS_Connection_Pool.shared(username = self.username, size = max_connections)
+        if WRDS_Query_Handler.security_master is None:
+            WRDS_Query_Handler.security_master = Security_Master(path = os.path.join(cache_dir, "security_master.csv"))
+        self.funda_mirror = Funda_Mirror(path = os.path.join(cache_dir, "funda_mirror"))
         pd.set_option('future.no_silent_downcasting', True)
 
-    def __del__(self)-> None:
-        if self.db:
-            self.db.close()
+    async def raw_sql(self, query: str)-> pd.DataFrame:
+        """
+        Runs the query on a connection of the pool without blocking the event loop"""
+        return await self.pool.async_raw_sql(query)
+
+    async def query_funda(self, columns: List[Tuple[str, str]], tickers: List[str], years: List[int], statement: str = None)-> pd.DataFrame:
+        """
+        Queries the columns of comp.funda for all tickers and years.\n
+        With a store, the (ticker, year) stored locally are read from the store and only the others are queried.\n
+        statement is the statement of the columns. If None, the columns are prefixed with their statement (see split_statements)"""
+        if self.store is None:
+            return await self.query_remote_funda(columns = columns, tickers = tickers, years = years)
+
+        key_names: List[str] = [name.lower() for _, name in KEY_COLUMNS]
+        statements: Dict[str, Dict[str, str]] = self.column_statements(columns = columns, statement = statement)
+        column_names: List[str] = [name.lower() for _, name in columns]
+
+        pairs: Set[Tuple[str, int]] = set(product(tickers, [int(year) for year in years]))
+
+        # Read the (ticker, year) with all statements stored
+        complete: Set[Tuple[str, int]] = set(pairs)
+        stored: pd.DataFrame = None
+        for statement_name, statement_fields in statements.items():
+            data: pd.DataFrame = self.store.read_statement(statement_name, tickers = tickers, years = years, fields = list(statement_fields))
+            data = data.rename(columns = statement_fields)
+            complete &= set(zip(data["ticker"], data["year"].astype(int)))
+            stored = data if stored is None else stored.merge(data, on = key_names)
+
+        stored = stored[pd.Series(list(zip(stored["ticker"], stored["year"].astype(int))), index = stored.index, dtype = object).isin(complete)]
+
+        missing: Set[Tuple[str, int]] = pairs - complete - self.store.known_missing(tickers = tickers, years = years)
+
+        if not missing:
+            return self.normalise_funda(stored, columns = columns)
+
+        fetched: pd.DataFrame = await self.query_remote_funda(columns = columns,
+                                                             tickers = sorted({ticker for ticker, _ in missing}),
+                                                             years = sorted({year for _, year in missing}))
+
+        found: Set[Tuple[str, int]] = set()
+        if not fetched.empty:
+            fetched.columns = [column.lower() for column in fetched.columns]
+            found = set(zip(fetched["ticker"], fetched["year"].astype(int)))
+
+            # Write through every statement of the fetched rows
+            for statement_name, statement_fields in statements.items():
+                self.store.write_statement(statement_name, fetched[key_names + list(statement_fields.values())].rename(columns = {column: field for field, column in statement_fields.items()}))
+
+            fetched = fetched[pd.Series(list(zip(fetched["ticker"], fetched["year"].astype(int))), index = fetched.index, dtype = object).isin(missing)]
+
+        self.store.mark_missing(missing - found)
+
+        # Empty frames are left out, such that they do not change the dtypes of the result
+        frames: List[pd.DataFrame] = [frame[key_names + column_names] for frame in (stored, fetched) if not frame.empty]
+        if not frames:
+            return self.normalise_funda(stored, columns = columns)
+
+        return self.normalise_funda(pd.concat(frames, ignore_index = True), columns = columns)
+
+    async def query_remote_funda(self, columns: List[Tuple[str, str]], tickers: List[str], years: List[int])-> pd.DataFrame:
+        """
+        Queries the columns of comp.funda for all tickers and years on WRDS.\n
+        In offline mode, the columns are read from the local mirror instead"""
+        if self.offline:
+            data: pd.DataFrame = await asyncio.to_thread(self.funda_mirror.statement, columns, tickers, years)
+        else:
+            data = await self.raw_sql(statement_query(columns = columns, tickers = tickers, years = years))
+
+        return self.normalise_funda(data, columns = columns)
+
+    @staticmethod
+    def normalise_funda(data: pd.DataFrame, columns: List[Tuple[str, str]])-> pd.DataFrame:
+        """
+        Returns the rows of comp.funda in the schema of the WRDS query, whether they were queried, read from the mirror or from the store:\n
+        lower case columns in the order of KEY_COLUMNS + columns without a name, integer years and dates as 'YYYY-MM-DD' strings"""
+        if data.empty and len(data.columns) == 0:
+            return data
+
+        names: List[str] = [name.lower() for _, name in KEY_COLUMNS + columns]
+
+        data = data.rename(columns = lambda column: str(column).lower())[names].reset_index(drop = True)
+        data.columns.name = None
+
+        data["date"] = pd.to_datetime(data["date"]).dt.strftime("%Y-%m-%d")
+        if not data["year"].isna().any():
+            data["year"] = data["year"].astype(int)
+
+        return data
+
+    @staticmethod
+    def column_statements(columns: List[Tuple[str, str]], statement: str = None)-> Dict[str, Dict[str, str]]:
+        """
+        Returns {statement: {field: column}} of the columns, with lower case names\n
+        If statement is None, the statement is taken from the prefix of the columns"""
+        statements: Dict[str, Dict[str, str]] = {}
+        for _, name in columns:
+            column: str = name.lower()
+            if statement is None:
+                statement_name, field = column.split(STATEMENT_PREFIX_SEPARATOR, 1)
+            else:
+                statement_name, field = statement, column
+            statements.setdefault(statement_name, {})[field] = column
+        return statements
+
+    def sync_funda_mirror(self)-> int:
+        """
+        Pulls the rows of comp.funda newer than the last sync into the local mirror\n
+        Returns the number of rows pulled"""
+        fields: List[str] = funda_fields([column for statement in FIELD_CATALOGUE for column in statement_columns(statement)])
+
+        return self.funda_mirror.sync(raw_sql = self.pool.raw_sql, fields = fields)
 
     @staticmethod
     def format(df: pd.DataFrame) -> pd.DataFrame:
@@ -101,18 +293,50 @@ class WRDS_Query_Handler():
         except ValueError:
             return pd.DataFrame()
 
-    def get_statement(self, function: Callable, ticker: str = None, year: int = None, tickers: List[str] = None, years: List[int] = None)-> pd.DataFrame:
+    def fetch_statement_data(self, function: Callable, ticker: str = None, year: int = None, tickers: List[str] = None, years: List[int] = None, statement_name: str = "Statement", windows: Dict[str, List[int]] = None)-> pd.DataFrame:
+        """
+        Fetches the unformated statement of all tickers and years with one query per chunk of tickers\n
+        Warns for every (ticker, year) that was not found.\n
+        If a single ticker and year is given, a ValueError is raised instead\n
+        windows maps every ticker to its own years (see fiscal_windows) and replaces tickers and years"""
+        if windows is not None:
+            tickers = list(windows)
+            years = sorted({int(year) for window in windows.values() for year in window})
+
         assert ticker or tickers, "No ticker provided"
         assert year or years, "No year provided"
 
-        if ticker and year: 
-            unformated_data: pd.DataFrame = asyncio.run(function(ticker, year))
+        single_request: bool = bool(ticker and year)
+
+        if ticker: tickers = [ticker]
+        if year: years = [year]
+
+        if isinstance(tickers, str): tickers = [tickers]
+        if isinstance(years, int): years = [years]
 
+        unformated_data: pd.DataFrame = self.aggregate_chunks(function = function, tickers = list(tickers), years = list(years))
+
+        # Case when not data was found
+        if unformated_data.empty and single_request:
+            raise ValueError(f"{statement_name} for {ticker} not found")
+
+        if windows is not None:
+            pairs: List[Tuple[str, int]] = [(ticker_, int(year_)) for ticker_, window in windows.items() for year_ in window]
+            if not unformated_data.empty:
+                in_window = pd.Series(list(zip(unformated_data["ticker"], unformated_data["year"].astype(int))), index = unformated_data.index).isin(pairs)
+                unformated_data = unformated_data[in_window]
         else:
-            if ticker: tickers = [ticker]
-            if year: years = [year]
+            pairs: List[Tuple[str, int]] = list(product(tickers, years))
+
+        self.warn_missing(data = unformated_data, pairs = pairs, statement_name = statement_name)
 
-            unformated_data: pd.DataFrame = self.aggregate_many_tickers(tickers = tickers, years = years, function = function)
+        return unformated_data
+
+    def get_statement(self, function: Callable, ticker: str = None, year: int = None, tickers: List[str] = None, years: List[int] = None, statement_name: str = "Statement")-> pd.DataFrame:
+        """
+        Fetches and formats the statement of all tickers and years, see fetch_statement_data"""
+
+        unformated_data: pd.DataFrame = self.fetch_statement_data(function = function, ticker = ticker, tickers = tickers, year = year, years = years, statement_name = statement_name)
 
         # Case when not data was found
         if unformated_data.empty:
@@ -122,19 +346,105 @@ class WRDS_Query_Handler():
 
         return formated_data
 
-    async def fetch_gvkey(self, ticker: str)-> int:
+    @staticmethod
+    def split_statements(data: pd.DataFrame)-> Dict[str, pd.DataFrame]:
         """
-        Async fetch for gvkey of certain ticker"""
+        Splits the result of the fused query into the unformated statements\n
+        Returns a dictionary of {statement: data}"""
+
+        key_names: List[str] = [name.lower() for _, name in KEY_COLUMNS]
+
+        statements: Dict[str, pd.DataFrame] = {}
 
-        query_find_gvkey = f"""
-        SELECT gvkey 
-        FROM comp.security where tic = '{ticker}' LIMIT 1
+        for statement in FIELD_CATALOGUE:
+            if data.empty:
+                statements[statement] = pd.DataFrame()
+                continue
+
+            prefix: str = f"{statement}{STATEMENT_PREFIX_SEPARATOR}".lower()
+            prefixed_columns: List[str] = [column for column in data.columns if column.startswith(prefix)]
+
+            # Case when no fields of the statement were queried
+            if not prefixed_columns:
+                statements[statement] = pd.DataFrame()
+                continue
+
+            statements[statement] = data[key_names + prefixed_columns].rename(columns = lambda column: column.removeprefix(prefix))
+
+        return statements
+
+    def aggregate_chunks(self, function: Callable, tickers: List[str], years: List[int])-> pd.DataFrame:
         """
+        Runs the set based query function for chunks of the tickers.\n
+        Every chunk is one query for all its tickers and all years"""
+
+        async def run_tasks():
 
-        gvkey_df: pd.DataFrame = self.db.raw_sql(query_find_gvkey)  
+            tasks = [task_wrapper(function, tickers_chunk, years) for tickers_chunk in chunks(tickers, self.MAX_TICKERS_PER_QUERY)]
 
-        if not gvkey_df.empty:
-            gvkey: str = gvkey_df.iloc[0]['gvkey']  # Extract the value from the DataFrame
+            return await asyncio.gather(*tasks, return_exceptions=True)
+
+        results: List[Union[pd.DataFrame, tuple]] = asyncio.run(run_tasks())
+
+        return_dfs: List[pd.DataFrame] = []
+
+        for result in results:
+            if isinstance(result, tuple):
+                exception: Exception = result[0]
+                args = result[1]
+                warnings.warn(f"\nRunning the code for {args} raised the following exception: \n{exception}")
+            elif isinstance(result, pd.DataFrame):
+                if not result.empty:
+                    return_dfs.append(result.fillna(0))
+            else:
+                raise TypeError(f"When trying to calculate {function}({tickers}, {years}), the unknown type {type(result)} was returnes")
+
+        if not return_dfs:
+            return pd.DataFrame()
+
+        return pd.concat(return_dfs, ignore_index=True)
+
+    def aggregate_tickers(self, function: Callable, tickers: List[str])-> pd.DataFrame:
+        """
+        Runs the set based query function for all tickers.\n
+        Warns for every ticker that could not be resolved to a gvkey"""
+
+        if isinstance(tickers, str): tickers = [tickers]
+
+        for ticker in set(tickers) - set(self.resolve_gvkeys(tickers)):
+            warnings.warn(f"\nRunning the code for {(ticker,)} raised the following exception: \nNo gvkey found for ticker {ticker}")
+
+        return asyncio.run(function(list(tickers)))
+
+    @staticmethod
+    def warn_missing(data: pd.DataFrame, pairs: List[Tuple[str, int]], statement_name: str)-> None:
+        """
+        Warns for every (ticker, year) pair that is not part of the data"""
+
+        found = set()
+        if not data.empty:
+            found = set(zip(data["ticker"], data["year"].astype(int)))
+
+        for ticker, year in pairs:
+            if (ticker, int(year)) not in found:
+                exception = ValueError(f"{statement_name} for {ticker} not found")
+                warnings.warn(f"\nRunning the code for {(ticker, year)} raised the following exception: \n{exception}")
+
+    def resolve_gvkeys(self, tickers: List[str])-> Dict[str, str]:
+        """
+        Returns a dictionary of {ticker: gvkey} served from the local security master\n
+        Tickers without gvkey are not part of the dictionary"""
+
+        return self.security_master.resolve(tickers = list(tickers), raw_sql = self.pool.raw_sql)
+
+    async def fetch_gvkey(self, ticker: str)-> str:
+        """
+        Async fetch for gvkey of certain ticker"""
+
+        gvkeys: Dict[str, str] = await asyncio.to_thread(self.resolve_gvkeys, [ticker])
+
+        if ticker in gvkeys:
+            gvkey: str = gvkeys[ticker]
         else:
             raise ValueError(f"No gvkey found for ticker {ticker}")
         
@@ -153,7 +463,7 @@ class WRDS_Query_Handler():
         """
 
         # Execute the query with parameters
-        naicsh: pd.DataFrame = self.db.raw_sql(query_naicsh)
+        naicsh: pd.DataFrame = await self.raw_sql(query_naicsh)
         if naicsh.empty:
             return None
         
@@ -171,154 +481,64 @@ class WRDS_Query_Handler():
         """
 
         # Execute the query with parameters
-        sich: pd.DataFrame = self.db.raw_sql(query_sich)
+        sich: pd.DataFrame = await self.raw_sql(query_sich)
 
         if sich.empty:
             return None
         
         return str(sich.iloc[0,0])
 
-    async def _income_statement(self, ticker: str, year: int)-> pd.DataFrame: 
+    async def _income_statement(self, tickers: List[str], years: List[int], fields: List[str] = None)-> pd.DataFrame: 
         """ 
-        async fetch for income statement of certain ticker and year
+        async fetch for income statements of all tickers and years in one query\n
+        Only selects the given fields of the catalogue, all fields if None
         """
 
-        query_income_statement = f"""
-        SELECT
-            fyear AS Year,
-            datadate AS Date,
-            sale as Revenues,
-            cogs as COGS,
-            (sale-cogs) as GrossMargin,
-            xsga as SellingGeneralAndAdministrativeExpense,
-            (oibdp - oiadp) as DepreciationAndAmortisation,
-            oiadp as OperatingIncome,
-            nopi as NonOperationalResult,
-            spi as SpecialItems,
-            (pi+xint) as EBIT,
-            (-xint) as NetInterest,
-            pi as EBT,
-            txt as Tax,
-            ib as IncomeBeforeExtraordinary,
-            tic as Ticker
-        FROM comp.funda
-        WHERE tic = '{ticker}'    -- Use placeholders for tickers
-        AND fyear = {year}    -- Use placeholders for years
-        AND indfmt = 'INDL'
-        AND datafmt = 'STD'
-        AND consol = 'C'
-        """
+        columns: List[Tuple[str, str]] = statement_columns("income_statement", fields = fields)
 
-        # Execute the query with parameters
-        raw_income_statement: pd.DataFrame = self.db.raw_sql(query_income_statement)
+        raw_income_statement: pd.DataFrame = await self.query_funda(columns = columns, tickers = tickers, years = years, statement = "income_statement")
 
-        if not raw_income_statement.empty:
-            return raw_income_statement
-        else:
-            raise ValueError(f"Income statement for {ticker} not found")
+        return raw_income_statement
 
-    async def _balance_sheet(self, ticker: str, year: int) -> pd.DataFrame:
+    async def _balance_sheet(self, tickers: List[str], years: List[int], fields: List[str] = None) -> pd.DataFrame:
         """
-        Async fetch for balance sheet data"""
+        Async fetch for balance sheet data of all tickers and years in one query\n
+        Only selects the given fields of the catalogue, all fields if None"""
 
-        query_balance_sheet = f"""
-        SELECT
-            fyear AS Year,
-            datadate AS Date,
-            tic as Ticker,
-            che as CashAndEquivalents,
-            rect as Receivables,
-            invt as Inventories,
-            aco as OtherCurrentAssets,
-            act as TotalCurrentAssets,
-            ppent as PropertyPlantEquipment,
-            dpact as CumulatedDepreciationAndAmortization,
-            ivaeq as InvestmentInEquity,
-            ivao as InvestmentOther,
-            intan as IntangibleAssets,
-            ao as OtherAssets,
-            at as TotalAssets,
-            dlc as CurrentDebt,
-            ap as TradePayables,
-            txp as TaxPayables,
-            lco as OtherCurrentLiabilities,
-            lct as TotalCurrentLiabilities,
-            dltt as LongTermDebt,
-            txditc as DeferredTaxesNonCurrent,
-            lo as OtherLiabilities,
-            lt as TotalLiabilities,
-            mib as NonControllingInterest,
-            pstk as PreferredStock,
-            ceq as CommonStock,
-            seq as StockholdersEquity
-        FROM comp.funda
-        WHERE tic = '{ticker}'    -- Use placeholders for tickers
-        AND fyear = {year}    -- Use placeholders for years
-        AND indfmt = 'INDL'
-        AND datafmt = 'STD'
-        AND consol = 'C'
-        """
-        # Execute the query with parameters
-        raw_balance_sheet: pd.DataFrame = self.db.raw_sql(query_balance_sheet)
+        columns: List[Tuple[str, str]] = statement_columns("balance_sheet", fields = fields)
 
-        if not raw_balance_sheet.empty:
-            return raw_balance_sheet
-        else:
-            raise ValueError(f"Balance Sheet for {ticker} not found")
+        raw_balance_sheet: pd.DataFrame = await self.query_funda(columns = columns, tickers = tickers, years = years, statement = "balance_sheet")
+
+        return raw_balance_sheet
     
-    async def _cash_flow_statement(self, ticker: str, year: int)-> pd.DataFrame:
+    async def _cash_flow_statement(self, tickers: List[str], years: List[int], fields: List[str] = None)-> pd.DataFrame:
+        """
+        Async fetch for cash flow statements of all tickers and years in one query\n
+        Only selects the given fields of the catalogue, all fields if None"""
 
-        query_cash_flow_statement = f"""
-        SELECT
-            fyear AS Year,
-            datadate AS Date,
-            tic as Ticker,
-            ibc as IncomeBeforeExtraordinary,
-            xidoc as ExtraordinaryItemsAndDiscontinued,
-            dpc as DepreciationAndAmortization,
-            txdc as DeferredTaxes,
-            esub as EquityEarningsUnconsolidated,
-            sppiv as NetResultSalePPE,
-            fopo as OtherFundsOperations,
-            (-recch) as IncreaseAccountReceivable,
-            (-invch) as IncreaseInventory,
-            apalch as IncreaseAccountsPayable,
-            txach as IncreaseAccruedTaxes,
-            aoloch as NetChangeOtherAssetsLiabilities,
-            oancf as OperatingCashFlow,
-            ivch as IncreaseInvestments,
-            siv as SaleInvestments,
-            ivstch as ChangeShortTermInvestment,
-            capx as CapEX,
-            sppe as SaleOfProperty,
-            aqc as Aquisitions,
-            ivaco as OtherInvestingActivities,
-            ivncf as InvestingCashFlow,
-            sstk as EquityIncrease,
-            txbcof as TaxBenefitStockOptions,
-            prstkc as EquityDecrease,
-            dv as Dividend,
-            dltis as LongTermDebIssunace,
-            dltr as LongTermDebtReduction,
-            dlcch as CurrentDebtChange,
-            fiao as OtherFinanciangActivities,
-            fincf as FinancingCashFlow,
-            (fincf + ivncf + oancf) as NetChangeCash
-        FROM comp.funda
-        WHERE tic = '{ticker}'    -- Use placeholders for tickers
-        AND fyear = {year}    -- Use placeholders for years
-        AND indfmt = 'INDL'
-        AND datafmt = 'STD'
-        AND consol = 'C'
+        columns: List[Tuple[str, str]] = statement_columns("cash_flow_statement", fields = fields)
+
+        cash_flow_statement: pd.DataFrame = await self.query_funda(columns = columns, tickers = tickers, years = years, statement = "cash_flow_statement")
+
+        return cash_flow_statement
+
+    async def _financial_statements(self, tickers: List[str], years: List[int], fields: Dict[str, List[str]] = None)-> pd.DataFrame:
         """
+        Async fetch for all three financial statements of all tickers and years in a single scan of comp.funda\n
+        The columns are prefixed with the name of their statement, see split_statements\n
+        fields maps the statements to the fields to select. Statements not part of fields are not selected.
+        If fields is None, all fields of all statements are selected"""
 
-        # Execute the query with parameters
-        cash_flow_statement: pd.DataFrame = self.db.raw_sql(query_cash_flow_statement)
+        if fields is None:
+            fields = {statement: None for statement in FIELD_CATALOGUE}
 
-        if not cash_flow_statement.empty:
-            return cash_flow_statement
-        else:
-            raise ValueError(f"Cash flow statement for {ticker} not found") 
+        columns: List[Tuple[str, str]] = [(expression, f"{statement}{STATEMENT_PREFIX_SEPARATOR}{name}")
+                                          for statement, statement_fields in fields.items()
+                                          for expression, name in statement_columns(statement, fields = statement_fields)]
+
+        financial_statements: pd.DataFrame = await self.query_funda(columns = columns, tickers = tickers, years = years)
+
+        return financial_statements
 
     async def _businessdescription(self, ticker:str)->pd.DataFrame:
         """
@@ -335,7 +555,7 @@ class WRDS_Query_Handler():
         """
 
         # Execute the query with parameters
-        description: pd.DataFrame = self.db.raw_sql(query_description)
+        description: pd.DataFrame = await self.raw_sql(query_description)
 
         if not description.empty:
             description["Ticker"] = ticker
@@ -343,6 +563,94 @@ class WRDS_Query_Handler():
         else:
             raise ValueError(f"Company description for {ticker} not found") 
 
+    async def _businessdescriptions(self, tickers: List[str])-> pd.DataFrame:
+        """
+        Async fetch for the company descriptions of all tickers in one query joined on gvkey"""
+
+        gvkeys: Dict[str, str] = await asyncio.to_thread(self.resolve_gvkeys, tickers)
+
+        if not gvkeys:
+            return pd.DataFrame()
+
+        query_descriptions = f"""
+        SELECT DISTINCT ON (gvkey)
+            gvkey,
+            busdescl as BusinessDescription
+        FROM comp.co_busdescl
+        WHERE gvkey IN ({sql_list(gvkeys.values())})
+        """
+
+        descriptions: pd.DataFrame = await self.raw_sql(query_descriptions)
+
+        return self.gvkeys_to_tickers(data = descriptions, gvkeys = gvkeys)
+
+    async def _industries(self, tickers: List[str])-> pd.DataFrame:
+        """
+        Async fetch for the industries of all tickers in one query joined on gvkey\n
+        Uses the latest North American Industry Classification of every company"""
+
+        gvkeys: Dict[str, str] = await asyncio.to_thread(self.resolve_gvkeys, tickers)
+
+        if not gvkeys:
+            return pd.DataFrame()
+
+        query_industries = f"""
+        SELECT DISTINCT ON (co_industry.gvkey)
+            co_industry.gvkey,
+            r_naiccd.naicsdesc as SectorDescription
+        FROM comp.co_industry AS co_industry
+        JOIN comp.r_naiccd AS r_naiccd ON r_naiccd.naicscd = co_industry.naicsh
+        WHERE co_industry.gvkey IN ({sql_list(gvkeys.values())})
+        AND co_industry.consol = 'C'
+        ORDER BY co_industry.gvkey, co_industry.datadate DESC
+        """
+
+        industries: pd.DataFrame = await self.raw_sql(query_industries)
+
+        return self.gvkeys_to_tickers(data = industries, gvkeys = gvkeys)
+
+    async def _industry_codes(self, tickers: List[str])-> pd.DataFrame:
+        """
+        Async fetch for the latest Standard Industrial Classification and North American Industry Classification codes
+        of all tickers in one query joined on gvkey"""
+
+        gvkeys: Dict[str, str] = await asyncio.to_thread(self.resolve_gvkeys, tickers)
+
+        if not gvkeys:
+            return pd.DataFrame()
+
+        query_industry_codes = f"""
+        SELECT DISTINCT ON (gvkey)
+            gvkey,
+            sich as Sic,
+            naicsh as Naics
+        FROM comp.co_industry
+        WHERE gvkey IN ({sql_list(gvkeys.values())})
+        AND consol = 'C'
+        ORDER BY gvkey, datadate DESC
+        """
+
+        industry_codes: pd.DataFrame = await self.raw_sql(query_industry_codes)
+
+        return self.gvkeys_to_tickers(data = industry_codes, gvkeys = gvkeys)
+
+    @staticmethod
+    def gvkeys_to_tickers(data: pd.DataFrame, gvkeys: Dict[str, str])-> pd.DataFrame:
+        """
+        Replaces the gvkey column of the data by the Ticker column\n
+        Warns for every ticker that is not part of the data"""
+
+        tickers_of_gvkeys: Dict[str, List[str]] = {}
+        for ticker, gvkey in gvkeys.items():
+            tickers_of_gvkeys.setdefault(gvkey, []).append(ticker)
+
+        data = data.assign(Ticker = data["gvkey"].map(tickers_of_gvkeys)).explode("Ticker").drop(columns = "gvkey")
+
+        for ticker in set(gvkeys) - set(data["Ticker"]):
+            warnings.warn(f"\nRunning the code for {(ticker,)} raised the following exception: \nNo data found for gvkey {gvkeys[ticker]}")
+
+        return data.reset_index(drop = True)
+
     async def _industry(self, ticker:str)-> pd.DataFrame:
 
         naics = await self.fetch_naicsh(ticker = ticker)
@@ -359,7 +667,7 @@ class WRDS_Query_Handler():
         """
 
         # Execute the query with parameters
-        industry: pd.DataFrame = self.db.raw_sql(query_industry)
+        industry: pd.DataFrame = await self.raw_sql(query_industry)
 
         if not industry.empty:
             industry["Ticker"] = ticker
@@ -381,31 +689,187 @@ class WRDS_Query_Handler():
         LIMIT 1
         """
 
-        credit_rating: pd.DataFrame = self.db.raw_sql(query_credit_rating)
+        credit_rating: pd.DataFrame = await self.raw_sql(query_credit_rating)
 
         return credit_rating
 
-    def income_statement(self, ticker: str = None, year: int = None, tickers: List[str] = None, years: List[int] = None)-> pd.DataFrame:
+    def income_statement(self, ticker: str = None, year: int = None, tickers: List[str] = None, years: List[int] = None, fields: List[str] = None)-> pd.DataFrame:
         """
         Returns financial income statement in simplified version
-        All values in Million USD""" 
+        All values in Million USD\n
+        All tickers and years are fetched with a single query\n
+        Only the given fields of the field catalogue are queried, all fields if None""" 
 
-        return self.get_statement(function = self._income_statement, ticker = ticker, tickers = tickers, year = year, years = years)
+        return self.get_statement(function = functools.partial(self._income_statement, fields = fields), ticker = ticker, tickers = tickers, year = year, years = years, statement_name = "Income statement")
 
-    def balance_sheet(self, ticker: str = None, year: int = None, tickers: List[str] = None, years: List[int] = None)-> pd.DataFrame:
+    def balance_sheet(self, ticker: str = None, year: int = None, tickers: List[str] = None, years: List[int] = None, fields: List[str] = None)-> pd.DataFrame:
         """
         Returns financial balance sheet in simplified version
-        All values in Million USD""" 
+        All values in Million USD\n
+        All tickers and years are fetched with a single query\n
+        Only the given fields of the field catalogue are queried, all fields if None""" 
 
         
-        return self.get_statement(function = self._balance_sheet, ticker = ticker, tickers = tickers, year = year, years = years)
+        return self.get_statement(function = functools.partial(self._balance_sheet, fields = fields), ticker = ticker, tickers = tickers, year = year, years = years, statement_name = "Balance Sheet")
 
-    def cash_flow_statement(self, ticker: str = None, year: int = None, tickers: List[str] = None, years: List[int] = None)-> pd.DataFrame:
+    def cash_flow_statement(self, ticker: str = None, year: int = None, tickers: List[str] = None, years: List[int] = None, fields: List[str] = None)-> pd.DataFrame:
         """
         Returns a cash flow statement in simplified version
-        All values in Million USD"""
+        All values in Million USD\n
+        All tickers and years are fetched with a single query\n
+        Only the given fields of the field catalogue are queried, all fields if None"""
+
+        return self.get_statement(function = functools.partial(self._cash_flow_statement, fields = fields), ticker = ticker, tickers = tickers, year = year, years = years, statement_name = "Cash flow statement")
 
-        return self.get_statement(function = self._cash_flow_statement, ticker = ticker, tickers = tickers, year = year, years = years)
+    def financial_statements(self, ticker: str = None, year: int = None, tickers: List[str] = None, years: List[int] = None, fields: Dict[str, List[str]] = None, windows: Dict[str, List[int]] = None)-> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+        """
+        Returns (balance_sheet, income_statement, cash_flow_statement) in simplified version
+        All values in Million USD\n
+        All three statements are fetched in a single scan of comp.funda for all tickers and years\n
+        fields maps the statements to the fields of the field catalogue to query, e.g. {"income_statement": ["Revenues"]}.\n
+        Statements not part of fields are returned empty. All fields are queried if fields is None\n
+        windows maps every ticker to its own years, e.g. the result of fiscal_windows. Replaces tickers and years"""
+
+        unformated_data: pd.DataFrame = self.fetch_statement_data(function = functools.partial(self._financial_statements, fields = fields), ticker = ticker, tickers = tickers, year = year, years = years, statement_name = "Financial statements", windows = windows)
+
+        statements: Dict[str, pd.DataFrame] = self.split_statements(unformated_data)
+
+        formated_statements: List[pd.DataFrame] = [statement if statement.empty else self.format(statement) for statement in statements.values()]
+
+        return tuple(formated_statements)
+
+    async def _latest_fiscal_year(self, tickers: List[str])-> pd.DataFrame:
+        """
+        Async fetch for the latest fiscal year with financial statements of every ticker"""
+        if self.offline:
+            return await asyncio.to_thread(self.funda_mirror.latest_fiscal_years, tickers)
+
+        query_latest_fiscal_year = f"""
+        SELECT
+            tic as Ticker,
+            MAX(fyear) as Year
+        FROM comp.funda
+        WHERE tic IN ({sql_list(tickers)})
+        AND fyear IS NOT NULL
+        AND indfmt = 'INDL'
+        AND datafmt = 'STD'
+        AND consol = 'C'
+        GROUP BY tic
+        """
+
+        return await self.raw_sql(query_latest_fiscal_year)
+
+    def latest_fiscal_year(self, ticker: str = None, tickers: List[str] = None)-> Dict[str, int]:
+        """
+        Returns a dictionary of {ticker: latest fiscal year} of the available financial statements\n
+        Tickers without any financial statements are not part of the dictionary"""
+        assert ticker or tickers, "No ticker provided"
+        if ticker: tickers = [ticker]
+        if isinstance(tickers, str): tickers = [tickers]
+
+        async def run_tasks():
+            tasks = [self._latest_fiscal_year(tickers_chunk) for tickers_chunk in chunks(list(tickers), self.MAX_TICKERS_PER_QUERY)]
+            return await asyncio.gather(*tasks)
+
+        results: List[pd.DataFrame] = asyncio.run(run_tasks())
+
+        latest_years: Dict[str, int] = {}
+        for result in results:
+            latest_years.update({str(ticker_): int(year_) for ticker_, year_ in zip(result["ticker"], result["year"])})
+
+        return latest_years
+
+    def fiscal_windows(self, tickers: List[str], number_years: int, max_year: int = None)-> Dict[str, List[int]]:
+        """
+        Returns a dictionary of {ticker: [latest fiscal year, ..., latest fiscal year - number_years + 1]}\n
+        The latest fiscal year is found per ticker, such that peers with different fiscal calendars get their own window.\n
+        max_year caps the latest year, e.g. to the latest year of the valued company"""
+
+        latest_years: Dict[str, int] = self.latest_fiscal_year(tickers = tickers)
+
+        windows: Dict[str, List[int]] = {}
+        for ticker_, latest_year in latest_years.items():
+            if max_year is not None:
+                latest_year = min(latest_year, max_year)
+            windows[ticker_] = [latest_year - i for i in range(number_years)]
+
+        return windows
+
+    def iter_statements(self, statement: str, tickers: List[str], years: List[int], fields: List[str] = None, chunksize: int = 50_000, checkpoint: str = None, progress: Callable[[int, int], None] = None)-> Iterator[pd.DataFrame]:
+        """
+        Streams the statement of a large universe of tickers in chunks of at most chunksize rows.\n
+        Memory use stays flat, such that every chunk can be written to a sink (e.g. Parquet, SQLite) before the next one is fetched.\n
+        \n
+        Args:\n
+        \n
+        statement: str\n
+        _______________________________\n
+        Statement of the field catalogue, e.g. "income_statement".\n
+        \n
+        fields: List[str] = None\n
+        _______________________________\n
+        Fields of the statement to query. All fields if None.\n
+        \n
+        chunksize: int = 50_000\n
+        _______________________________\n
+        Maximum number of rows per chunk. Rows are streamed with a server side cursor.\n
+        \n
+        checkpoint: str = None\n
+        _______________________________\n
+        Path of a checkpoint file. The tickers are queried in batches of MAX_TICKERS_PER_QUERY and every
+        completely consumed batch is recorded. Running the same request again resumes after the last recorded batch.\n
+        A batch that was interrupted in the middle is streamed again.\n
+        \n
+        progress: Callable[[int, int], None] = None\n
+        _______________________________\n
+        Called with (number of tickers done, number of tickers) after every batch.\n
+        \n
+        Returns:\n
+        \n
+        Iterator[pd.DataFrame]\n
+        _______________________________\n
+        Unformated chunks with one row per (ticker, year). Missing values are kept as NaN.\n
+        \n
+        Every batch is streamed on a dedicated WRDS connection (see WRDS_Connection_Pool.stream_sql), which is held until
+        the batch is consumed. Close the iterator (close() or a with contextlib.closing block) if it is not consumed to the
+        end, such that the connection is released right away.\n
+        """
+
+        columns: List[Tuple[str, str]] = statement_columns(statement, fields = fields)
+
+        if isinstance(tickers, str): tickers = [tickers]
+        tickers = list(tickers)
+        years = [int(year) for year in years]
+        total: int = len(tickers)
+
+        backfill_checkpoint: Backfill_Checkpoint = None
+        if checkpoint:
+            backfill_checkpoint = Backfill_Checkpoint(path = checkpoint)
+            request: dict = {"statement": statement, "fields": fields, "years": sorted(years)}
+            tickers = backfill_checkpoint.start(request = request, tickers = tickers)
+
+        done: int = total - len(tickers)
+
+        for tickers_chunk in chunks(tickers, self.MAX_TICKERS_PER_QUERY):
+            if self.offline:
+                data: pd.DataFrame = self.funda_mirror.statement(columns, tickers_chunk, years)
+                stream: Iterator[pd.DataFrame] = (data.iloc[start:start + chunksize] for start in range(0, len(data), chunksize))
+            else:
+                stream: Iterator[pd.DataFrame] = self.pool.stream_sql(statement_query(columns = columns, tickers = tickers_chunk, years = years), chunksize = chunksize)
+
+            try:
+                for chunk in stream:
+                    yield chunk
+            finally:
+                # Releases the connection of the stream when the caller abandons the iterator
+                stream.close()
+
+            # Only reached once the caller consumed every chunk of the batch
+            done += len(tickers_chunk)
+            if backfill_checkpoint:
+                backfill_checkpoint.mark_done(tickers_chunk)
+            if progress:
+                progress(done, total)
 
     def company_description(self, ticker: str = None, tickers: List[str] = None)-> pd.DataFrame:
         """
@@ -415,7 +879,7 @@ class WRDS_Query_Handler():
         if ticker: 
             return asyncio.run(self._businessdescription(ticker = ticker))
         else:
-            return self.aggregate_many_tickers(self._businessdescription, tickers = tickers)
+            return self.aggregate_tickers(self._businessdescriptions, tickers = tickers)
         
     def industry(self, ticker: str = None, tickers: List[str] = None)-> pd.DataFrame:
         """
@@ -425,7 +889,12 @@ class WRDS_Query_Handler():
         if ticker: 
             return asyncio.run(self._industry(ticker = ticker))
         else:
-            return self.aggregate_many_tickers(self._industry, tickers = tickers)
+            return self.aggregate_tickers(self._industries, tickers = tickers)
+
+    def industry_codes(self, tickers: List[str])-> pd.DataFrame:
+        """
+        Returns the latest SIC and NAICS codes of the companies with the columns sic, naics and Ticker"""
+        return self.aggregate_tickers(self._industry_codes, tickers = tickers)
 
     @deprecated
     def credit_rating(self,ticker:str)->str:
@@ -0,0 +1,212 @@
+import numpy as np
+import pandas as pd
+import json
+import os
+import threading
+from datetime import date, datetime
+from typing import Callable, Dict, List, Union
+
+# Support running the module as a script from the Makefile
+try:
+    from .price_store import Date_Range, merge_ranges, missing_ranges
+except ImportError:
+    from price_store import Date_Range, merge_ranges, missing_ranges
+
+
+def to_date(day: Union[date, datetime, str, pd.Timestamp])-> date:
+    if isinstance(day, pd.Timestamp): return day.date()
+    if isinstance(day, datetime): return day.date()
+    if isinstance(day, str): return date.fromisoformat(day)
+    return day
+
+
+class Close_Store():
+    """
+    Array backed store of daily closing prices for long histories of many tickers.\n
+    All tickers share one date index of business days starting at the base date, such that the position of a date is
+    calculated and never looked up. Every ticker is one contiguous column in its own memory mapped file.
+    Days without a price (e.g. holidays) are NaN.\n
+    Slices of the closing prices are served as read only views of the memory mapped files, without copying or loading the
+    whole history.\n
+    \n
+    args:\n
+    _______________________________\n
+    path: str\n
+    _______________________________\n
+    Directory of the store.\n
+    \n
+    base: date = 1990-01-01\n
+    _______________________________\n
+    First date of the index. Earlier prices are not stored.\n
+    \n
+    dtype: str = "float64"\n
+    _______________________________\n
+    Type of the stored prices. float32 halves the size of the files.\n
+    """
+
+    METADATA_FILE: str = "metadata.json"
+
+    # Number of business days added to all files at once when the index grows
+    GROWTH: int = 2_600
+
+    def __init__(self, path: str, base: date = date(1990, 1, 1), dtype: str = "float64")-> None:
+        self.path: str = path
+        self.metadata_path: str = os.path.join(path, self.METADATA_FILE)
+
+        self.base: np.datetime64 = np.busday_offset(np.datetime64(base, "D"), 0, roll = "forward")
+        self.dtype: np.dtype = np.dtype(dtype)
+        self.capacity: int = 0
+        self.coverage: Dict[str, List[Date_Range]] = {}
+
+        self._columns: Dict[str, np.ndarray] = {}
+        self._lock = threading.RLock()
+
+        if os.path.exists(self.metadata_path):
+            with open(self.metadata_path, "r") as file:
+                metadata: dict = json.load(file)
+            self.base = np.datetime64(metadata["base"], "D")
+            self.dtype = np.dtype(metadata["dtype"])
+            self.capacity = metadata["capacity"]
+            self.coverage = {ticker: [(date.fromisoformat(start), date.fromisoformat(end)) for start, end in ranges]
+                             for ticker, ranges in metadata["coverage"].items()}
+
+    @property
+    def tickers(self)-> List[str]:
+        return list(self.coverage)
+
+    def _save(self)-> None:
+        os.makedirs(self.path, exist_ok = True)
+        metadata: dict = {
+            "base": str(self.base),
+            "dtype": self.dtype.name,
+            "capacity": self.capacity,
+            "coverage": {ticker: [(start.isoformat(), end.isoformat()) for start, end in ranges] for ticker, ranges in self.coverage.items()},
+        }
+        temporary_path: str = f"{self.metadata_path}.tmp"
+        with open(temporary_path, "w") as file:
+            json.dump(metadata, file, indent = 4)
+        os.replace(temporary_path, self.metadata_path)
+
+    def _column_path(self, ticker: str)-> str:
+        return os.path.join(self.path, f"{ticker.replace(os.sep, '_')}.{self.dtype.name}")
+
+    def position(self, day: Union[date, str])-> int:
+        """
+        Returns the position of the first business day on or after the day in the date index"""
+        return int(np.busday_count(self.base, np.busday_offset(np.datetime64(to_date(day), "D"), 0, roll = "forward")))
+
+    def dates(self, start: Union[date, str], end: Union[date, str])-> np.ndarray:
+        """
+        Returns the date index of [start, end)"""
+        start_position: int = max(self.position(start), 0)
+        end_position: int = max(self.position(end), start_position)
+        return np.busday_offset(self.base, np.arange(start_position, end_position))
+
+    def _grow(self, length: int)-> None:
+        """
+        Grows all columns with NaN, such that the index holds at least length days"""
+        if length <= self.capacity:
+            return
+
+        capacity: int = max(length, self.capacity + self.GROWTH)
+        missing_bytes: bytes = np.full(capacity - self.capacity, np.nan, dtype = self.dtype).tobytes()
+
+        for ticker in self.coverage:
+            with open(self._column_path(ticker), "ab") as file:
+                file.write(missing_bytes)
+
+        self.capacity = capacity
+        self._columns = {}
+
+    def _column(self, ticker: str)-> np.ndarray:
+        if self.capacity == 0:
+            return np.empty(0, dtype = self.dtype)
+        if ticker not in self._columns:
+            self._columns[ticker] = np.memmap(self._column_path(ticker), dtype = self.dtype, mode = "r", shape = (self.capacity,))
+        return self._columns[ticker]
+
+    def missing(self, ticker: str, start: date, end: date)-> List[Date_Range]:
+        """
+        Returns the date ranges of [start, end) not yet written for the ticker"""
+        return missing_ranges(self.coverage.get(ticker, []), to_date(start), to_date(end))
+
+    def write(self, ticker: str, closes: pd.Series, start: date, end: date, covered: List[Date_Range] = None)-> None:
+        """
+        Writes the closing prices of [start, end) of the ticker into its column.\n
+        covered are the ranges of [start, end) that are complete and not written again, all of [start, end) if None"""
+        start, end = to_date(start), to_date(end)
+        if covered is None:
+            covered = [(start, end)]
+
+        with self._lock:
+            os.makedirs(self.path, exist_ok = True)
+
+            if ticker not in self.coverage:
+                with open(self._column_path(ticker), "wb") as file:
+                    file.write(np.full(self.capacity, np.nan, dtype = self.dtype).tobytes())
+                self.coverage[ticker] = []
+
+            closes = closes.dropna()
+            closes = closes[closes.index >= pd.Timestamp(self.base)]
+
+            if not closes.empty:
+                positions: np.ndarray = np.busday_count(self.base, closes.index.values.astype("datetime64[D]"))
+                self._grow(int(positions.max()) + 1)
+
+                column = np.memmap(self._column_path(ticker), dtype = self.dtype, mode = "r+", shape = (self.capacity,))
+                column[positions] = closes.to_numpy(dtype = self.dtype)
+                column.flush()
+                del column
+                self._columns.pop(ticker, None)
+
+            # Prices of today may still change, such that today is written again on the next request
+            covered = [(to_date(covered_start), min(to_date(covered_end), date.today())) for covered_start, covered_end in covered]
+            self.coverage[ticker] = merge_ranges(self.coverage[ticker] + [(covered_start, covered_end) for covered_start, covered_end in covered if covered_start < covered_end])
+
+            self._save()
+
+    def close(self, ticker: str, start: Union[date, str], end: Union[date, str])-> np.ndarray:
+        """
+        Returns the closing prices of the ticker in [start, end) as a read only view of its memory mapped column.\n
+        The values align with dates(start, end). Dates after the stored ones are left out"""
+        if ticker not in self.coverage:
+            raise KeyError(f"The ticker {ticker} is not part of the close store")
+
+        with self._lock:
+            start_position: int = min(max(self.position(start), 0), self.capacity)
+            end_position: int = min(max(self.position(end), start_position), self.capacity)
+            return self._column(ticker)[start_position:end_position]
+
+    def fill(self, tickers: List[str], start: Union[date, str], end: Union[date, str],
+             prices: Callable[[List[str], date, date], pd.DataFrame],
+             missing: Callable[[str, date, date], List[Date_Range]] = None)-> None:
+        """
+        Writes the missing closing prices of the tickers in [start, end).\n
+        prices(tickers, start, end) returns the daily prices with the columns (Price, Ticker), like the price store.\n
+        missing(ticker, start, end) returns the ranges the source of the prices could not provide (e.g. failed downloads),
+        like Price_Store.missing. These ranges are not marked as written, such that they are read again on the next fill.
+        Tickers without any prices are never marked as written"""
+        start, end = to_date(start), to_date(end)
+
+        # Group the tickers by their missing ranges to read them together
+        reads: Dict[Date_Range, List[str]] = {}
+        for ticker in tickers:
+            for missing_range in self.missing(ticker, start, end):
+                reads.setdefault(missing_range, []).append(ticker)
+
+        for (missing_start, missing_end), missing_tickers in reads.items():
+            missing_prices: pd.DataFrame = prices(missing_tickers, missing_start, missing_end)
+
+            for ticker in missing_tickers:
+                if missing_prices.empty or ticker not in missing_prices["Close"].columns:
+                    continue
+
+                closes: pd.Series = missing_prices["Close"][ticker]
+                if closes.dropna().empty:
+                    continue
+
+                # Only the ranges the source has complete are marked as written
+                source_missing: List[Date_Range] = missing(ticker, missing_start, missing_end) if missing is not None else []
+                covered: List[Date_Range] = missing_ranges(source_missing, missing_start, missing_end)
+
+                self.write(ticker, closes, missing_start, missing_end, covered = covered)
@@ -0,0 +1,143 @@
+import yfinance as yf
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+
+class Ticker_Info_Cache():
+    """
+    Cache of yf.Ticker(ticker).info keyed by ticker.\n
+    Entries expire after the ttl. If a path is given, the cache is backed by a JSON file and survives restarts.\n
+    Concurrent requests of the same ticker only fetch the info once.\n
+    \n
+    args:\n
+    _______________________________\n
+    ttl: timedelta = 12 hours\n
+    _______________________________\n
+    Time after which an entry is fetched again.\n
+    \n
+    path: str = None\n
+    _______________________________\n
+    JSON file backing the cache. Only kept in memory if None.\n
+    \n
+    max_workers: int = 8\n
+    _______________________________\n
+    Number of concurrent requests of prefetch.\n
+    """
+
+    def __init__(self, ttl: timedelta = timedelta(hours = 12), path: Optional[str] = None, max_workers: int = 8)-> None:
+        self.ttl: timedelta = ttl
+        self.path: Optional[str] = path
+        self.max_workers: int = max_workers
+
+        # ticker -> (fetched_at, info)
+        self._entries: Dict[str, Tuple[datetime, dict]] = {}
+        self._loaded: bool = False
+
+        self._lock = threading.Lock()
+        self._ticker_locks: Dict[str, threading.Lock] = {}
+
+    def _load(self)-> None:
+        """
+        Loads the entries of the JSON file on first use"""
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+
+            if not self.path or not os.path.exists(self.path):
+                return
+
+            try:
+                with open(self.path, "r") as file:
+                    entries: dict = json.load(file)
+            except (OSError, json.JSONDecodeError):
+                return
+
+            for ticker, entry in entries.items():
+                self._entries[ticker] = (datetime.fromisoformat(entry["fetched_at"]), entry["info"])
+
+    def _save(self)-> None:
+        if not self.path:
+            return
+
+        with self._lock:
+            entries: dict = {ticker: {"fetched_at": fetched_at.isoformat(), "info": info} for ticker, (fetched_at, info) in self._entries.items()}
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok = True)
+        temporary_path: str = f"{self.path}.tmp"
+        with open(temporary_path, "w") as file:
+            json.dump(entries, file, default = str)
+        os.replace(temporary_path, self.path)
+
+    def _fresh(self, ticker: str, ttl: Optional[timedelta] = None)-> Optional[dict]:
+        entry = self._entries.get(ticker)
+        if entry is None:
+            return None
+        fetched_at, info = entry
+        if datetime.now() - fetched_at > (ttl or self.ttl):
+            return None
+        return info
+
+    def _ticker_lock(self, ticker: str)-> threading.Lock:
+        with self._lock:
+            return self._ticker_locks.setdefault(ticker, threading.Lock())
+
+    def _fetch(self, ticker: str, ttl: Optional[timedelta] = None)-> dict:
+        """
+        Fetches the info of the ticker, unless another thread fetched it in the meantime"""
+        with self._ticker_lock(ticker):
+            info = self._fresh(ticker, ttl)
+            if info is not None:
+                return info
+
+            info = yf.Ticker(ticker).info or {}
+            with self._lock:
+                self._entries[ticker] = (datetime.now(), info)
+            return info
+
+    def get(self, ticker: str)-> dict:
+        """
+        Returns the info of the ticker. Only fetched if not cached or expired"""
+        self._load()
+
+        info = self._fresh(ticker)
+        if info is not None:
+            return info
+
+        info = self._fetch(ticker)
+        self._save()
+        return info
+
+    def prefetch(self, tickers: List[str], ttl: Optional[timedelta] = None)-> Dict[str, dict]:
+        """
+        Fills the cache for all tickers concurrently.\n
+        A ttl shorter than the one of the cache refetches entries older than it, e.g. for current prices.\n
+        Returns a dictionary of {ticker: info}. Tickers that could not be fetched are left out"""
+        self._load()
+
+        missing: List[str] = [ticker for ticker in dict.fromkeys(tickers) if self._fresh(ticker, ttl) is None]
+
+        if missing:
+            with ThreadPoolExecutor(max_workers = min(self.max_workers, len(missing))) as executor:
+                futures = {ticker: executor.submit(self._fetch, ticker, ttl) for ticker in missing}
+            for future in futures.values():
+                # Errors are isolated per ticker, the info is then fetched again on the next get
+                future.exception()
+            self._save()
+
+        return {ticker: self._fresh(ticker, ttl) for ticker in tickers if self._fresh(ticker, ttl) is not None}
+
+    def invalidate(self, ticker: Optional[str] = None)-> None:
+        """
+        Removes the ticker from the cache, or all tickers if None"""
+        self._load()
+        with self._lock:
+            if ticker is None:
+                self._entries = {}
+            else:
+                self._entries.pop(ticker, None)
+        self._save()
@@ -0,0 +1,284 @@
+import pandas as pd
+import json
+import os
+import threading
+from datetime import date, datetime, timedelta
+from pandas.tseries.holiday import (AbstractHolidayCalendar, GoodFriday, Holiday, USLaborDay, USMartinLutherKingJr,
+                                    USMemorialDay, USPresidentsDay, USThanksgivingDay, nearest_workday, sunday_to_monday)
+from pandas.tseries.offsets import CustomBusinessDay
+from typing import Callable, Dict, List, Set, Tuple
+
+
+# Date ranges as (start, end) with an exclusive end, like yf.download
+Date_Range = Tuple[date, date]
+
+
+class NYSE_Holiday_Calendar(AbstractHolidayCalendar):
+    """
+    Regular holidays of the New York Stock Exchange"""
+    rules = [
+        # The exchange does not close on the Friday before a New Years Day on a Saturday
+        Holiday("New Years Day", month = 1, day = 1, observance = sunday_to_monday),
+        USMartinLutherKingJr,
+        USPresidentsDay,
+        GoodFriday,
+        USMemorialDay,
+        Holiday("Juneteenth", month = 6, day = 19, start_date = "2022-01-01", observance = nearest_workday),
+        Holiday("Independence Day", month = 7, day = 4, observance = nearest_workday),
+        USLaborDay,
+        USThanksgivingDay,
+        Holiday("Christmas", month = 12, day = 25, observance = nearest_workday),
+    ]
+
+
+trading_day = CustomBusinessDay(calendar = NYSE_Holiday_Calendar())
+
+
+def has_trading_days(start: date, end: date)-> bool:
+    """
+    Returns True if [start, end) contains a trading day, i.e. a weekday that is not a holiday of the exchange"""
+    return start < end and pd.date_range(start, end, freq = trading_day, inclusive = "left").size > 0
+
+
+def merge_ranges(ranges: List[Date_Range])-> List[Date_Range]:
+    """
+    Merges overlapping and adjacent date ranges"""
+    merged: List[Date_Range] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def missing_ranges(covered: List[Date_Range], start: date, end: date)-> List[Date_Range]:
+    """
+    Returns the parts of [start, end) not covered by the ranges"""
+    missing: List[Date_Range] = []
+    current: date = start
+    for covered_start, covered_end in merge_ranges(covered):
+        if covered_end <= current:
+            continue
+        if covered_start >= end:
+            break
+        if covered_start > current:
+            missing.append((current, covered_start))
+        current = max(current, covered_end)
+    if current < end:
+        missing.append((current, end))
+    return missing
+
+
+class Price_Store():
+    """
+    Persistent store of daily prices keyed by (ticker, date).\n
+    The store remembers the date ranges it already downloaded for every ticker.
+    Requests are served locally and only the missing date ranges are downloaded and appended.\n
+    The current day is never marked as downloaded for good, as its prices are not final yet. It is only covered
+    provisionally for intraday_ttl, such that repeated requests of the same day are served locally.
+    Ranges with trading days but without any prices (e.g. before the listing or after the delisting of the ticker)
+    are known to be empty for empty_ttl, such that they are not downloaded again on every request.\n
+    \n
+    args:\n
+    _______________________________\n
+    path: str\n
+    _______________________________\n
+    Directory of the store. Holds one file of prices per ticker and the downloaded ranges.\n
+    \n
+    intraday_ttl: timedelta = 1 hour\n
+    _______________________________\n
+    Time the prices of the current day are served before they are downloaded again.\n
+    \n
+    empty_ttl: timedelta = 1 day\n
+    _______________________________\n
+    Time a range without prices is known to be empty before it is downloaded again.\n
+    """
+
+    COVERAGE_FILE: str = "coverage.json"
+    PROVISIONAL_FILE: str = "provisional.json"
+
+    def __init__(self, path: str, intraday_ttl: timedelta = timedelta(hours = 1), empty_ttl: timedelta = timedelta(days = 1))-> None:
+        self.path: str = path
+        self.coverage_path: str = os.path.join(path, self.COVERAGE_FILE)
+        self.provisional_path: str = os.path.join(path, self.PROVISIONAL_FILE)
+        self.intraday_ttl: timedelta = intraday_ttl
+        self.empty_ttl: timedelta = empty_ttl
+
+        self._coverage: Dict[str, List[Date_Range]] = {}
+        # Ranges covered until an expiry, e.g. the prices of the current day or ranges known to be empty: ticker -> [(start, end, expires_at)]
+        self._provisional: Dict[str, List[Tuple[date, date, datetime]]] = {}
+        self._prices: Dict[str, pd.DataFrame] = {}
+        self._loaded: bool = False
+        self._lock = threading.RLock()
+
+    def _load(self)-> None:
+        if self._loaded:
+            return
+        self._loaded = True
+
+        if os.path.exists(self.coverage_path):
+            with open(self.coverage_path, "r") as file:
+                coverage: dict = json.load(file)
+
+            self._coverage = {ticker: [(date.fromisoformat(start), date.fromisoformat(end)) for start, end in ranges]
+                              for ticker, ranges in coverage.items()}
+
+        if os.path.exists(self.provisional_path):
+            with open(self.provisional_path, "r") as file:
+                provisional: dict = json.load(file)
+
+            self._provisional = {ticker: [(date.fromisoformat(start), date.fromisoformat(end), datetime.fromisoformat(expires_at)) for start, end, expires_at in ranges]
+                                 for ticker, ranges in provisional.items()}
+
+    def _ticker_path(self, ticker: str)-> str:
+        return os.path.join(self.path, f"{ticker.replace(os.sep, '_')}.pkl")
+
+    def _ticker_prices(self, ticker: str)-> pd.DataFrame:
+        """
+        Returns the stored prices of the ticker with the prices (Open, High, ...) as columns"""
+        if ticker not in self._prices:
+            ticker_path: str = self._ticker_path(ticker)
+            self._prices[ticker] = pd.read_pickle(ticker_path) if os.path.exists(ticker_path) else pd.DataFrame()
+        return self._prices[ticker]
+
+    def _save(self, tickers: List[str])-> None:
+        os.makedirs(self.path, exist_ok = True)
+
+        for ticker in tickers:
+            self._prices[ticker].to_pickle(self._ticker_path(ticker))
+
+        coverage: dict = {ticker: [(start.isoformat(), end.isoformat()) for start, end in ranges]
+                          for ticker, ranges in self._coverage.items()}
+        with open(self.coverage_path, "w") as file:
+            json.dump(coverage, file, indent = 4)
+
+        # Expired provisional ranges are dropped
+        now: datetime = datetime.now()
+        provisional: dict = {ticker: [(start.isoformat(), end.isoformat(), expires_at.isoformat()) for start, end, expires_at in ranges if expires_at > now]
+                             for ticker, ranges in self._provisional.items()}
+        with open(self.provisional_path, "w") as file:
+            json.dump({ticker: ranges for ticker, ranges in provisional.items() if ranges}, file, indent = 4)
+
+    def missing(self, ticker: str, start: date, end: date, final: bool = False)-> List[Date_Range]:
+        """
+        Returns the date ranges of [start, end) that were not yet downloaded for the ticker.\n
+        With final, ranges that are only covered provisionally (e.g. the prices of the current day or ranges known to
+        be empty) are missing as well"""
+        with self._lock:
+            self._load()
+            covered: List[Date_Range] = list(self._coverage.get(ticker, []))
+            if not final:
+                now: datetime = datetime.now()
+                covered += [(range_start, range_end) for range_start, range_end, expires_at in self._provisional.get(ticker, []) if expires_at > now]
+            return missing_ranges(covered, start, end)
+
+    def _cover_provisionally(self, ticker: str, start: date, end: date, ttl: timedelta)-> None:
+        """
+        Covers [start, end) of the ticker for the ttl"""
+        now: datetime = datetime.now()
+        ranges = [entry for entry in self._provisional.get(ticker, []) if entry[2] > now]
+        self._provisional[ticker] = ranges + [(start, end, now + ttl)]
+
+    def append(self, ticker: str, prices: pd.DataFrame, start: date, end: date, save: bool = True)-> None:
+        """
+        Appends the downloaded prices of [start, end) of the ticker to the store.\n
+        With save = False, the store is only written by the next call of save"""
+        with self._lock:
+            self._load()
+
+            stored: pd.DataFrame = self._ticker_prices(ticker)
+            if not prices.empty:
+                combined: pd.DataFrame = prices if stored.empty else pd.concat([stored, prices])
+                self._prices[ticker] = combined[~combined.index.duplicated(keep = "last")].sort_index()
+
+            # Prices of today may still change, such that today is only covered for the intraday ttl
+            today: date = date.today()
+            covered_end: date = min(end, today)
+            if start < covered_end:
+                self._coverage[ticker] = merge_ranges(self._coverage.get(ticker, []) + [(start, covered_end)])
+            if end > today:
+                self._cover_provisionally(ticker, max(start, today), end, self.intraday_ttl)
+
+            if save:
+                self._save([ticker])
+
+    def save(self, tickers: List[str])-> None:
+        """
+        Writes the prices of the tickers and the downloaded ranges of all tickers to disk"""
+        with self._lock:
+            self._save([ticker for ticker in tickers if ticker in self._prices])
+
+    def prices(self, tickers: List[str], start: date, end: date, download: Callable[[List[str], str, str], pd.DataFrame])-> pd.DataFrame:
+        """
+        Returns the daily prices of the tickers in [start, end) with the columns (Price, Ticker), like yf.download.\n
+        download(tickers, start, end) is only called for the missing date ranges.
+        Tickers missing the same range are downloaded together"""
+
+        if isinstance(start, datetime): start = start.date()
+        if isinstance(end, datetime): end = end.date()
+        if isinstance(start, str): start = date.fromisoformat(start)
+        if isinstance(end, str): end = date.fromisoformat(end)
+
+        # Group the tickers by their missing ranges to download them together
+        downloads: Dict[Date_Range, List[str]] = {}
+        for ticker in tickers:
+            for missing_range in self.missing(ticker, start, end):
+                downloads.setdefault(missing_range, []).append(ticker)
+
+        appended: Set[str] = set()
+        for (missing_start, missing_end), missing_tickers in downloads.items():
+            # Ranges without trading days (weekends and holidays) have no prices and are not downloaded
+            if not has_trading_days(missing_start, missing_end):
+                for ticker in missing_tickers:
+                    self.append(ticker, pd.DataFrame(), missing_start, missing_end, save = False)
+                appended.update(missing_tickers)
+                continue
+
+            downloaded: pd.DataFrame = download(missing_tickers, missing_start.strftime("%Y-%m-%d"), missing_end.strftime("%Y-%m-%d"))
+
+            # Older versions of yfinance return flat columns for a single ticker
+            if not downloaded.empty and not isinstance(downloaded.columns, pd.MultiIndex):
+                downloaded = pd.concat({missing_tickers[0]: downloaded}, axis = 1).swaplevel(axis = 1)
+
+            for ticker in missing_tickers:
+                if downloaded.empty or ticker not in downloaded.columns.get_level_values(1):
+                    ticker_prices = pd.DataFrame()
+                else:
+                    ticker_prices = downloaded.xs(ticker, axis = 1, level = 1).dropna(how = "all")
+
+                # A ticker without prices over trading days is not listed in the range or failed (yfinance returns
+                # NaN columns for failed tickers of a download of many tickers). The range is not marked as downloaded,
+                # but known to be empty for the empty_ttl, such that it is not downloaded again on every request
+                if ticker_prices.empty:
+                    with self._lock:
+                        self._load()
+                        self._cover_provisionally(ticker, missing_start, missing_end, self.empty_ttl)
+                    appended.add(ticker)
+                    continue
+
+                self.append(ticker, ticker_prices, missing_start, missing_end, save = False)
+                appended.add(ticker)
+
+        # The downloaded and empty ranges are written once for all tickers
+        if appended:
+            self.save(list(appended))
+
+        with self._lock:
+            frames: Dict[str, pd.DataFrame] = {}
+            for ticker in tickers:
+                stored: pd.DataFrame = self._ticker_prices(ticker)
+                if not stored.empty:
+                    frames[ticker] = stored[(stored.index >= pd.Timestamp(start)) & (stored.index < pd.Timestamp(end))]
+
+        if not frames:
+            return pd.DataFrame()
+
+        result: pd.DataFrame = pd.concat(frames, axis = 1).swaplevel(axis = 1)
+
+        # Order the columns like yf.download: grouped by price, then by the order of the tickers
+        price_names: List[str] = list(dict.fromkeys(result.columns.get_level_values(0)))
+        result = result[[(price, ticker) for price in price_names for ticker in frames if (price, ticker) in result.columns]]
+        result.columns.names = ["Price", "Ticker"]
+
+        return result
@@ -0,0 +1,298 @@
+import pandas as pd
+import math
+import os
+import pickle
+from collections import deque
+from datetime import date
+from dateutil.relativedelta import relativedelta
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+
+
+def annualised_return(price_start: float, price_end: float, years: int)-> float:
+    """
+    Annualises the change of the price over the years, like Yfinance_Query_Handler.snp500_return"""
+
+    relative_change_prices = (price_end-price_start)/price_start
+
+    annualised_change_prices = math.pow(relative_change_prices, 1/years)
+
+    return annualised_change_prices-1
+
+
+def beta_cutoff(as_of: date, years: int)-> date:
+    """
+    First date of the price window of Yfinance_Query_Handler.betas on the day as_of"""
+    return (as_of - relativedelta(days=-1)) - relativedelta(years=years)
+
+
+def market_return_cutoff(as_of: date, years: int)-> date:
+    """
+    First date of the price window of Yfinance_Query_Handler.snp500_return on the day as_of"""
+    return as_of - relativedelta(years=years)
+
+
+class Last_Prices():
+    """
+    Last two prices of a series, used to turn a new bar into a return.\n
+    A bar of the same date as the last one replaces it, such that the intraday price of today can be updated.
+    """
+
+    def __init__(self)-> None:
+        self.previous: Optional[Tuple[date, float]] = None
+        self.last: Optional[Tuple[date, float]] = None
+
+    def push(self, day: date, price: float)-> Optional[Tuple[date, float]]:
+        """
+        Adds the price of the day.\n
+        Returns (date of the previous price, return) or None for the first price"""
+        if self.last is not None and self.last[0] != day:
+            self.previous = self.last
+        self.last = (day, price)
+
+        if self.previous is None:
+            return None
+
+        previous_day, previous_price = self.previous
+        return (previous_day, price/previous_price - 1)
+
+
+class Rolling_Beta_Window():
+    """
+    Running sums of the stock returns x and market returns y of one window.\n
+    Every entry is (date, first price date, x, y). The first price date is the older of the two prices the returns start from.
+    An entry leaves the window as soon as this price is older than the window, like the first return in the price window of betas.
+    """
+
+    def __init__(self, years: int)-> None:
+        self.years: int = years
+        self.entries: Deque[Tuple[date, date, float, float]] = deque()
+
+        self.n: int = 0
+        self.sum_x: float = 0.0
+        self.sum_y: float = 0.0
+        self.sum_xy: float = 0.0
+        self.sum_yy: float = 0.0
+
+    def _add(self, x: float, y: float, sign: int)-> None:
+        self.n += sign
+        self.sum_x += sign * x
+        self.sum_y += sign * y
+        self.sum_xy += sign * x * y
+        self.sum_yy += sign * y * y
+
+    def drop_last(self, day: date)-> None:
+        if self.entries and self.entries[-1][0] == day:
+            _, _, x, y = self.entries.pop()
+            self._add(x, y, -1)
+
+    def push(self, day: date, first_day: date, x: float, y: float)-> None:
+        self.drop_last(day)
+        self.entries.append((day, first_day, x, y))
+        self._add(x, y, 1)
+
+    def evict(self, as_of: date)-> None:
+        cutoff: date = beta_cutoff(as_of, self.years)
+        while self.entries and self.entries[0][1] < cutoff:
+            _, _, x, y = self.entries.popleft()
+            self._add(x, y, -1)
+
+        # Restart the sums on an empty window, such that rounding errors do not accumulate
+        if not self.entries:
+            self.n, self.sum_x, self.sum_y, self.sum_xy, self.sum_yy = 0, 0.0, 0.0, 0.0, 0.0
+
+    def beta(self)-> float:
+        """
+        Covariance of x and y divided by the variance of y. NaN for less than two returns"""
+        if self.n < 2:
+            return float("nan")
+
+        covariance: float = self.sum_xy - self.sum_x * self.sum_y / self.n
+        market_variance: float = self.sum_yy - self.sum_y * self.sum_y / self.n
+
+        if market_variance == 0:
+            return float("nan")
+
+        return covariance / market_variance
+
+
+class Market_Price_Window():
+    """
+    Market prices of one window, used for the annualised return of the market.
+    """
+
+    def __init__(self, years: int)-> None:
+        self.years: int = years
+        self.prices: Deque[Tuple[date, float]] = deque()
+
+    def push(self, day: date, price: float)-> None:
+        if self.prices and self.prices[-1][0] == day:
+            self.prices.pop()
+        self.prices.append((day, price))
+
+    def evict(self, as_of: date)-> None:
+        cutoff: date = market_return_cutoff(as_of, self.years)
+        while self.prices and self.prices[0][0] < cutoff:
+            self.prices.popleft()
+
+    def annualised_return(self, as_of: date)-> float:
+        # The price of as_of itself is not final and not used, like in snp500_return
+        last_prices: List[Tuple[date, float]] = [price for price in list(self.prices)[-2:] if price[0] < as_of]
+
+        if not self.prices or not last_prices:
+            raise ValueError(f"No data found for the last {self.years} years before {as_of}")
+
+        return annualised_return(price_start = self.prices[0][1], price_end = last_prices[-1][1], years = self.years)
+
+
+class Ticker_State():
+    """
+    Rolling state of one ticker against the market for all windows.
+    """
+
+    def __init__(self, windows: Iterable[int])-> None:
+        self.last_date: Optional[date] = None
+        self.stock = Last_Prices()
+        self.market = Last_Prices()
+        self.windows: Dict[int, Rolling_Beta_Window] = {years: Rolling_Beta_Window(years) for years in windows}
+
+    def push(self, day: date, stock_price: float, market_price: float)-> None:
+        self.last_date = day
+
+        stock_return = None if math.isnan(stock_price) else self.stock.push(day, stock_price)
+        market_return = None if math.isnan(market_price) else self.market.push(day, market_price)
+
+        for window in self.windows.values():
+            if stock_return is None or market_return is None:
+                window.drop_last(day)
+                continue
+            window.push(day, max(stock_return[0], market_return[0]), stock_return[1], market_return[1])
+            window.evict(day)
+
+
+class Rolling_State():
+    """
+    Persistent rolling statistics of daily returns, updated with every new daily bar.\n
+    For every ticker and window, the state keeps the returns inside the window and the running sums of the stock returns,
+    market returns, their squares and cross products. A new bar is added and the bars leaving the window are removed in O(1)
+    (amortised), such that the beta and the annualised market return of every maintained window are answered instantly.\n
+    The results equal Yfinance_Query_Handler.beta_quity and snp500_return on the same prices.\n
+    \n
+    args:\n
+    _______________________________\n
+    windows: Iterable[int] = (1, 2, 3, 5, 10)\n
+    _______________________________\n
+    Windows in years maintained for every ticker.\n
+    \n
+    path: str = None\n
+    _______________________________\n
+    Pickle file of the state. Only kept in memory if None.\n
+    """
+
+    def __init__(self, windows: Iterable[int] = (1, 2, 3, 5, 10), path: Optional[str] = None)-> None:
+        self.windows: List[int] = sorted(set(windows))
+        self.path: Optional[str] = path
+
+        self.tickers: Dict[str, Ticker_State] = {}
+        self.market: Dict[int, Market_Price_Window] = {years: Market_Price_Window(years) for years in self.windows}
+        self.market_last_date: Optional[date] = None
+        self.updated_on: Optional[date] = None
+
+    @classmethod
+    def load(cls, windows: Iterable[int] = (1, 2, 3, 5, 10), path: Optional[str] = None)-> "Rolling_State":
+        """
+        Loads the state of the pickle file. Returns a new state if the file does not exist or has other windows"""
+        if path and os.path.exists(path):
+            try:
+                with open(path, "rb") as file:
+                    state: Rolling_State = pickle.load(file)
+            except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+                state = None
+            if isinstance(state, cls) and state.windows == sorted(set(windows)):
+                state.path = path
+                return state
+
+        return cls(windows = windows, path = path)
+
+    def save(self)-> None:
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok = True)
+        temporary_path: str = f"{self.path}.tmp"
+        with open(temporary_path, "wb") as file:
+            pickle.dump(self, file)
+        os.replace(temporary_path, self.path)
+
+    def start(self, tickers: List[str], as_of: date)-> date:
+        """
+        Returns the first date of the prices needed to bring the tickers and the market up to date"""
+        first_date: date = market_return_cutoff(as_of, max(self.windows))
+
+        last_dates: List[Optional[date]] = [self.market_last_date] + [self.tickers[ticker].last_date if ticker in self.tickers else None for ticker in tickers]
+        if any(last_date is None for last_date in last_dates):
+            return first_date
+
+        # The last bar is read again, as it may have been the unfinished bar of that day
+        return max(first_date, min(last_dates))
+
+    def update(self, close_prices: pd.DataFrame, market: str = "^GSPC")-> None:
+        """
+        Adds the bars of the closing prices with the tickers and the market as columns.\n
+        Bars older than the last bar of a ticker are skipped, bars of the same date replace the last bar"""
+
+        if close_prices.empty or market not in close_prices.columns:
+            return
+
+        close_prices = close_prices.sort_index()
+        days: List[date] = [timestamp.date() for timestamp in pd.to_datetime(close_prices.index)]
+        market_prices: List[float] = close_prices[market].astype(float).tolist()
+
+        for day, market_price in zip(days, market_prices):
+            if math.isnan(market_price) or (self.market_last_date is not None and day < self.market_last_date):
+                continue
+            for window in self.market.values():
+                window.push(day, market_price)
+                window.evict(day)
+            self.market_last_date = day
+
+        for ticker in close_prices.columns:
+            if ticker == market:
+                continue
+
+            state: Ticker_State = self.tickers.setdefault(ticker, Ticker_State(self.windows))
+            stock_prices: List[float] = close_prices[ticker].astype(float).tolist()
+
+            for day, stock_price, market_price in zip(days, stock_prices, market_prices):
+                if state.last_date is not None and day < state.last_date:
+                    continue
+                if math.isnan(stock_price) and math.isnan(market_price):
+                    continue
+                state.push(day, stock_price, market_price)
+
+        self.updated_on = date.today()
+
+    def _window(self, years: int)-> None:
+        if years not in self.windows:
+            raise ValueError(f"The window of {years} years is not maintained. Maintained windows: {self.windows}")
+
+    def beta(self, ticker: str, years: int, as_of: Optional[date] = None)-> float:
+        """
+        Returns the beta of the ticker over the window, like beta_quity"""
+        self._window(years)
+        if ticker not in self.tickers:
+            raise KeyError(f"The ticker {ticker} is not part of the rolling state")
+
+        window: Rolling_Beta_Window = self.tickers[ticker].windows[years]
+        window.evict(as_of or date.today())
+
+        return window.beta()
+
+    def market_return(self, years: int, as_of: Optional[date] = None)-> float:
+        """
+        Returns the annualised return of the market over the window, like snp500_return"""
+        self._window(years)
+
+        as_of = as_of or date.today()
+        window: Market_Price_Window = self.market[years]
+        window.evict(as_of)
+
+        return window.annualised_return(as_of)
@@ -0,0 +1,90 @@
+import sys
+import os
+
+# Add the DCF_Engine directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from yfinance_query.close_store import Close_Store
+from yfinance_query.price_store import Price_Store, trading_day
+from datetime import date, timedelta
+from typing import List, Tuple
+import numpy as np
+import pandas as pd
+import tempfile
+import unittest
+
+
+class Test_Close_Store(unittest.TestCase):
+    def setUp(self)-> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = Close_Store(path = os.path.join(self.directory.name, "closes"), base = date(2024, 1, 1))
+        self.price_store = Price_Store(path = os.path.join(self.directory.name, "prices"))
+
+        self.failing: List[str] = []
+        self.downloads: int = 0
+
+    def tearDown(self)-> None:
+        self.directory.cleanup()
+
+    def download(self, tickers: List[str], start: str, end: str)-> pd.DataFrame:
+        """
+        Download with the interface of yf.download. Tickers in failing get all NaN columns"""
+        self.downloads += 1
+        dates = pd.date_range(start, end, freq = trading_day, inclusive = "left")
+        columns = pd.MultiIndex.from_product([["Close"], tickers], names = ["Price", "Ticker"])
+        data = pd.DataFrame({("Close", ticker): np.arange(len(dates), dtype = float) + 100 * index for index, ticker in enumerate(tickers)},
+                            index = dates, columns = columns)
+        for ticker in self.failing:
+            data[("Close", ticker)] = np.nan
+        return data
+
+    def fill(self, tickers: List[str], start: date, end: date)-> None:
+        def prices(tickers: List[str], start: date, end: date)-> pd.DataFrame:
+            return self.price_store.prices(tickers = tickers, start = start, end = end, download = self.download)
+
+        def missing(ticker: str, start: date, end: date)-> List[Tuple[date, date]]:
+            return self.price_store.missing(ticker = ticker, start = start, end = end, final = True)
+
+        self.store.fill(tickers = tickers, start = start, end = end, prices = prices, missing = missing)
+
+    def test_round_trip(self)-> None:
+        self.fill(["AAA", "BBB"], date(2024, 1, 2), date(2024, 2, 1))
+
+        closes: np.ndarray = self.store.close("BBB", date(2024, 1, 2), date(2024, 2, 1))
+        dates: np.ndarray = self.store.dates(date(2024, 1, 2), date(2024, 2, 1))
+
+        self.assertEqual(len(closes), len(dates))
+        self.assertEqual(dates[0], np.datetime64("2024-01-02"))
+        self.assertEqual(closes[0], 100.0)
+        # Holidays are NaN
+        self.assertTrue(np.isnan(self.store.close("AAA", date(2024, 1, 15), date(2024, 1, 16))).all())
+
+        # Persisted and served without reading the prices again
+        store = Close_Store(path = self.store.path)
+        self.assertEqual(store.missing("AAA", date(2024, 1, 2), date(2024, 2, 1)), [])
+        np.testing.assert_array_equal(store.close("BBB", date(2024, 1, 2), date(2024, 2, 1)), closes)
+
+    def test_failed_download(self)-> None:
+        self.failing = ["BBB"]
+        self.fill(["AAA", "BBB"], date(2024, 1, 2), date(2024, 2, 1))
+
+        # The failed ticker is neither written nor marked as written
+        self.assertNotIn("BBB", self.store.coverage)
+        self.assertEqual(self.store.missing("AAA", date(2024, 1, 2), date(2024, 2, 1)), [])
+
+        # The range known to be empty by the price store is not read again until its empty ttl passed
+        self.failing = []
+        self.fill(["AAA", "BBB"], date(2024, 1, 2), date(2024, 2, 1))
+        self.assertNotIn("BBB", self.store.coverage)
+        self.assertEqual(self.downloads, 1)
+
+        self.price_store._provisional.clear()
+        self.fill(["AAA", "BBB"], date(2024, 1, 2), date(2024, 2, 1))
+
+        self.assertEqual(self.downloads, 2)
+        self.assertEqual(self.store.missing("BBB", date(2024, 1, 2), date(2024, 2, 1)), [])
+        self.assertFalse(np.isnan(self.store.close("BBB", date(2024, 1, 2), date(2024, 1, 3))).any())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+import sys
+import os
+
+# Add the DCF_Engine directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from yfinance_query.price_store import Price_Store, has_trading_days
+from datetime import date, timedelta
+from unittest import mock
+from typing import List, Tuple
+import numpy as np
+import pandas as pd
+import tempfile
+import unittest
+
+
+class Fake_Download():
+    """
+    Download with the interface of yf.download, recording its calls.
+    Tickers in failing get all NaN columns, like failed tickers of a download of many tickers"""
+
+    def __init__(self, failing: List[str] = None)-> None:
+        self.calls: List[Tuple[Tuple[str, ...], str, str]] = []
+        self.failing: List[str] = failing or []
+
+    def __call__(self, tickers: List[str], start: str, end: str)-> pd.DataFrame:
+        self.calls.append((tuple(tickers), start, end))
+
+        dates = pd.bdate_range(start, end, inclusive = "left")
+        columns = pd.MultiIndex.from_product([["Close", "Open"], tickers], names = ["Price", "Ticker"])
+        data = pd.DataFrame(np.arange(len(dates) * len(columns), dtype = float).reshape(len(dates), len(columns)), index = dates, columns = columns)
+
+        for ticker in self.failing:
+            data.loc[:, (slice(None), ticker)] = np.nan
+
+        return data
+
+
+class Fixed_Date(date):
+    """
+    Date of which today is a fixed trading day"""
+
+    @classmethod
+    def today(cls)-> date:
+        return cls(2024, 3, 14)
+
+
+class Test_Price_Store(unittest.TestCase):
+    def setUp(self)-> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = Price_Store(path = self.directory.name)
+
+    def tearDown(self)-> None:
+        self.directory.cleanup()
+
+    def test_coverage(self)-> None:
+        download = Fake_Download()
+
+        prices: pd.DataFrame = self.store.prices(["AAA", "BBB"], date(2024, 1, 2), date(2024, 2, 1), download = download)
+        self.assertEqual(len(download.calls), 1)
+        self.assertEqual(prices.columns.names, ["Price", "Ticker"])
+        self.assertEqual(len(prices), 22)
+
+        # Served from the store, only the missing days are downloaded
+        self.store.prices(["AAA", "BBB"], date(2024, 1, 10), date(2024, 1, 20), download = download)
+        self.assertEqual(len(download.calls), 1)
+
+        self.store.prices(["AAA"], date(2024, 1, 2), date(2024, 2, 10), download = download)
+        self.assertEqual(download.calls[-1], (("AAA",), "2024-02-01", "2024-02-10"))
+
+        # The coverage is persisted
+        self.assertEqual(Price_Store(path = self.directory.name).missing("AAA", date(2024, 1, 2), date(2024, 2, 10)), [])
+
+    def test_failed_ticker(self)-> None:
+        download = Fake_Download(failing = ["BBB"])
+
+        prices: pd.DataFrame = self.store.prices(["AAA", "BBB"], date(2024, 1, 2), date(2024, 2, 1), download = download)
+        self.assertNotIn("BBB", prices.columns.get_level_values("Ticker"))
+
+        # The ticker without prices is not marked as downloaded, but known to be empty for the empty ttl
+        self.assertEqual(self.store.missing("AAA", date(2024, 1, 2), date(2024, 2, 1)), [])
+        self.assertEqual(self.store.missing("BBB", date(2024, 1, 2), date(2024, 2, 1)), [])
+        self.assertEqual(self.store.missing("BBB", date(2024, 1, 2), date(2024, 2, 1), final = True), [(date(2024, 1, 2), date(2024, 2, 1))])
+
+        # such that it is not downloaded again on every request, also after a restart
+        Price_Store(path = self.directory.name).prices(["AAA", "BBB"], date(2024, 1, 2), date(2024, 2, 1), download = download)
+        self.assertEqual(len(download.calls), 1)
+
+        # but once the empty ttl passed
+        download.failing = []
+        expiring = Price_Store(path = os.path.join(self.directory.name, "expiring"), empty_ttl = timedelta(0))
+        expiring.prices(["AAA", "BBB"], date(2024, 1, 2), date(2024, 2, 1), download = Fake_Download(failing = ["BBB"]))
+        prices = expiring.prices(["AAA", "BBB"], date(2024, 1, 2), date(2024, 2, 1), download = download)
+        self.assertEqual(download.calls[-1], (("BBB",), "2024-01-02", "2024-02-01"))
+        self.assertIn("BBB", prices.columns.get_level_values("Ticker"))
+
+    def test_holidays(self)-> None:
+        download = Fake_Download()
+
+        self.assertFalse(has_trading_days(date(2024, 12, 25), date(2024, 12, 26)))
+        self.assertFalse(has_trading_days(date(2024, 3, 29), date(2024, 4, 1)))
+        self.assertTrue(has_trading_days(date(2024, 12, 24), date(2024, 12, 25)))
+
+        # Christmas and the weekend are never downloaded
+        self.store.prices(["AAA"], date(2024, 12, 25), date(2024, 12, 26), download = download)
+        self.store.prices(["AAA"], date(2024, 12, 28), date(2024, 12, 30), download = download)
+        self.assertEqual(download.calls, [])
+        self.assertEqual(self.store.missing("AAA", date(2024, 12, 25), date(2024, 12, 26)), [])
+
+    def test_today(self)-> None:
+        download = Fake_Download()
+
+        # Thursday, a trading day
+        with mock.patch("yfinance_query.price_store.date", Fixed_Date):
+            self.store.prices(["AAA"], date(2024, 3, 1), date(2024, 3, 15), download = download)
+
+            # The price of today is served from the store within the intraday ttl, also after a restart
+            Price_Store(path = self.directory.name).prices(["AAA"], date(2024, 3, 1), date(2024, 3, 15), download = download)
+            self.assertEqual(len(download.calls), 1)
+
+            # but it is not final
+            self.assertEqual(self.store.missing("AAA", date(2024, 3, 1), date(2024, 3, 15), final = True), [(date(2024, 3, 14), date(2024, 3, 15))])
+
+            # and downloaded again once the ttl passed
+            expiring = Price_Store(path = os.path.join(self.directory.name, "expiring"), intraday_ttl = timedelta(0))
+            expiring.prices(["AAA"], date(2024, 3, 1), date(2024, 3, 15), download = download)
+            expiring.prices(["AAA"], date(2024, 3, 1), date(2024, 3, 15), download = download)
+            self.assertEqual(download.calls[-1], (("AAA",), "2024-03-14", "2024-03-15"))
+            self.assertEqual(len(download.calls), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
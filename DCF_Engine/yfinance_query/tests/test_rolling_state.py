@@ -0,0 +1,80 @@
+import sys
+import os
+import tempfile
+
+# Add the DCF_Engine directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+# The shared caches of the handler are created on import, such that they are kept out of the cache directory
+os.environ.setdefault("DCF_CACHE_DIR", tempfile.mkdtemp())
+
+from yfinance_query.yfinance_query import Yfinance_Query_Handler
+from yfinance_query.rolling_state import Rolling_State
+from yfinance_query.price_store import trading_day
+from datetime import date
+from dateutil.relativedelta import relativedelta
+from typing import List, Union
+import numpy as np
+import pandas as pd
+import unittest
+
+
+class Synthetic_Prices_Handler(Yfinance_Query_Handler):
+    """
+    Handler serving synthetic daily prices instead of the price store"""
+
+    def __init__(self, close_prices: pd.DataFrame)-> None:
+        self.close_prices: pd.DataFrame = close_prices
+
+    def ticker_prices_daily(self, start: Union[date, str], end: Union[date, str], ticker: str = None, tickers: List[str] = None)-> pd.DataFrame:
+        tickers = [ticker] if ticker else list(tickers)
+        close_prices: pd.DataFrame = self.close_prices.loc[(self.close_prices.index >= pd.Timestamp(start)) & (self.close_prices.index < pd.Timestamp(end)), tickers]
+        close_prices.columns = pd.MultiIndex.from_product([["Close"], tickers], names = ["Price", "Ticker"])
+        return close_prices
+
+
+class Test_Rolling_Beta(unittest.TestCase):
+    def setUp(self)-> None:
+        random = np.random.default_rng(7)
+
+        today: date = date.today()
+        days = pd.date_range(today - relativedelta(years = 6), today, freq = trading_day)
+
+        market_returns = random.normal(0.0004, 0.01, len(days))
+        stock_returns = 1.3 * market_returns + random.normal(0, 0.015, len(days))
+
+        self.close_prices = pd.DataFrame({"^GSPC": 4000 * np.cumprod(1 + market_returns),
+                                          "AAA":   50 * np.cumprod(1 + stock_returns)}, index = days)
+        # Days without a stock price, such that the returns are taken against the last available price
+        self.close_prices.iloc[random.choice(len(days), 40, replace = False), 1] = np.nan
+
+        self.handler = Synthetic_Prices_Handler(self.close_prices)
+        Yfinance_Query_Handler.rolling_state = Rolling_State()
+
+    def tearDown(self)-> None:
+        Yfinance_Query_Handler.rolling_state = None
+
+    def test_rolling_beta(self)-> None:
+        for years in (1, 2, 5):
+            self.assertAlmostEqual(self.handler.rolling_beta("AAA", years), self.handler.beta_quity("AAA", years), places = 8)
+
+    def test_incremental_updates(self)-> None:
+        state = Rolling_State()
+        close_prices: pd.DataFrame = self.close_prices
+        splits: List[int] = [0, len(close_prices) // 3, 2 * len(close_prices) // 3, len(close_prices) - 1]
+
+        for start, end in zip(splits, splits[1:]):
+            # Every update reads the last bar again, like update_rolling_state
+            state.update(close_prices.iloc[max(start - 1, 0):end])
+
+        # The unfinished bar of today is replaced by its final price
+        intraday: pd.DataFrame = close_prices.iloc[-1:] * 1.02
+        state.update(intraday)
+        state.update(close_prices.iloc[-2:])
+
+        for years in (1, 2, 5):
+            self.assertAlmostEqual(state.beta("AAA", years), self.handler.beta_quity("AAA", years), places = 8)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+import pandas as pd
+import threading
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, List, Optional, Union
+
+
+class Treasury_Curve():
+    """
+    In memory yield curve of the US treasury bonds, backed by the price store.\n
+    The yields of all tenors are loaded together. Dates before the loaded range are only loaded once,
+    and the latest yields are refreshed at most once per day, such that any date and tenor is then looked up in memory.\n
+    The yields are in percent, like the prices of the bond tickers on yfinance.\n
+    \n
+    args:\n
+    _______________________________\n
+    tickers: Dict[int, str]\n
+    _______________________________\n
+    Tickers of the bonds by their duration in years.\n
+    \n
+    prices: Callable[[List[str], date, date], pd.DataFrame]\n
+    _______________________________\n
+    Returns the daily prices of the tickers in [start, end) with the columns (Price, Ticker), like the price store.\n
+    """
+
+    def __init__(self, tickers: Dict[int, str], prices: Callable[[List[str], date, date], pd.DataFrame])-> None:
+        self.tickers: Dict[int, str] = tickers
+        self.prices: Callable[[List[str], date, date], pd.DataFrame] = prices
+
+        self._frame: pd.DataFrame = pd.DataFrame()
+        self.start: Optional[date] = None
+        self.refreshed_on: Optional[date] = None
+        self._lock = threading.Lock()
+
+    def _load(self, start: date, end: date)-> None:
+        loaded: pd.DataFrame = self.prices(list(self.tickers.values()), start, end)
+        if loaded.empty:
+            return
+
+        combined: pd.DataFrame = loaded if self._frame.empty else pd.concat([self._frame, loaded])
+        self._frame = combined[~combined.index.duplicated(keep = "last")].sort_index()
+
+    def ensure(self, start: Union[date, str])-> None:
+        """
+        Makes sure the yields from start until today are in memory"""
+        if isinstance(start, datetime): start = start.date()
+        if isinstance(start, str): start = date.fromisoformat(start)
+
+        today: date = date.today()
+
+        with self._lock:
+            if self.start is None:
+                self._load(start, today + timedelta(days = 1))
+                self.start = start
+                self.refreshed_on = today
+                return
+
+            # Only the missing older dates are loaded
+            if start < self.start:
+                self._load(start, self.start)
+                self.start = start
+
+            if self.refreshed_on != today:
+                last_date: date = self._frame.index.max().date() if not self._frame.empty else self.start
+                self._load(last_date, today + timedelta(days = 1))
+                self.refreshed_on = today
+
+    def _tenor_ticker(self, tenor: int)-> str:
+        try:
+            return self.tickers[tenor]
+        except KeyError:
+            raise ValueError(f"No US treasury bond of duration {tenor} found")
+
+    def bond_prices(self, tenor: int, start: Union[date, str], end: Union[date, str])-> pd.DataFrame:
+        """
+        Returns the prices of the bond of the tenor in [start, end) with the columns (Price, Ticker)"""
+        ticker: str = self._tenor_ticker(tenor)
+        self.ensure(start)
+
+        if self._frame.empty or ticker not in self._frame.columns.get_level_values(1):
+            return pd.DataFrame()
+
+        prices: pd.DataFrame = self._frame.xs(ticker, axis = 1, level = 1, drop_level = False).dropna(how = "all")
+        return prices[(prices.index >= pd.Timestamp(start)) & (prices.index < pd.Timestamp(end))]
+
+    def yield_on(self, day: Union[date, str], tenor: int, max_days_before: int = 10)-> float:
+        """
+        Returns the yield to maturity (as a decimal) of the bond of the tenor on the day.\n
+        Uses the last yield on or before the day, at most max_days_before days before it"""
+        if isinstance(day, datetime): day = day.date()
+        if isinstance(day, str): day = date.fromisoformat(day)
+
+        bond_yields: pd.DataFrame = self.bond_prices(tenor = tenor, start = day - timedelta(days = max_days_before), end = day + timedelta(days = 1))
+
+        if bond_yields.empty:
+            raise ValueError(f"No yield of the US treasury bond of duration {tenor} found between {day - timedelta(days = max_days_before)} - {day}")
+
+        return float(bond_yields["Close"].iloc[-1, 0]) / 100
+
+    def curve(self, day: Union[date, str])-> pd.Series:
+        """
+        Returns the yields to maturity (as decimals) of all tenors on the day"""
+        return pd.Series({tenor: self.yield_on(day = day, tenor = tenor) for tenor in self.tickers}, name = "Yield")
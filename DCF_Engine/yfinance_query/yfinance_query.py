@@ -1,39 +1,79 @@
 import pandas as pd
 import yfinance as yf
-from datetime import date, datetime
+from datetime import date, datetime, timedelta
 from dateutil.relativedelta import relativedelta
 import numpy as np
 import math
+import os
+import warnings
 from typing import Union, Literal, Tuple, List, Dict
 
+# Support running the module as a script from the Makefile
+try:
+    from .info_cache import Ticker_Info_Cache
+    from .price_store import Price_Store
+    from .rolling_state import Rolling_State, annualised_return
+    from .treasury_curve import Treasury_Curve
+    from .close_store import Close_Store
+except ImportError:
+    from info_cache import Ticker_Info_Cache
+    from price_store import Price_Store
+    from rolling_state import Rolling_State, annualised_return
+    from treasury_curve import Treasury_Curve
+    from close_store import Close_Store
+
+# Directory of the local caches of the handler
+cache_dir = os.getenv("DCF_CACHE_DIR", os.path.join(os.path.dirname(__file__), "../../cache"))
+
 class Yfinance_Query_Handler():
     bond_ticker = {
         5: "^FVX",
         10: "^TNX",
         30: "^TYX" 
     }
+
+    # Cache of the ticker infos shared by all handlers
+    info_cache = Ticker_Info_Cache(path = os.path.join(cache_dir, "ticker_info.json"))
+
+    # Store of the daily prices shared by all handlers
+    price_store = Price_Store(path = os.path.join(cache_dir, "prices"))
+
+    # Rolling beta and market return state shared by all handlers, loaded on first use
+    rolling_state: Rolling_State = None
+
+    # Treasury yield curve shared by all handlers, created on first use
+    treasury_curve: Treasury_Curve = None
+
+    # Memory mapped closing prices shared by all handlers, opened on first use
+    close_store: Close_Store = None
+
     @staticmethod
     def stock(ticker:str)->yf.Ticker:
         return yf.Ticker(ticker)
+
+    def info(self, ticker: str)-> dict:
+        """
+        Returns the info of the ticker from the shared info cache"""
+        return self.info_cache.get(ticker)
+
+    def prefetch_info(self, tickers: List[str])-> Dict[str, dict]:
+        """
+        Fetches the infos of all tickers concurrently into the shared info cache\n
+        Later field lookups of these tickers do not query yfinance again"""
+        return self.info_cache.prefetch(tickers)
     
     def industry(self, ticker:str)-> str:
-        stock = Yfinance_Query_Handler.stock(ticker)
-
-        industry = stock.info.get("industry")
+        industry = self.info(ticker).get("industry")
 
         return industry
     
     def sector(self, ticker:str)-> str:
-        stock = Yfinance_Query_Handler.stock(ticker)
-
-        sector = stock.info.get("sector")
+        sector = self.info(ticker).get("sector")
 
         return sector 
     
     def website(self, ticker:str)-> str:
-        stock = Yfinance_Query_Handler.stock(ticker)
-
-        link = stock.info.get("website")
+        link = self.info(ticker).get("website")
 
         return link     
     
@@ -78,9 +118,46 @@ class Yfinance_Query_Handler():
         
         return self.ticker_prices_daily(ticker = "^GSPC", start=start, end=end)
     
+    def load_close_store(self)-> Close_Store:
+        """
+        Returns the memory mapped close store shared by all handlers"""
+        if Yfinance_Query_Handler.close_store is None:
+            Yfinance_Query_Handler.close_store = Close_Store(path = os.path.join(cache_dir, "closes"))
+        return Yfinance_Query_Handler.close_store
+
+    def close_prices(self, tickers: List[str], start: Union[date, str], end: Union[date, str])-> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        """
+        Returns the closing prices of the tickers in [start, end) as arrays served from the memory mapped close store.\n
+        Returns (dates, {ticker: closes}). The closes are read only views aligned with the business days in dates,
+        days without a price are NaN. Missing prices are first written from the price store.
+        Tickers without any stored prices (e.g. after a failed download) get an empty array"""
+        close_store: Close_Store = self.load_close_store()
+
+        def prices(tickers: List[str], start: date, end: date)-> pd.DataFrame:
+            return self.price_store.prices(tickers = tickers, start = start, end = end, download = self.download_prices_daily)
+
+        # Ranges the price store only covers provisionally (today, known empty ranges) are not written for good
+        def missing(ticker: str, start: date, end: date)-> List[Tuple[date, date]]:
+            return self.price_store.missing(ticker = ticker, start = start, end = end, final = True)
+
+        close_store.fill(tickers = tickers, start = start, end = end, prices = prices, missing = missing)
+
+        closes: Dict[str, np.ndarray] = {ticker: close_store.close(ticker = ticker, start = start, end = end) if ticker in close_store.coverage
+                                         else np.empty(0, dtype = close_store.dtype) for ticker in tickers}
+        dates: np.ndarray = close_store.dates(start = start, end = end)
+
+        return (dates[:max([len(column) for column in closes.values()], default = 0)], closes)
+
+    @staticmethod
+    def download_prices_daily(tickers: List[str], start: str, end: str)-> pd.DataFrame:
+        """
+        Downloads the daily prices of the tickers from yfinance"""
+        return yf.download(tickers, start=start, end=end, interval="1d")
+
     def ticker_prices_daily(self,start: Union[date, str], end: Union[date, str], ticker:str = None, tickers:List[str] = None)->pd.DataFrame:
-        # Define the S&P 500 ticker
-        # Download daily prices
+        """
+        Returns the daily prices of the tickers between start and end (exclusive).\n
+        The prices are served from the local price store, only missing date ranges are downloaded from yfinance"""
         assert (ticker or tickers), "No tickers were given"
         assert (not (ticker and tickers)), "Can't give ticker and tickers to ticker_prices_daily"
         if isinstance(start, date):
@@ -90,18 +167,28 @@ class Yfinance_Query_Handler():
             end = end.strftime("%Y-%m-%d")
 
         if ticker:
-            stock_data = yf.download(ticker, start=start, end=end, interval="1d")
-        if tickers:
-            stock_data = yf.download(tickers, start=start, end=end, interval="1d")
+            tickers = [ticker]
+
+        stock_data = self.price_store.prices(tickers = list(tickers), start = start, end = end, download = self.download_prices_daily)
 
         return stock_data
 
 
-    def beta_quity(self, ticker: str, time_frame_years: int)-> float:
+    def betas(self, tickers: List[str], time_frame_years: int)-> pd.Series:
+        """
+        Calculates the beta of every ticker against the S&P500 over the last time_frame_years.\n
+        The closing prices of all tickers and the S&P500 are downloaded in one batch and aligned into one return matrix.
+        The betas are then calculated in one vectorised pass as covariance with the market divided by the market variance.\n
+        Every beta only uses the days on which both the stock and the market have a return.\n
+        Returns a series of {ticker: beta}. The beta is NaN for tickers with less than two returns.
+        """
 
         if time_frame_years <= 0:
             raise ValueError(f"The years to calculate must be positive, not {time_frame_years}")
-        
+
+        market: str = "^GSPC"
+        tickers = list(dict.fromkeys(tickers))
+
         # End = Yesterday, start = X years before yesterday
         end = datetime.now() - relativedelta(days=-1)
         start = end - relativedelta(years=time_frame_years)
@@ -110,33 +197,46 @@ class Yfinance_Query_Handler():
         end = end.strftime("%Y-%m-%d")
         start = start.strftime("%Y-%m-%d")
 
-        # get the stock data
-        stock_data = self.ticker_prices_daily(ticker = ticker, start = start, end = end)
+        prices = self.ticker_prices_daily(tickers = list(dict.fromkeys(tickers + [market])), start = start, end = end)
 
-        if stock_data.empty:
-            raise ValueError(f"No data found for the stock {ticker} between the dates {end} - {start}")
-        
-        market_data = self.sp500_prices_daily(start = start, end = end)
-
-        if market_data.empty:
+        if prices.empty or market not in prices["Close"].columns or prices["Close"][market].dropna().empty:
             raise ValueError(f"No data found for the S&P500 between the dates {end} - {start}")
-        
-        # calculate the returns (change in price)
-        stock_returns = stock_data["Close"].pct_change().dropna()
-        market_returns = market_data["Close"].pct_change().dropna()
 
-        # Align the data to make sure no data mismatches
-        aligned_data = pd.concat([stock_returns, market_returns], axis=1, join="inner")
-        aligned_data.columns = ["Stock", "Market"]
+        close_prices: pd.DataFrame = prices["Close"].reindex(columns = tickers + [market])
+
+        # Returns on the own trading days of every ticker: change against the last available price
+        previous_prices: pd.DataFrame = close_prices.ffill().shift(1)
+        returns: np.ndarray = (close_prices / previous_prices - 1).to_numpy(dtype = np.float64)
+
+        stock_returns: np.ndarray = returns[:, :len(tickers)]
+        market_returns: np.ndarray = returns[:, [len(tickers)]]
+
+        # Pairwise complete observations of every stock with the market
+        valid: np.ndarray = ~np.isnan(stock_returns) & ~np.isnan(market_returns)
+        observations: np.ndarray = valid.sum(axis = 0)
+
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            stock_means: np.ndarray = np.where(valid, stock_returns, 0).sum(axis = 0) / observations
+            market_means: np.ndarray = np.where(valid, market_returns, 0).sum(axis = 0) / observations
 
-        # calculate covariance and variance
-        covariance_matrix = np.cov(aligned_data["Stock"], aligned_data["Market"])
+            stock_deviations: np.ndarray = np.where(valid, stock_returns - stock_means, 0)
+            market_deviations: np.ndarray = np.where(valid, market_returns - market_means, 0)
+
+            covariances: np.ndarray = (stock_deviations * market_deviations).sum(axis = 0) / (observations - 1)
+            market_variances: np.ndarray = (market_deviations ** 2).sum(axis = 0) / (observations - 1)
+
+            betas: np.ndarray = covariances / market_variances
+
+        betas[observations < 2] = np.nan
+
+        return pd.Series(betas, index = tickers, name = "Beta")
+
+    def beta_quity(self, ticker: str, time_frame_years: int)-> float:
 
-        covariance = covariance_matrix[0, 1]  # Covariance between stock and market
-        market_variance = covariance_matrix[1,1]  # Variance of market returns
+        beta: float = float(self.betas(tickers = [ticker], time_frame_years = time_frame_years)[ticker])
 
-        # Calculate beta
-        beta: float = covariance / market_variance
+        if np.isnan(beta):
+            raise ValueError(f"No data found for the stock {ticker} in the last {time_frame_years} years")
 
         return beta
     
@@ -166,17 +266,78 @@ class Yfinance_Query_Handler():
         price_today = prices_snp500.iloc[-1,0]
         prices_beginning_timeframe = prices_snp500.iloc[0,0]
 
-        relative_change_prices = (price_today-prices_beginning_timeframe)/prices_beginning_timeframe
+        return annualised_return(price_start = prices_beginning_timeframe, price_end = price_today, years = time_frame_years)
 
-        annualised_change_prices = math.pow(relative_change_prices, 1/time_frame_years)
+    def load_rolling_state(self)-> Rolling_State:
+        """
+        Returns the rolling state shared by all handlers, loaded from the cache on first use"""
+        if Yfinance_Query_Handler.rolling_state is None:
+            Yfinance_Query_Handler.rolling_state = Rolling_State.load(path = os.path.join(cache_dir, "rolling_state.pkl"))
+        return Yfinance_Query_Handler.rolling_state
+
+    def update_rolling_state(self, tickers: List[str] = None)-> Rolling_State:
+        """
+        Adds the new daily bars of the tickers and of all tickers already in the rolling state.\n
+        Only the bars since the last update are read from the price store, new tickers are read over the largest window"""
+        market: str = "^GSPC"
+        state: Rolling_State = self.load_rolling_state()
+
+        tickers = list(dict.fromkeys(list(state.tickers) + (tickers or [])))
+
+        today: date = date.today()
+        start: date = state.start(tickers = tickers, as_of = today)
+        end: date = today + relativedelta(days=1)
+
+        prices: pd.DataFrame = self.ticker_prices_daily(tickers = tickers + [market], start = start, end = end)
+
+        if not prices.empty:
+            state.update(close_prices = prices["Close"], market = market)
+            state.save()
 
-        return annualised_change_prices-1
+        return state
+
+    def rolling_beta(self, ticker: str, time_frame_years: int)-> float:
+        """
+        Returns the same beta as beta_quity from the rolling state.\n
+        The state is only updated if the ticker is new or the state was not updated today"""
+        state: Rolling_State = self.load_rolling_state()
+
+        if ticker not in state.tickers or state.updated_on != date.today():
+            state = self.update_rolling_state(tickers = [ticker])
+
+        beta: float = state.beta(ticker = ticker, years = time_frame_years)
+
+        if np.isnan(beta):
+            raise ValueError(f"No data found for the stock {ticker} in the last {time_frame_years} years")
+
+        return beta
+
+    def rolling_snp500_return(self, time_frame_years: int)-> float:
+        """
+        Returns the same annualised return as snp500_return from the rolling state"""
+        state: Rolling_State = self.load_rolling_state()
+
+        if state.updated_on != date.today():
+            state = self.update_rolling_state()
+
+        return state.market_return(years = time_frame_years)
+
+    def load_treasury_curve(self)-> Treasury_Curve:
+        """
+        Returns the treasury yield curve shared by all handlers, backed by the price store"""
+        if Yfinance_Query_Handler.treasury_curve is None:
+            def prices(tickers: List[str], start: date, end: date)-> pd.DataFrame:
+                return self.price_store.prices(tickers = tickers, start = start, end = end, download = self.download_prices_daily)
+
+            Yfinance_Query_Handler.treasury_curve = Treasury_Curve(tickers = self.bond_ticker, prices = prices)
+        return Yfinance_Query_Handler.treasury_curve
 
     def us_treasury_bond_data(self, start: Union[date, str], end: Union[date, str], duration: Literal[5,10,30])->pd.DataFrame:
         """
         Returns a dataframe of the corresponding US-treasury bond prices in the date range
         Current bonds available are for duration 5, 10 and 30 years
-        If the dates are given as strings, use notation YYYY-MM-DD"""
+        If the dates are given as strings, use notation YYYY-MM-DD
+        The prices are served from the cached treasury curve"""
 
         if isinstance(start, date):
             start = start.strftime("%Y-%m-%d")
@@ -184,30 +345,21 @@ class Yfinance_Query_Handler():
         if isinstance(end, date):
             end = end.strftime("%Y-%m-%d")
 
-        try:
-            ticker = self.bond_ticker[duration]
-
-        except ValueError:
-            raise ValueError(f"No US treasury bond of duration {duration} found")
-        
-        data_bonds = yf.download(ticker, start=start, end=end)
+        data_bonds = self.load_treasury_curve().bond_prices(tenor = duration, start = start, end = end)
 
         return data_bonds
-        
-    def risk_free_rate(self)->float:
-        """
-        Calculates the risk free rate using the yield of 10 years US-treasury bills"""
-        end = datetime.now()
-        start = end - relativedelta(days = 10)
 
-        # Convert to strings in right formal
-        end = end.strftime("%Y-%m-%d")
-        start = start.strftime("%Y-%m-%d")
+    def treasury_yield(self, duration: Literal[5,10,30], day: Union[date, str] = None)-> float:
+        """
+        Returns the yield to maturity of the US-treasury bond of the duration on the day (today if None)"""
+        return self.load_treasury_curve().yield_on(day = day or date.today(), tenor = duration)
 
-        bond_data: pd.DataFrame = self.us_treasury_bond_data(duration=10, start = start, end = end)
-        last_yield: float = float(bond_data["Close"].iloc[-1, 0])
+    def risk_free_rate(self, day: Union[date, str] = None)->float:
+        """
+        Calculates the risk free rate using the yield of 10 years US-treasury bills\n
+        The rate of a past day can be given for historic valuations"""
 
-        yield_to_maturity: float = last_yield / 100
+        yield_to_maturity: float = self.treasury_yield(duration = 10, day = day)
 
         return yield_to_maturity
 
@@ -230,22 +382,27 @@ class Yfinance_Query_Handler():
         Returns the highest and lowest stock prices of the last 52 weeks
         Returns (max, min)"""
 
-        daily_prices: pd.DataFrame = self.prices_52_weeks(ticker = ticker)
+        # End = Today, start = X years before today
+        end = datetime.now()
+        start = end - relativedelta(weeks=52)
+
+        # Only the closing prices are needed, served without loading the whole prices
+        _, closes = self.close_prices(tickers = [ticker], start = start.strftime("%Y-%m-%d"), end = end.strftime("%Y-%m-%d"))
+        end_of_day_prices: np.ndarray = closes[ticker]
 
-        end_of_day_prices: pd.DataFrame = daily_prices["Close"]
+        if np.isnan(end_of_day_prices).all():
+            raise ValueError(f"No data found for the stock {ticker} in the last 52 weeks")
 
-        max_price: float = end_of_day_prices.max().iloc[0]
-        min_price: float = end_of_day_prices.min().iloc[0]
+        max_price: float = float(np.nanmax(end_of_day_prices))
+        min_price: float = float(np.nanmin(end_of_day_prices))
 
         return (max_price, min_price)
     
-    def company_name(seld, ticker: str)-> str:
+    def company_name(self, ticker: str)-> str:
         """
         Returns the official name of a company using its ticker"""
 
-        ticker_ = yf.Ticker(ticker)
-
-        company_name = ticker_.info.get("longName", None) # None is default
+        company_name = self.info(ticker).get("longName", None) # None is default
 
         return company_name
 
@@ -256,18 +413,53 @@ class Yfinance_Query_Handler():
         assert (ticker or tickers), "No tickers were given"
 
         if ticker:
-            Warning.warn(f"Yfinance function number_shares_outstanding(ticker = {ticker}) used for 1 ticker.\n Ususally used for multiple tickers", UserWarning)
+            warnings.warn(f"Yfinance function number_shares_outstanding(ticker = {ticker}) used for 1 ticker.\n Ususally used for multiple tickers", UserWarning)
             tickers = [ticker]
 
         return_dict: Dict[str, int] = {}        
+
+        self.prefetch_info(tickers)
         
         for ticker in tickers:
-            t = yf.Ticker(ticker)
-            shares_outstanding = t.info.get("sharesOutstanding")
+            shares_outstanding = self.info(ticker).get("sharesOutstanding")
             return_dict[ticker] = shares_outstanding
 
         return return_dict
 
+    def market_snapshot(self, tickers: List[str], max_age: timedelta = timedelta(minutes = 15))-> pd.DataFrame:
+        """
+        Returns the share price, shares outstanding, market cap and long name of all tickers in one dataframe.\n
+        The infos are fetched concurrently by the shared info cache. Infos younger than max_age are not fetched again.\n
+        Tickers that could not be fetched get a row of NaN and raise a warning, the other tickers are not affected.
+        """
+        tickers = list(dict.fromkeys(tickers))
+
+        infos: Dict[str, dict] = self.info_cache.prefetch(tickers, ttl = max_age)
+
+        snapshot = pd.DataFrame(index = tickers, columns = ["Share Price", "Shares outstanding", "Market Cap", "Long name"], dtype = object)
+
+        for ticker in tickers:
+            info = infos.get(ticker)
+
+            if not info:
+                warnings.warn(f"No market data of {ticker} found", UserWarning)
+                snapshot.loc[ticker] = [np.nan, np.nan, np.nan, None]
+                continue
+
+            # Outside of trading hours yfinance only returns some of the prices
+            prices = [info.get(key) for key in ["currentPrice", "regularMarketPrice", "previousClose"] if info.get(key) is not None]
+            price = prices[0] if prices else np.nan
+
+            shares_outstanding = info.get("sharesOutstanding") or np.nan
+            market_cap = info.get("marketCap") or price * shares_outstanding
+
+            snapshot.loc[ticker] = [price, shares_outstanding, market_cap, info.get("longName")]
+
+        for column in ["Share Price", "Shares outstanding", "Market Cap"]:
+            snapshot[column] = pd.to_numeric(snapshot[column], errors = "coerce")
+
+        return snapshot
+
 
 def main()->None:
     query = Yfinance_Query_Handler()